@@ -0,0 +1 @@
+# ContextCore benchmark suite
@@ -0,0 +1,142 @@
+import json
+import os
+import random
+from typing import Any, Dict, Iterator, List, Tuple
+
+# Vocabulary the synthetic records are drawn from. The tags cover every
+# role's filter in config/user_roles.yaml plus a few no role allows.
+PROJECTS = ["QuantumLeap", "Phoenix", "Atlas", "Nebula", "Orion", "Helix", "Vertex", "Aurora", "Cobalt", "Zephyr"]
+COMPONENTS = ["auth-service", "billing", "search", "gateway", "scheduler", "notifications", "analytics",
+              "profile", "checkout", "ingest", "reporting", "storage", "cache", "frontend", "mobile-app"]
+COMPONENT_TYPES = ["service", "database", "queue", "library", "frontend", "job"]
+RELATIONSHIPS = ["connects_to", "depends_on", "publishes_to", "reads_from", "owned_by", "deploys_with"]
+ACTIONS = ["Implement", "Refactor", "Document", "Migrate", "Optimize", "Design", "Test", "Review", "Fix", "Monitor"]
+SUBJECTS = ["authentication flow", "database schema", "API endpoints", "onboarding UX", "release roadmap",
+            "caching layer", "payment retries", "search ranking", "feature flags", "error budgets",
+            "dashboard widgets", "data retention policy", "mobile navigation", "pricing page", "audit logging"]
+DETAILS = ["using JWT tokens", "with OAuth2 scopes", "behind a feature flag", "for the public beta",
+           "to cut p99 latency", "before the Q3 launch", "with backward compatibility", "for enterprise customers",
+           "across all regions", "with end-to-end tests", "for the new onboarding funnel", "under the new SLA"]
+STATUSES = ["To Do", "In Progress", "In Review", "Blocked", "Done"]
+ASSIGNEES = ["alice", "bob", "carol", "dave", "erin", "frank", "grace", "heidi", "ivan", "judy"]
+TAGS = ["technical", "code", "architecture", "backend", "security", "product", "feature", "ux", "planning",
+        "public", "frontend", "ops", "internal"]
+QUERY_TEMPLATES = [
+    "What is the status of the {project} project?",
+    "How do we {action} the {subject} in {project}?",
+    "Who is working on {subject} for {project}?",
+    "Which services does {component} depend on?",
+    "Summarize the {project} {subject} plan",
+    "{action} {subject} {detail}",
+]
+
+KINDS = ("tasks", "graphiti", "documents")
+# Documents are written as JSON Lines, which the documents source streams.
+EXTENSIONS = {"tasks": ".json", "graphiti": ".json", "documents": ".jsonl"}
+
+def _sentence(rng: random.Random) -> str:
+    return f"{rng.choice(ACTIONS)} the {rng.choice(SUBJECTS)} of {rng.choice(PROJECTS)} {rng.choice(DETAILS)}."
+
+def generate_tasks(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yields `count` synthetic task records, the same ones for the same seed."""
+    rng = random.Random(f"tasks-{seed}")
+    for i in range(count):
+        project = rng.choice(PROJECTS)
+        yield {
+            "id": f"TASK-{i:07d}",
+            "project": project,
+            "title": f"{rng.choice(ACTIONS)} {rng.choice(SUBJECTS)}",
+            "description": " ".join(_sentence(rng) for _ in range(rng.randint(1, 3))),
+            "status": rng.choice(STATUSES),
+            "assignee": rng.choice(ASSIGNEES),
+            "tags": rng.sample(TAGS, rng.randint(1, 3)),
+        }
+
+def generate_connections(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yields `count` synthetic graph connection records, the same ones for the same seed."""
+    rng = random.Random(f"graphiti-{seed}")
+    for i in range(count):
+        source, target = rng.sample(COMPONENTS, 2)
+        yield {
+            "id": f"GRAPH-{i:07d}",
+            "source": {"name": f"{source}-{rng.randint(1, 50)}", "type": rng.choice(COMPONENT_TYPES)},
+            "target": {"name": f"{target}-{rng.randint(1, 50)}", "type": rng.choice(COMPONENT_TYPES)},
+            "relationship": rng.choice(RELATIONSHIPS),
+            "tags": rng.sample(TAGS, rng.randint(1, 3)),
+        }
+
+def generate_documents(count: int, seed: int = 0) -> Iterator[Dict[str, Any]]:
+    """Yields `count` synthetic documents of 1–4 chunks each, the same ones for the same seed."""
+    rng = random.Random(f"documents-{seed}")
+    for i in range(count):
+        project = rng.choice(PROJECTS)
+        yield {
+            "id": f"DOC-{i:07d}",
+            "title": f"{project} {rng.choice(SUBJECTS).title()}",
+            "chunks": [" ".join(_sentence(rng) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 4))],
+            "tags": rng.sample(TAGS, rng.randint(1, 3)),
+        }
+
+GENERATORS = {"tasks": generate_tasks, "graphiti": generate_connections, "documents": generate_documents}
+
+def generate_queries(count: int, roles: List[str], seed: int = 0) -> List[Tuple[str, str]]:
+    """
+    Returns `count` synthetic (query, role) pairs drawn from the corpus vocabulary.
+
+    Args:
+        count (int): Number of queries.
+        roles (List[str]): Roles the queries cycle through.
+        seed (int): Random seed.
+
+    Returns:
+        List[Tuple[str, str]]: The queries with their roles.
+    """
+    rng = random.Random(f"queries-{seed}")
+    queries = []
+    for i in range(count):
+        template = rng.choice(QUERY_TEMPLATES)
+        query = template.format(project=rng.choice(PROJECTS), action=rng.choice(ACTIONS).lower(),
+                                subject=rng.choice(SUBJECTS), component=rng.choice(COMPONENTS),
+                                detail=rng.choice(DETAILS))
+        queries.append((query, roles[i % len(roles)]))
+    return queries
+
+def write_records(path: str, records: Iterator[Dict[str, Any]]):
+    """
+    Writes records as a JSON list, or as JSON Lines for '.jsonl' paths,
+    one record at a time so a million records never sit in memory at once.
+    The file is written under a temporary name and then renamed.
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for record in records:
+                f.write(json.dumps(record) + "\n")
+        else:
+            f.write("[\n")
+            for i, record in enumerate(records):
+                f.write((",\n" if i else "") + json.dumps(record))
+            f.write("\n]\n")
+    os.replace(tmp_path, path)
+
+def build_corpus(data_dir: str, records: int, seed: int = 0) -> Dict[str, str]:
+    """
+    Writes a synthetic corpus of `records` tasks, graph connections and
+    documents, reusing files generated earlier with the same size and seed.
+
+    Args:
+        data_dir (str): Directory the data files are written to.
+        records (int): Records per source.
+        seed (int): Random seed.
+
+    Returns:
+        Dict[str, str]: The data file of each source ('tasks', 'graphiti', 'documents').
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    paths = {}
+    for kind in KINDS:
+        path = os.path.join(data_dir, f"{kind}-{records}-s{seed}{EXTENSIONS[kind]}")
+        if not os.path.exists(path):
+            write_records(path, GENERATORS[kind](records, seed))
+        paths[kind] = path
+    return paths
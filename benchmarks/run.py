@@ -0,0 +1,298 @@
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+import yaml
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.corpus import build_corpus, generate_queries
+from src.main_context import ContextEngineer
+
+# Pipeline stages of `ContextEngineer.build_context`, timed per query.
+STAGES = ("permissions", "retrieve", "rank", "dedupe", "token_budget", "total")
+PERCENTILES = (50, 95, 99)
+# Environment variables that would point the sources away from the synthetic corpus.
+PATH_OVERRIDES = ("CONTEXTCORE_DOCS_PATH", "CONTEXTCORE_TASKS_PATH", "CONTEXTCORE_GRAPH_PATH")
+
+def peak_rss_mb() -> Optional[float]:
+    """Returns the process's peak resident set size in MiB, or None where it is unavailable."""
+    try:
+        import resource
+    except ImportError:
+        return None # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, KiB elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def summarize(samples_ms: List[float]) -> Dict[str, float]:
+    """Returns the mean, max and p50/p95/p99 of a list of timings in milliseconds."""
+    values = np.asarray(samples_ms, dtype=np.float64)
+    summary = {f"p{p}_ms": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean_ms"] = float(values.mean())
+    summary["max_ms"] = float(values.max())
+    return summary
+
+def _timed(iterable: Iterable[Any], elapsed: List[float]) -> Iterator[Any]:
+    """Yields from `iterable`, adding the time spent producing each item to elapsed[0]."""
+    iterator = iter(iterable)
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            elapsed[0] += time.perf_counter() - start
+            return
+        elapsed[0] += time.perf_counter() - start
+        yield item
+
+def write_config(base_config_path: str, data_paths: Dict[str, str], config_dir: str) -> str:
+    """
+    Writes a copy of the base config that reads the synthetic corpus, with
+    the result cache off so every query runs the whole pipeline.
+
+    Returns:
+        str: The path of the written config.
+    """
+    with open(base_config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    config.setdefault("defaults", {})["cache_enabled"] = False
+    data_sources = config.setdefault("data_sources", {})
+    for name, source_config in data_sources.items():
+        if name in data_paths:
+            source_config.update(path=data_paths[name], type="json", enabled=True)
+        else:
+            source_config["enabled"] = False
+    path = os.path.join(config_dir, "context_config.yaml")
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(config, f)
+    return path
+
+def _run_queries(engineer: ContextEngineer, queries: List[Any], warmup: int, samples: Dict[str, List[float]],
+                 source_samples: Dict[str, List[float]], chunk_counts: List[int]):
+    """Runs the staged pipeline for each query, recording timings after the first `warmup` queries."""
+    for i, (query, role) in enumerate(queries):
+        t0 = time.perf_counter()
+        permissions = engineer.role_handler.get_permissions(role)
+        tag_mask = engineer.role_handler.get_tag_mask(role)
+        t1 = time.perf_counter()
+        retrieved = engineer.retriever.retrieve_with_status(query, permissions.get("allowed_sources", []), tag_mask)
+        t2 = time.perf_counter()
+        ranked = engineer.ranker.rank(query, retrieved["chunks"])
+        t3 = time.perf_counter()
+        dedupe_elapsed = [0.0]
+        unique = _timed(engineer.deduplicator.iter_unique(ranked), dedupe_elapsed)
+        context = engineer.budget_manager.construct_context(unique)
+        t4 = time.perf_counter()
+
+        if i == 0 and context != engineer.build_context(query, role):
+            raise RuntimeError("The staged pipeline no longer matches build_context; update benchmarks/run.py")
+        if i < warmup:
+            continue
+        for stage, seconds in (("permissions", t1 - t0), ("retrieve", t2 - t1), ("rank", t3 - t2),
+                               ("dedupe", dedupe_elapsed[0]), ("token_budget", t4 - t3 - dedupe_elapsed[0]),
+                               ("total", t4 - t0)):
+            samples[stage].append(seconds * 1000.0)
+        for name, status in retrieved["sources"].items():
+            source_samples.setdefault(name, []).append(status["elapsed_ms"])
+        chunk_counts.append(len(retrieved["chunks"]))
+
+def run_scale(records: int, seed: int, num_queries: int, warmup: int, data_dir: str,
+              config_path: str, roles_path: str) -> Dict[str, Any]:
+    """
+    Benchmarks `build_context` on a synthetic corpus of `records` records per source.
+
+    The pipeline is run stage by stage, exactly as `build_context` runs it,
+    so each stage can be timed; the first query's output is checked against
+    `build_context` itself. Deduplication and token budgeting are lazy and
+    interleaved, so their times are split by timing the deduplicator's
+    iterator.
+
+    Args:
+        records (int): Records per source (tasks, graph connections, documents).
+        seed (int): Seed of the corpus and the queries.
+        num_queries (int): Timed queries.
+        warmup (int): Untimed queries run first.
+        data_dir (str): Directory the corpus is generated into (and reused from).
+        config_path (str): Base context config.
+        roles_path (str): User roles config.
+
+    Returns:
+        Dict[str, Any]: Timings, throughput and memory for this scale.
+    """
+    for name in PATH_OVERRIDES:
+        os.environ.pop(name, None)
+
+    start = time.perf_counter()
+    data_paths = build_corpus(data_dir, records, seed)
+    generate_seconds = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        bench_config = write_config(config_path, data_paths, config_dir)
+        start = time.perf_counter()
+        engineer = ContextEngineer(bench_config, roles_path)
+        load_seconds = time.perf_counter() - start
+    rss_after_load = peak_rss_mb()
+
+    roles = sorted(engineer.roles_config.get("roles", {}))
+    queries = generate_queries(warmup + num_queries, roles, seed)
+    samples: Dict[str, List[float]] = {stage: [] for stage in STAGES}
+    source_samples: Dict[str, List[float]] = {}
+    chunk_counts = []
+
+    # The token budget logs when it fills up; keep that out of the report.
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        _run_queries(engineer, queries, warmup, samples, source_samples, chunk_counts)
+    engineer.retriever.close()
+
+    total_seconds = sum(samples["total"]) / 1000.0
+    return {
+        "records": records,
+        "generate_seconds": generate_seconds,
+        "load_seconds": load_seconds,
+        "queries": num_queries,
+        "throughput_qps": num_queries / total_seconds if total_seconds > 0 else 0.0,
+        "mean_chunks_retrieved": float(np.mean(chunk_counts)) if chunk_counts else 0.0,
+        "stages": {stage: summarize(values) for stage, values in samples.items() if values},
+        "sources": {name: summarize(values) for name, values in sorted(source_samples.items())},
+        "peak_rss_after_load_mb": rss_after_load,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+def run_benchmarks(scales: List[int], seed: int = 0, num_queries: int = 50, warmup: int = 3,
+                   data_dir: str = ".contextcore/bench", config_path: str = "config/context_config.yaml",
+                   roles_path: str = "config/user_roles.yaml", isolate: bool = True) -> Dict[str, Any]:
+    """
+    Runs `run_scale` for each corpus size.
+
+    Args:
+        scales (List[int]): Records per source for each run.
+        isolate (bool): Run each scale in a fresh process, so peak RSS and
+                        warm caches of one scale do not leak into the next.
+        Other arguments are passed to `run_scale`.
+
+    Returns:
+        Dict[str, Any]: 'meta' (environment and settings) and 'results' (one entry per scale).
+    """
+    results = []
+    for records in scales:
+        args = (records, seed, num_queries, warmup, data_dir, config_path, roles_path)
+        print(f"Benchmarking {records} records per source...", file=sys.stderr)
+        if isolate:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results.append(pool.submit(run_scale, *args).result())
+        else:
+            results.append(run_scale(*args))
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": seed,
+            "queries": num_queries,
+            "warmup": warmup,
+            "config": config_path,
+        },
+        "results": results,
+    }
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.2,
+            min_delta_ms: float = 1.0) -> List[str]:
+    """
+    Compares results with a baseline run and lists the regressions.
+
+    A stage's p50 or p95 regresses if it is more than `tolerance` (a
+    fraction) slower than the baseline and also more than `min_delta_ms`
+    slower, which keeps sub-millisecond stages from flagging noise (p99 is
+    reported but not compared; over a few dozen queries it is one sample). Load time, throughput and
+    peak RSS are compared by `tolerance` alone. Only scales present in both
+    runs are compared.
+
+    Returns:
+        List[str]: One message per regression (empty if there are none).
+    """
+    baseline_by_scale = {result["records"]: result for result in baseline.get("results", [])}
+    regressions = []
+    for result in current.get("results", []):
+        base = baseline_by_scale.get(result["records"])
+        if base is None:
+            continue
+        label = f"{result['records']} records"
+        for group in ("stages", "sources"):
+            for name, summary in result.get(group, {}).items():
+                base_summary = base.get(group, {}).get(name)
+                if not base_summary:
+                    continue
+                for metric in ("p50_ms", "p95_ms"):
+                    new, old = summary[metric], base_summary[metric]
+                    if new > old * (1 + tolerance) and new - old > min_delta_ms:
+                        regressions.append(f"{label}: {name} {metric} {old:.2f} -> {new:.2f}")
+        if result["load_seconds"] > base["load_seconds"] * (1 + tolerance) and result["load_seconds"] - base["load_seconds"] > min_delta_ms / 1000.0:
+            regressions.append(f"{label}: load_seconds {base['load_seconds']:.3f} -> {result['load_seconds']:.3f}")
+        if result["throughput_qps"] < base["throughput_qps"] / (1 + tolerance):
+            regressions.append(f"{label}: throughput_qps {base['throughput_qps']:.1f} -> {result['throughput_qps']:.1f}")
+        if result.get("peak_rss_mb") and base.get("peak_rss_mb") and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + tolerance):
+            regressions.append(f"{label}: peak_rss_mb {base['peak_rss_mb']:.1f} -> {result['peak_rss_mb']:.1f}")
+    return regressions
+
+def print_report(report: Dict[str, Any]):
+    """Prints a per-scale table of stage percentiles, throughput and memory."""
+    for result in report["results"]:
+        rss = result.get("peak_rss_mb")
+        print(f"\n=== {result['records']} records per source: load {result['load_seconds']:.2f}s, "
+              f"{result['throughput_qps']:.1f} queries/s, peak RSS {f'{rss:.0f} MiB' if rss else 'n/a'}, "
+              f"{result['mean_chunks_retrieved']:.0f} chunks retrieved per query ===")
+        print(f"{'stage':<22}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+        rows = list(result["stages"].items()) + [(f"retrieve:{name}", summary) for name, summary in result["sources"].items()]
+        for name, summary in rows:
+            print(f"{name:<22}{summary['p50_ms']:>10.2f}{summary['p95_ms']:>10.2f}{summary['p99_ms']:>10.2f}{summary['mean_ms']:>10.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ContextEngineer.build_context on synthetic corpora")
+    parser.add_argument('--records', type=int, nargs='+', default=[1000, 10000, 100000],
+                        help='Records per source for each run, e.g. 1000 10000 100000 1000000')
+    parser.add_argument('--queries', type=int, default=50, help='Timed queries per run')
+    parser.add_argument('--warmup', type=int, default=3, help='Untimed queries run first')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the corpus and the queries')
+    parser.add_argument('--data-dir', type=str, default='.contextcore/bench', help='Where corpora are generated and reused from')
+    parser.add_argument('--config', type=str, default='config/context_config.yaml', help='Base context config (data paths are replaced)')
+    parser.add_argument('--roles', type=str, default='config/user_roles.yaml', help='Path to user roles YAML')
+    parser.add_argument('--output', type=str, default=None, help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', type=str, default=None, help='Results JSON of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown as a fraction of the baseline')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore slowdowns smaller than this')
+    parser.add_argument('--in-process', action='store_true', help='Run all scales in this process (peak RSS is then cumulative)')
+    args = parser.parse_args()
+
+    report = run_benchmarks(args.records, seed=args.seed, num_queries=args.queries, warmup=args.warmup,
+                            data_dir=args.data_dir, config_path=args.config, roles_path=args.roles,
+                            isolate=not args.in_process)
+    print_report(report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, tolerance=args.tolerance, min_delta_ms=args.min_delta_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions against {args.baseline}")
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 
 import argparse
+import functools
 import sys
 import os
 import re
@@ -9,17 +10,22 @@ from src.main_context import ContextEngineer
 from src.services.openai_service import OpenAIService
 from src.services.conversation_memory import ConversationMemory
 from src.data_sources.documents import DocumentContextSource
+from src.services.context_server import ContextServer, request_server
 
 def main():
     parser = argparse.ArgumentParser(description="Intelligent Context Engineering CLI")
-    parser.add_argument('-r', '--role', type=str, required=True, help='User role (e.g., engineer, product_manager, guest)')
-    parser.add_argument('-q', '--query', type=str, required=True, help='Query string for context retrieval')
+    parser.add_argument('-r', '--role', type=str, help='User role (e.g., engineer, product_manager, guest)')
+    parser.add_argument('-q', '--query', type=str, help='Query string for context retrieval')
     parser.add_argument('--config', type=str, default='config/context_config.yaml', help='Path to context config YAML')
     parser.add_argument('--roles', type=str, default='config/user_roles.yaml', help='Path to user roles YAML')
     parser.add_argument('--docs', type=str, default=None, help='Path to a custom documents JSON or TXT file to use for this run')
     parser.add_argument('--remember-docs', action='store_true', help='Persist the provided --docs path for future runs')
     parser.add_argument('--file-only', action='store_true', help='Answer strictly from provided context; say Not found in the provided document if absent')
+    parser.add_argument('--user', type=str, default=None, help='User name for per-user conversation history (defaults to the role\'s shared history)')
     parser.add_argument('--doc-chunks', type=int, default=12, help='Max number of document chunks to include in fallback context')
+    parser.add_argument('--serve', action='store_true', help='Run a long-lived server that keeps the engine warm and answers queries')
+    parser.add_argument('--listen', type=str, default='127.0.0.1:8765', help='Server address: host:port for HTTP, or unix:/path/to.sock')
+    parser.add_argument('--server', type=str, default=None, help='Send the query to a running server at this address instead of answering locally')
     args = parser.parse_args()
 
     # Optional: override documents path via CLI flag by setting env var consumed by config loader
@@ -44,38 +50,98 @@ def main():
             with open(overrides_path, 'w') as f:
                 yaml.safe_dump(existing, f)
 
-    # Step 1: Aggregate context from all sources using ContextEngineer
+    if args.serve:
+        engineer = ContextEngineer(config_path=args.config, roles_path=args.roles)
+        # Batch the many small history appends of a busy server off the request threads
+        memory = ConversationMemory(write_behind=True)
+        openai_service = OpenAIService.from_config(engineer.config.get("llm", {}) or {})
+        server = ContextServer(engineer, answer_fn=functools.partial(answer_query, engineer, memory=memory, openai_service=openai_service),
+                               stats_fn=openai_service.cache_stats)
+        try:
+            server.serve(args.listen)
+        finally:
+            memory.close()
+            openai_service.close()
+        return
+
+    if not args.role or not args.query:
+        parser.error("the following arguments are required: -r/--role, -q/--query")
+
+    if args.server:
+        if args.docs:
+            print("Warning: --docs is ignored when querying a server; start the server with --docs instead.")
+        try:
+            response = request_server(args.server, "POST", "/query", {
+                "role": args.role,
+                "query": args.query,
+                "file_only": args.file_only,
+                "doc_chunks": args.doc_chunks,
+                **({"user": args.user} if args.user else {}),
+            })
+        except OSError as e:
+            print(f"Could not reach context server at {args.server}: {e}")
+            sys.exit(1)
+        if "error" in response:
+            print(f"Error: {response['error']}")
+            sys.exit(1)
+        print(response["result"])
+        return
+
     engineer = ContextEngineer(config_path=args.config, roles_path=args.roles)
-    context_chunks = engineer.build_context(args.query, user_role=args.role)
+    print(answer_query(engineer, args.role, args.query, file_only=args.file_only, doc_chunks=args.doc_chunks, user=args.user))
+
+def answer_query(engineer: ContextEngineer, role: str, query: str, file_only: bool = False, doc_chunks: int = 12,
+                 memory: ConversationMemory = None, openai_service: OpenAIService = None, user: str = None) -> str:
+    """
+    Answers one query for a role: builds the context, adds conversation
+    history or document fallback context, and asks the model (or answers
+    locally in file-only mode). The interaction is recorded in memory,
+    under `user` if given, whose own history is then used instead of the
+    role's. Used directly by the CLI and by each request in server mode.
+
+    Returns:
+        str: The answer, or a status message for file-management queries.
+    """
+    # Step 1: Aggregate context from all sources using ContextEngineer
+    context_chunks = engineer.build_context(query, user_role=role)
+
+    # The documents source the engineer already loaded; only built here if it is disabled there
+    loaded_docs = {}
+    def documents_source(docs_cfg):
+        if "source" not in loaded_docs:
+            loaded_docs["source"] = engineer.retriever.sources.get("documents") or DocumentContextSource(
+                dict(docs_cfg, snapshot_dir=docs_cfg.get("snapshot_dir") or engineer.retriever.snapshot_dir)
+            )
+        return loaded_docs["source"]
 
     # Management intent: handle indexing/confirmation queries without calling OpenAI
-    qlower = args.query.strip().lower()
+    qlower = query.strip().lower()
     if any(phrase in qlower for phrase in ["index my file", "index file", "load my file", "load file", "remember this file", "use this file"]):
         docs_cfg = engineer.config.get("data_sources", {}).get("documents", {}) or {}
         docs_path = docs_cfg.get("path")
         # Validate path existence and guide the user
         if not docs_path or not os.path.exists(docs_path):
-            print("Documents source not ready: remembered path is missing or invalid.")
-            print(f"Current path: {docs_path}")
-            print("Tip: run with --docs to set the correct path, e.g.:")
-            print("  python cli.py -r Guest -q \"index my file\" --docs .\\data\\my_notes.txt --remember-docs")
-            return
+            return "\n".join([
+                "Documents source not ready: remembered path is missing or invalid.",
+                f"Current path: {docs_path}",
+                "Tip: run with --docs to set the correct path, e.g.:",
+                "  python cli.py -r Guest -q \"index my file\" --docs .\\data\\my_notes.txt --remember-docs",
+            ])
         try:
-            ds = DocumentContextSource(docs_cfg)
-            doc_count = len(ds.data)
-            chunk_count = sum(len(d.get('chunks', [])) for d in ds.data)
-            print(f"Documents source ready. Path: {docs_path} | documents: {doc_count} | chunks: {chunk_count}")
-            return
+            ds = documents_source(docs_cfg)
+            docs = [d for d in ds.data if d is not None]
+            doc_count = len(docs)
+            chunk_count = sum(len(d.get('chunks', [])) for d in docs)
+            return f"Documents source ready. Path: {docs_path} | documents: {doc_count} | chunks: {chunk_count}"
         except Exception as e:
-            print(f"Failed to load documents source at {docs_path}: {e}")
-            return
+            return f"Failed to load documents source at {docs_path}: {e}"
 
 
-    memory = ConversationMemory()
-    recent_history = [item for item in memory.get_recent_history() if item['role'] == args.role]
+    memory = memory or ConversationMemory()
+    recent_history = memory.get_recent_history(role=role, user=user)
 
     # For Guest role, filter out memory entries that mention restricted/internal content
-    if args.role.lower() == "guest":
+    if role.lower() == "guest":
         restricted_keywords = [
             "quantumleap", "engineer", "database schema", "backend", "jwt", "oauth2", "refactor", "architecture"
         ]
@@ -88,12 +154,12 @@ def main():
         f"Role: {item['role']}\nQuery: {item['query']}\nResponse: {item['response']}" for item in recent_history
     ])
 
-    openai_service = OpenAIService()
+    openai_service = openai_service or OpenAIService.from_config(engineer.config.get("llm", {}) or {})
 
     # Fallback: if built context is empty/too short, or file-only mode, include document chunks
-    is_wh = any(args.query.lower().startswith(w) for w in ["who", "what", "where", "when", "why", "which", "how"])
+    is_wh = any(query.lower().startswith(w) for w in ["who", "what", "where", "when", "why", "which", "how"])
     use_fallback_docs = (
-        args.file_only or
+        file_only or
         not context_chunks or len(context_chunks.strip()) < 40 or (is_wh and len(context_chunks.strip()) < 200)
     )
     fallback_context = None
@@ -102,12 +168,12 @@ def main():
         docs_path = docs_cfg.get("path")
         if docs_path and os.path.exists(docs_path):
             try:
-                ds = DocumentContextSource(docs_cfg)
+                ds = documents_source(docs_cfg)
                 all_chunks = ds.get_all_chunks()
                 # Choose number of chunks
-                max_chunks = max(1, int(args.doc_chunks))
+                max_chunks = max(1, int(doc_chunks))
                 # For file-only or WH questions, include more chunks for better coverage
-                if args.file_only and max_chunks < 30:
+                if file_only and max_chunks < 30:
                     max_chunks = 30
                 joined = "\n".join(ch.get('content', '') for ch in all_chunks[:max_chunks])
                 if joined.strip():
@@ -117,18 +183,18 @@ def main():
 
     full_context_body = fallback_context if fallback_context is not None else context_chunks
     # In file-only mode, exclude conversation history and provide only document context
-    if args.file_only:
+    if file_only:
         full_context = f"Document Context:\n{full_context_body}"
     else:
         full_context = f"Recent Conversation History:\n{history_str}\n\nCurrent Context:\n{full_context_body}"
 
     # If Guest and query asks for 'single word', force a one-word answer
     # Local rule-based extraction for high-precision answers in file-only mode
-    if args.file_only:
-        ql = args.query.strip().lower()
+    if file_only:
+        ql = query.strip().lower()
         try:
             docs_cfg = engineer.config.get("data_sources", {}).get("documents", {}) or {}
-            ds = DocumentContextSource(docs_cfg) if docs_cfg.get("path") and os.path.exists(docs_cfg.get("path")) else None
+            ds = documents_source(docs_cfg) if docs_cfg.get("path") and os.path.exists(docs_cfg.get("path")) else None
         except Exception:
             ds = None
 
@@ -158,34 +224,37 @@ def main():
                         answer = sent.strip()
                         break
             if answer:
-                print(answer)
-                memory.add_interaction(args.role, args.query, answer)
-                return
+                memory.add_interaction(role, query, answer, user=user)
+                return answer
 
-    if args.role.lower() == "guest" and "single word" in args.query.lower():
+    if role.lower() == "guest" and "single word" in query.lower():
         result = openai_service.semantic_search(
-            args.query,
+            query,
             context=full_context,
-            file_only=args.file_only,
+            file_only=file_only,
             answer_instruction="Respond with only a single word, no explanation.",
-            max_tokens=16
+            max_tokens=16,
+            role=role,
+            context_key=full_context_body
         )
         # Post-process to ensure only a single word is output
         result = result.strip().split()[0] if result.strip() else ""
     else:
         # Tailor answer instructions for certain question types
         ans_instruction = None
-        if args.query.lower().startswith("who"):
+        if query.lower().startswith("who"):
             ans_instruction = "If the answer is a name, respond with the exact name only (no extra words)."
         result = openai_service.semantic_search(
-            args.query,
+            query,
             context=full_context,
-            file_only=args.file_only,
+            file_only=file_only,
             answer_instruction=ans_instruction,
-            max_tokens=256
+            max_tokens=256,
+            role=role,
+            context_key=full_context_body
         )
-    print(result)
-    memory.add_interaction(args.role, args.query, result)
+    memory.add_interaction(role, query, result, user=user)
+    return result
 
 if __name__ == "__main__":
     main()
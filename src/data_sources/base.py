@@ -1,5 +1,12 @@
+import asyncio
+import copy
+import functools
+import gc
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Callable, Hashable, Optional, Set, Tuple
+
+from .chunk import Chunk
+from .snapshot import IndexSnapshotStore, file_stamp
 
 class BaseContextSource(ABC):
     """
@@ -17,6 +24,10 @@ class BaseContextSource(ABC):
         """
         self.config = config
         self.source_id = "base" # Should be overridden by subclasses
+        # Identifies this version of the source's content in chunk cost keys;
+        # replaced whenever a reload produces a new version.
+        self._content_version = object()
+        self._reset_corpus_stats()
 
     @abstractmethod
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
@@ -26,6 +37,9 @@ class BaseContextSource(ABC):
         Args:
             query (str): The user's query to search for.
             **kwargs: Additional keyword arguments for source-specific retrieval.
+                      Sources with SUPPORTS_TAG_MASK accept 'tag_mask', a role's
+                      tag filter from `RoleHandler.get_tag_mask`, and skip
+                      chunks it rejects before building them.
             
         Returns:
             List[Dict[str, Any]]: A list of context chunks. Each chunk is a 
@@ -34,21 +48,329 @@ class BaseContextSource(ABC):
         """
         pass
 
-    def _format_chunk(self, id: str, content: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    # Whether `retrieve` applies the 'tag_mask' keyword itself. For other
+    # sources the retriever filters the returned chunks instead.
+    SUPPORTS_TAG_MASK = False
+
+    def _build_tag_bits(self):
+        """
+        Computes the per-record tag bitmaps used to apply 'tag_mask' (see
+        `tag_bitmap`). Runs after every load, including snapshot restores:
+        bit positions are assigned per process, so bitmaps are never persisted.
+        """
+        pass
+
+    def get_all_chunks(self) -> List[Dict[str, Any]]:
+        """
+        Returns every chunk this source can return, without filtering by query.
+        Used to build corpus-wide indexes such as the TF-IDF ranking matrix.
+        Sources that cannot enumerate their content return an empty list.
+        
+        Returns:
+            List[Dict[str, Any]]: All context chunks of the source.
+        """
+        return []
+
+    async def aretrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
+        """
+        Asynchronous counterpart of `retrieve`.
+        The default runs the synchronous `retrieve` in the event loop's
+        default executor so it does not block the loop. Sources backed by
+        an async client can override this with a native implementation.
+        
+        Args:
+            query (str): The user's query to search for.
+            **kwargs: Additional keyword arguments for source-specific retrieval.
+            
+        Returns:
+            List[Dict[str, Any]]: A list of context chunks, as from `retrieve`.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, functools.partial(self.retrieve, query, **kwargs))
+
+    def _format_chunk(self, id: str, content: Optional[str] = None, metadata: Dict[str, Any] = None,
+                      render: Optional[Callable[[], str]] = None, record_key: Optional[Hashable] = None) -> Chunk:
         """
         A helper method to ensure all returned chunks have a consistent format.
         
         Args:
             id (str): A unique identifier for the chunk within the source.
-            content (str): The actual text content of the chunk.
+            content (Optional[str]): The actual text content of the chunk.
             metadata (Dict[str, Any]): A dictionary of metadata about the chunk.
+            render (Optional[Callable[[], str]]): Builds the content on first
+                      access, instead of passing `content` (e.g. a
+                      `functools.partial` over the source record).
+            record_key (Optional[Hashable]): Identifies the record the chunk is
+                      built from, unique within the source's loaded data (e.g.
+                      its slot). Together with the content version it keys
+                      the chunk's cached token cost; ids are not used since
+                      they can be missing or repeated. None disables caching.
             
         Returns:
-            Dict[str, Any]: A consistently formatted dictionary representing the context chunk.
+            Chunk: A consistently formatted, dict-compatible context chunk
+                   with interned source, type and tags.
         """
-        return {
-            "source": self.source_id,
-            "id": f"{self.source_id}_{id}",
-            "content": content,
-            "metadata": metadata
-        }
+        return Chunk(
+            source=self.source_id,
+            id=f"{self.source_id}_{id}",
+            content=content,
+            metadata=metadata,
+            render=render,
+            cost_key=(self._content_version, record_key) if record_key is not None else None
+        )
+
+    # Attributes holding a source's parsed and indexed state, persisted in
+    # index snapshots. Sources that support snapshots list them here.
+    SNAPSHOT_ATTRS: Tuple[str, ...] = ()
+
+    # Whether a source without SNAPSHOT_ATTRS still supports `reloaded`,
+    # through an `_apply_reload` that rebuilds it from scratch.
+    SUPPORTS_RELOAD = False
+
+    def _snapshot_store(self):
+        """Returns the snapshot store configured via 'snapshot_dir', or None."""
+        snapshot_dir = self.config.get("snapshot_dir")
+        if not snapshot_dir or not self.SNAPSHOT_ATTRS:
+            return None
+        return IndexSnapshotStore(snapshot_dir, verify_hash=self.config.get("snapshot_verify_hash", False))
+
+    def _restore_snapshot(self, data_path: str) -> bool:
+        """
+        Restores the source's state from a valid index snapshot of `data_path`.
+        Also records the file's stamp for a later `_save_snapshot` and for
+        change detection by `reloaded`.
+        
+        Args:
+            data_path (str): The file the source reads.
+            
+        Returns:
+            bool: True if the state was restored and loading can be skipped.
+        """
+        self._file_stamp = file_stamp(data_path)
+        store = self._snapshot_store()
+        if store is None:
+            return False
+        state = store.load(self, data_path)
+        if state is None:
+            return False
+        self._restore_snapshot_state(state)
+        return True
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        """
+        Returns the SNAPSHOT_ATTRS to persist. Snapshots are JSON, so sources
+        whose state has dicts with non-string keys override this (and
+        `_restore_snapshot_state`) to store those dicts as key-value pairs.
+        """
+        return {attr: getattr(self, attr) for attr in self.SNAPSHOT_ATTRS}
+
+    def _restore_snapshot_state(self, state: Dict[str, Any]):
+        """Sets the SNAPSHOT_ATTRS from a state saved by `_snapshot_state`."""
+        for attr in self.SNAPSHOT_ATTRS:
+            setattr(self, attr, state[attr])
+
+    def _save_snapshot(self, data_path: str):
+        """Writes the freshly built state of `data_path` to an index snapshot, if configured."""
+        store = self._snapshot_store()
+        if store is None:
+            return
+        state = self._snapshot_state()
+        store.save(self, data_path, state, getattr(self, "_file_stamp", None))
+
+    def reloaded(self) -> Optional["BaseContextSource"]:
+        """
+        Checks whether the source's data file changed since it was loaded and,
+        if so, returns an updated copy of the source.
+        
+        The source itself is never modified: the copy shares every index
+        structure the change did not touch and rebuilds the rest, so queries
+        already running against this instance keep a consistent view until
+        the caller swaps the copy in. Sources that support reloading list
+        their state in SNAPSHOT_ATTRS or set SUPPORTS_RELOAD.
+        
+        Returns:
+            Optional[BaseContextSource]: The updated source, or None if the
+                                         file is unchanged or reloading is unsupported.
+        """
+        data_path = self.config.get("path")
+        if not data_path or not (self.SNAPSHOT_ATTRS or self.SUPPORTS_RELOAD):
+            return None
+        stamp = file_stamp(data_path)
+        if stamp == getattr(self, "_file_stamp", None):
+            return None
+        source = copy.copy(self)
+        source._file_stamp = stamp
+        source._content_version = object()
+        # Re-reading and diffing allocate many small acyclic objects; cyclic
+        # collection during that only slows the reload down.
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            source._apply_reload(data_path)
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+        source._save_snapshot(data_path)
+        return source
+
+    # An incremental reload rebuilds everything instead once the changed
+    # records, or the empty slots left by removed ones, exceed this fraction.
+    RELOAD_REBUILD_FRACTION = 0.5
+
+    def _apply_reload(self, data_path: str):
+        """
+        Brings a fresh copy made by `reloaded` up to date with `data_path`.
+        The default re-reads the file and rebuilds every index; sources with
+        stable record ids override this to apply only the changed records.
+        Implementations must replace, never mutate, containers shared with
+        the original instance.
+        """
+        self._read_data()
+        self._build_index()
+        self._build_tag_bits()
+
+    def _diff_records(self, previous: List[Any], current: List[Any]) -> Optional[Tuple[Dict[int, Any], List[Any]]]:
+        """
+        Matches freshly read records to the loaded ones by their 'id'.
+        
+        Args:
+            previous (List[Any]): The loaded records by slot; None marks the
+                                  slot of a record removed by an earlier reload.
+            current (List[Any]): The records now in the data file.
+            
+        Returns:
+            Optional[Tuple[Dict[int, Any], List[Any]]]: The slots whose record
+                changed (mapped to the new record, or None if it was removed)
+                and the new records to append; or None if a record lacks a
+                unique id, so much changed that a full rebuild is cheaper, or
+                the kept records were reordered or new ones inserted before
+                them (slot order would then differ from a fresh load's).
+        """
+        slots = {}
+        for slot, record in enumerate(previous):
+            if record is None:
+                continue
+            key = record.get("id") if isinstance(record, dict) else None
+            if not isinstance(key, (str, int)) or key in slots:
+                return None
+            slots[key] = slot
+
+        changed, appended, seen = {}, [], set()
+        last_slot = -1
+        for record in current:
+            key = record.get("id") if isinstance(record, dict) else None
+            if not isinstance(key, (str, int)) or key in seen:
+                return None
+            seen.add(key)
+            slot = slots.get(key)
+            if slot is None:
+                appended.append(record)
+                continue
+            if slot < last_slot or appended:
+                return None
+            last_slot = slot
+            if previous[slot] != record:
+                changed[slot] = record
+        for key, slot in slots.items():
+            if key not in seen:
+                changed[slot] = None
+
+        total_slots = len(previous) + len(appended)
+        if (len(changed) + len(appended) > self.RELOAD_REBUILD_FRACTION * len(current)
+                or total_slots - len(current) > self.RELOAD_REBUILD_FRACTION * total_slots):
+            return None
+        return changed, appended
+
+    def get_corpus_stats(self) -> Dict[str, Any]:
+        """
+        Returns term statistics over every chunk this source can return.
+        Corpus-aware rankers such as BM25 use these for document frequencies
+        and length normalization.
+        
+        Returns:
+            Dict[str, Any]: A dictionary with 'num_chunks', 'total_length'
+                            (summed term count) and 'doc_freqs' (term ->
+                            number of chunks containing it).
+        """
+        return self._corpus_stats
+
+    def _reset_corpus_stats(self):
+        """Clears the corpus statistics, e.g. before (re)building indexes."""
+        self._corpus_stats = {"num_chunks": 0, "total_length": 0, "doc_freqs": {}}
+
+    def _copy_corpus_stats(self):
+        """Replaces the corpus statistics with a private copy before an incremental update."""
+        self._corpus_stats = dict(self._corpus_stats, doc_freqs=dict(self._corpus_stats["doc_freqs"]))
+
+    def _add_corpus_terms(self, tokens: List[str]) -> Set[str]:
+        """
+        Records one chunk's tokens in the corpus statistics.
+        
+        Args:
+            tokens (List[str]): The chunk's lowercased, whitespace-split terms.
+            
+        Returns:
+            Set[str]: The distinct terms of the chunk, for use by source indexes.
+        """
+        terms = set(tokens)
+        stats = self._corpus_stats
+        stats["num_chunks"] += 1
+        stats["total_length"] += len(tokens)
+        doc_freqs = stats["doc_freqs"]
+        for term in terms:
+            doc_freqs[term] = doc_freqs.get(term, 0) + 1
+        return terms
+
+    def _remove_corpus_terms(self, tokens: List[str]) -> Set[str]:
+        """
+        Removes one chunk's tokens from the corpus statistics; the inverse of
+        `_add_corpus_terms`.
+        
+        Args:
+            tokens (List[str]): The chunk's lowercased, whitespace-split terms.
+            
+        Returns:
+            Set[str]: The distinct terms of the chunk.
+        """
+        terms = set(tokens)
+        stats = self._corpus_stats
+        stats["num_chunks"] -= 1
+        stats["total_length"] -= len(tokens)
+        doc_freqs = stats["doc_freqs"]
+        for term in terms:
+            df = doc_freqs.get(term, 0) - 1
+            if df > 0:
+                doc_freqs[term] = df
+            else:
+                doc_freqs.pop(term, None)
+        return terms
+
+
+def apply_postings_delta(index: Dict[Any, Any], removed: Dict[Any, Set[int]], added: Dict[Any, List[int]],
+                         make=list) -> Dict[Any, Any]:
+    """
+    Returns a copy of an inverted index with postings removed and added.
+    Untouched posting lists are shared with `index`, touched ones are
+    rebuilt once each, so `index` stays valid for concurrent readers.
+    
+    Args:
+        index (Dict[Any, Any]): Key -> sorted postings.
+        removed (Dict[Any, Set[int]]): Key -> postings to drop.
+        added (Dict[Any, List[int]]): Key -> postings to insert.
+        make: Builds a posting list from a sorted list of ints (e.g. list or
+              `functools.partial(array, 'i')`).
+              
+    Returns:
+        Dict[Any, Any]: The updated index; keys left without postings are dropped.
+    """
+    index = dict(index)
+    for key in set(removed) | set(added):
+        gone = removed.get(key, ())
+        postings = [ref for ref in index.get(key, ()) if ref not in gone]
+        postings.extend(added.get(key, ()))
+        postings.sort()
+        if postings:
+            index[key] = make(postings)
+        else:
+            index.pop(key, None)
+    return index
@@ -0,0 +1,302 @@
+# path: src/data_sources/chunk.py
+
+import sys
+import threading
+from collections.abc import MutableMapping
+from typing import Any, Callable, Dict, Hashable, Iterator, Optional, Tuple
+
+# Shared tag tuples, so chunks with the same tags point at one tuple. The
+# table stops growing at _TAG_TUPLES_MAX distinct tag sets; further sets
+# still get interned strings but are not shared.
+_TAG_TUPLES: Dict[Tuple[str, ...], Tuple[str, ...]] = {}
+_TAG_TUPLES_MAX = 65536
+
+# Bit position of every tag seen in this process. Tag bitmaps are ints over
+# this vocabulary, so they are only meaningful within one process.
+_TAG_BITS: Dict[Any, int] = {}
+_TAG_BITS_LOCK = threading.Lock()
+
+# Marks a metadata field that has not been set.
+_MISSING = object()
+
+def intern_tags(tags: Any) -> Tuple[str, ...]:
+    """
+    Returns the tags as a shared tuple of interned strings.
+
+    Args:
+        tags (Any): A list, tuple or set of tag strings (or None).
+
+    Returns:
+        Tuple[str, ...]: The interned tags, in their original order.
+    """
+    if not tags:
+        return ()
+    key = tuple(tags)
+    shared = _TAG_TUPLES.get(key)
+    if shared is None:
+        shared = tuple(sys.intern(tag) if type(tag) is str else tag for tag in key)
+        if len(_TAG_TUPLES) < _TAG_TUPLES_MAX:
+            _TAG_TUPLES[key] = shared
+    return shared
+
+
+def tag_bitmap(tags: Any) -> int:
+    """
+    Returns the tags as a bitmap over the process-wide tag vocabulary,
+    assigning the next free bit to tags not seen before.
+
+    Args:
+        tags (Any): A list, tuple or set of tags (or None).
+
+    Returns:
+        int: The bitmap; 0 if there are no tags.
+    """
+    bits = 0
+    for tag in tags or ():
+        bit = _TAG_BITS.get(tag)
+        if bit is None:
+            with _TAG_BITS_LOCK:
+                bit = _TAG_BITS.setdefault(tag, len(_TAG_BITS))
+        bits |= 1 << bit
+    return bits
+
+
+class ChunkMetadata(MutableMapping):
+    """
+    The metadata of a chunk, stored in slots instead of a per-chunk dict.
+
+    Every key the built-in sources set has a slot: 'tags' and the
+    categorical strings ('type', 'project', 'assignee', 'relationship') are
+    interned since the same few values repeat across a source, and
+    'relevance_score' is written by the ranker on every candidate. Any other
+    key lives in a small overflow dict that is only created when needed.
+    Behaves like a dict.
+    """
+
+    __slots__ = ("type", "tags", "relevance_score", "document_id", "document_title",
+                 "project", "assignee", "original_title", "relationship", "_extra")
+
+    _FIELDS = ("type", "tags", "relevance_score", "document_id", "document_title",
+               "project", "assignee", "original_title", "relationship")
+
+    _INTERNED = ("type", "project", "assignee", "relationship")
+
+    def __init__(self, metadata: Optional[Dict[str, Any]] = None, **kwargs: Any):
+        # Sources build one of these per retrieved chunk, so the slots are
+        # filled directly instead of going through __setitem__ per key.
+        extra = dict(metadata) if metadata else {}
+        if kwargs:
+            extra.update(kwargs)
+        for key in ChunkMetadata._FIELDS:
+            value = extra.pop(key, _MISSING)
+            if value is _MISSING:
+                setattr(self, key, _MISSING)
+            else:
+                self._set_field(key, value)
+        self._extra: Optional[Dict[str, Any]] = extra or None
+
+    def _set_field(self, key: str, value: Any):
+        """Stores a slotted field, interning tags and categorical strings."""
+        if key == "tags":
+            value = intern_tags(value)
+        elif type(value) is str and key in ChunkMetadata._INTERNED:
+            value = sys.intern(value)
+        setattr(self, key, value)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in ChunkMetadata._FIELDS:
+            value = getattr(self, key)
+            if value is not _MISSING:
+                return value
+        elif self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key in ChunkMetadata._FIELDS:
+            self._set_field(key, value)
+        else:
+            if self._extra is None:
+                self._extra = {}
+            self._extra[key] = value
+
+    def __delitem__(self, key: str):
+        if key in ChunkMetadata._FIELDS and getattr(self, key) is not _MISSING:
+            setattr(self, key, _MISSING)
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        for key in ChunkMetadata._FIELDS:
+            if getattr(self, key) is not _MISSING:
+                yield key
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        count = sum(1 for key in ChunkMetadata._FIELDS if getattr(self, key) is not _MISSING)
+        return count + (len(self._extra) if self._extra else 0)
+
+    def __contains__(self, key: object) -> bool:
+        if key in ChunkMetadata._FIELDS:
+            return getattr(self, key) is not _MISSING
+        return self._extra is not None and key in self._extra
+
+    def get(self, key: str, default: Any = None) -> Any:
+        # Fast path for the lookups the ranking and filtering steps make per chunk.
+        if key in ChunkMetadata._FIELDS:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def copy(self) -> "ChunkMetadata":
+        return ChunkMetadata(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a plain dict copy, e.g. for JSON serialization."""
+        metadata = dict(self)
+        if "tags" in metadata:
+            metadata["tags"] = list(metadata["tags"])
+        return metadata
+
+    def __eq__(self, other: object) -> bool:
+        # Tags compare equal to the lists plain metadata dicts carry.
+        if not isinstance(other, MutableMapping):
+            return NotImplemented
+        other = dict(other)
+        if isinstance(other.get("tags"), tuple):
+            other["tags"] = list(other["tags"])
+        return self.to_dict() == other
+
+    __hash__ = None
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+    def __reduce__(self):
+        return (ChunkMetadata, (self.to_dict(),))
+
+
+class Chunk(MutableMapping):
+    """
+    A context chunk with a fixed set of fields stored in slots.
+
+    Sources create one per retrieved item (see `BaseContextSource._format_chunk`).
+    The source name is interned and the metadata is a `ChunkMetadata`, so a
+    large corpus does not pay for a dict per chunk plus a nested dict for
+    its metadata. Chunks behave like the dicts they replace: `chunk['content']`,
+    `chunk.get('metadata', {})`, `dict(chunk)` and comparisons with dicts all
+    work. Use `to_dict` to get plain dicts for serialization.
+
+    The content can be given as a `render` callable over the source record
+    instead of a string; it is only rendered (once) when first read, so
+    candidates that are filtered, ranked out or never reach the context do
+    not allocate their display strings. `cost_key` identifies the rendered
+    content for caches such as `TokenBudgetManager`'s entry token costs.
+    """
+
+    __slots__ = ("source", "id", "_content", "_render", "metadata", "cost_key")
+
+    _FIELDS = ("source", "id", "content", "metadata")
+
+    def __init__(self, source: str, id: str, content: Optional[str] = None, metadata: Any = None,
+                 render: Optional[Callable[[], str]] = None, cost_key: Optional[Hashable] = None):
+        self.source = sys.intern(source) if type(source) is str else source
+        self.id = id
+        self._content = content
+        self._render = render if content is None else None
+        self.metadata = metadata if isinstance(metadata, ChunkMetadata) else ChunkMetadata(metadata)
+        self.cost_key = cost_key
+
+    @property
+    def content(self) -> str:
+        if self._render is not None:
+            self._content = self._render()
+            self._render = None
+        return self._content
+
+    @content.setter
+    def content(self, value: str):
+        self._content = value
+        self._render = None
+        self.cost_key = None # The new content is no longer the one the key identifies
+
+    @property
+    def is_rendered(self) -> bool:
+        """Whether the content string has been built."""
+        return self._render is None
+
+    def __getitem__(self, key: str) -> Any:
+        if key in Chunk._FIELDS:
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __setitem__(self, key: str, value: Any):
+        if key not in Chunk._FIELDS:
+            raise KeyError(f"Chunk has no field '{key}'; use its metadata for extra values.")
+        if key == "metadata" and not isinstance(value, ChunkMetadata):
+            value = ChunkMetadata(value)
+        setattr(self, key, value)
+
+    def __delitem__(self, key: str):
+        raise TypeError("Chunk fields cannot be deleted.")
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(Chunk._FIELDS)
+
+    def __len__(self) -> int:
+        return len(Chunk._FIELDS)
+
+    def __contains__(self, key: object) -> bool:
+        return key in Chunk._FIELDS
+
+    def get(self, key: str, default: Any = None) -> Any:
+        if key in Chunk._FIELDS:
+            return getattr(self, key)
+        return default
+
+    def copy(self) -> "Chunk":
+        return Chunk(self.source, self.id, self._content, self.metadata.copy(), render=self._render, cost_key=self.cost_key)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns a plain dict copy, e.g. for JSON serialization."""
+        return {
+            "source": self.source,
+            "id": self.id,
+            "content": self.content,
+            "metadata": self.metadata.to_dict()
+        }
+
+    def __repr__(self) -> str:
+        return repr(self.to_dict())
+
+    def __reduce__(self):
+        return (Chunk, (self.source, self.id, self.content, self.metadata.to_dict()))
+
+
+def chunk_tags(chunk: Any) -> Tuple[str, ...]:
+    """
+    Returns a chunk's tags without building intermediate dicts.
+
+    Args:
+        chunk (Any): A `Chunk` or a plain chunk dict.
+
+    Returns:
+        Tuple[str, ...]: The chunk's tags (empty if it has none).
+    """
+    if type(chunk) is Chunk:
+        tags = chunk.metadata.tags
+        return () if tags is _MISSING else tags
+    tags = chunk.get("metadata", {}).get("tags")
+    return tuple(tags) if tags else ()
+
+def tag_mask_allows(tag_mask: Optional[int], bits: int) -> bool:
+    """
+    Applies a role's tag filter to a chunk's tag bitmap: the chunk passes if
+    the role has no filter (None), the chunk has no tags, or they share one.
+    """
+    return tag_mask is None or not bits or bool(bits & tag_mask)
@@ -1,13 +1,17 @@
 #path: src/data_sources/documents.py
 
+import functools
 import json
 import os
-from typing import List, Dict, Any
-from .base import BaseContextSource
+from array import array
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+from .base import BaseContextSource, apply_postings_delta
+from .chunk import tag_bitmap
 
 class DocumentContextSource(BaseContextSource):
     """
-    Retrieves context from a JSON file containing documents.
+    Retrieves context from a JSON, JSON-lines (.jsonl/.ndjson) or plain text
+    file containing documents.
     """
 
     def __init__(self, config: Dict[str, Any]):
@@ -18,137 +22,412 @@ class DocumentContextSource(BaseContextSource):
             raise ValueError("Path for documents data source is not specified in config.")
         self._load_data()
 
+    SNAPSHOT_ATTRS = ("data", "_chunk_docs", "_chunk_nums", "_index", "_corpus_stats")
+
+    SUPPORTS_TAG_MASK = True
+
     def _load_data(self):
-        """Loads document data from JSON or plain text files."""
+        """
+        Loads document data and builds the term index used by `retrieve`,
+        or restores both from a valid index snapshot.
+        """
+        if not self._restore_snapshot(self.docs_path):
+            self._read_data()
+            self._build_index()
+            self._save_snapshot(self.docs_path)
+        self._build_tag_bits()
+
+    def _read_data(self):
+        """
+        Reads document data from JSON, JSON-lines or plain text files.
+
+        Files are decoded incrementally in blocks of `read_block_size`
+        characters, so loading never holds a second full copy of the file:
+        JSON-lines files are parsed one document per line, JSON arrays one
+        element at a time, and text is chunked in a single streaming pass.
+        """
         self.data = []
         if not os.path.exists(self.docs_path):
             return
+        block_size = int(self.config.get("read_block_size", 1 << 20))
 
         # If file has .txt extension or JSON parsing fails, treat as plain text
         _, ext = os.path.splitext(self.docs_path)
         ext = (ext or '').lower()
         if ext == '.txt':
-            # Try multiple encodings for robustness
-            texts = []
-            for enc in ('utf-8', 'utf-8-sig', 'latin-1'):
-                try:
-                    with open(self.docs_path, 'r', encoding=enc) as f:
-                        texts.append(f.read())
-                        break
-                except Exception:
-                    continue
-            text = next((t for t in texts if isinstance(t, str)), '')
-            # Create a single document entry; chunk later in retrieve or pre-split here
-            self.data = [{
-                'id': os.path.basename(self.docs_path),
-                'title': os.path.basename(self.docs_path),
-                'chunks': self._chunk_text(text),
-                'tags': ['public']
-            }]
+            self.data = [self._read_text_document(block_size)]
+            return
+
+        if ext in ('.jsonl', '.ndjson'):
+            self.data = list(self._iter_jsonl_documents())
             return
 
-        # Try JSON load
+        # Try JSON load, streaming the elements of a top-level array
         try:
             with open(self.docs_path, 'r', encoding='utf-8-sig') as f:
-                self.data = json.load(f)
-            if isinstance(self.data, dict) and 'documents' in self.data:
-                self.data = self.data['documents']
-        except json.JSONDecodeError:
+                documents = self._iter_json_array(f, block_size)
+                if documents is None:
+                    f.seek(0)
+                    self.data = json.load(f)
+                    if isinstance(self.data, dict) and 'documents' in self.data:
+                        self.data = self.data['documents']
+                else:
+                    self.data = [self._normalize_document(doc) for doc in documents]
+        except (json.JSONDecodeError, UnicodeDecodeError):
             # Fallback: treat file as plain text
-            # Fallback to reading as text with encoding fallbacks
-            texts = []
-            for enc in ('utf-8', 'utf-8-sig', 'latin-1'):
+            self.data = [self._read_text_document(block_size)]
+        except FileNotFoundError:
+            self.data = []
+
+    def _read_text_document(self, block_size: int) -> Dict[str, Any]:
+        """Chunks a plain text file into a single document, decoding it in blocks."""
+        chunks: List[str] = []
+        # Try multiple encodings for robustness; latin-1 decodes any byte sequence
+        for enc in ('utf-8', 'utf-8-sig', 'latin-1'):
+            try:
+                with open(self.docs_path, 'r', encoding=enc) as f:
+                    chunks = list(self._iter_text_chunks(iter(lambda: f.read(block_size), '')))
+                break
+            except (UnicodeDecodeError, OSError):
+                chunks = []
+                continue
+        return {
+            'id': os.path.basename(self.docs_path),
+            'title': os.path.basename(self.docs_path),
+            'chunks': chunks,
+            'tags': ['public']
+        }
+
+    def _iter_jsonl_documents(self) -> Iterator[Dict[str, Any]]:
+        """Yields the documents of a JSON-lines file, one line at a time."""
+        with open(self.docs_path, 'r', encoding='utf-8-sig') as f:
+            for line_number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
                 try:
-                    with open(self.docs_path, 'r', encoding=enc) as f:
-                        texts.append(f.read())
+                    doc = json.loads(line)
+                except json.JSONDecodeError as e:
+                    print(f"Warning: Skipping invalid JSON on line {line_number} of {self.docs_path}: {e}")
+                    continue
+                if isinstance(doc, dict):
+                    yield self._normalize_document(doc)
+
+    @staticmethod
+    def _iter_json_array(f, block_size: int):
+        """
+        Incrementally decodes the elements of a top-level JSON array.
+
+        Args:
+            f: A text file positioned at the start of the JSON document.
+            block_size (int): Characters read per block.
+
+        Returns:
+            An iterator over the array's elements, or None if the document
+            is not an array (the caller then falls back to `json.load`).
+            Iterating raises `json.JSONDecodeError` on malformed input.
+        """
+        decoder = json.JSONDecoder()
+        buffer = f.read(block_size)
+        pos = len(buffer) - len(buffer.lstrip())
+        if pos >= len(buffer) or buffer[pos] != '[':
+            return None
+
+        def elements():
+            nonlocal buffer, pos
+            eof = False
+            pos += 1
+            expect_value = True
+            while True:
+                # Skip whitespace, reading more when the buffer runs out
+                while True:
+                    while pos < len(buffer) and buffer[pos] in ' \t\r\n':
+                        pos += 1
+                    if pos < len(buffer) or eof:
                         break
-                except Exception:
+                    buffer, pos = f.read(block_size), 0
+                    eof = not buffer
+                if pos >= len(buffer):
+                    raise json.JSONDecodeError("Unterminated array", buffer, pos)
+                if buffer[pos] == ']' and expect_value is not None:
+                    return
+                if expect_value is False:
+                    if buffer[pos] != ',':
+                        raise json.JSONDecodeError("Expecting ',' delimiter", buffer, pos)
+                    pos += 1
+                    expect_value = None # A value must follow a comma
                     continue
-            text = next((t for t in texts if isinstance(t, str)), '')
-            self.data = [{
-                'id': os.path.basename(self.docs_path),
-                'title': os.path.basename(self.docs_path),
-                'chunks': self._chunk_text(text),
-                'tags': ['public']
-            }]
-        except FileNotFoundError:
-            self.data = []
+                while True:
+                    try:
+                        value, end = decoder.raw_decode(buffer, pos)
+                        # A value touching the end of the buffer may be cut short
+                        if end < len(buffer) or eof:
+                            break
+                    except json.JSONDecodeError:
+                        if eof:
+                            raise
+                    # Grow reads with the pending value so long values stay linear
+                    more = f.read(max(block_size, len(buffer) - pos))
+                    eof = not more
+                    buffer, pos = buffer[pos:] + more, 0
+                pos = end
+                expect_value = False
+                yield value
+
+        return elements()
+
+    def _normalize_document(self, doc: Dict[str, Any]) -> Dict[str, Any]:
+        """Chunks a document that carries raw 'text' instead of pre-split 'chunks'."""
+        if isinstance(doc, dict) and 'chunks' not in doc and isinstance(doc.get('text'), str):
+            doc = dict(doc)
+            doc['chunks'] = self._chunk_text(doc.pop('text'))
+        return doc
+
+    def _build_index(self):
+        """
+        Builds an inverted index mapping each lowercased term of a chunk's
+        title and content to the chunks that contain it.
+
+        Chunks are numbered in document order, so posting lists are sorted
+        and merged results come back in the same order as a full scan.
+        """
+        # Chunk ref -> (document index, chunk number), and postings, as compact
+        # int arrays: less memory, and they are stored as raw buffers in snapshots.
+        self._chunk_docs = array('i')
+        self._chunk_nums = array('i')
+        self._index: Dict[str, array] = {}
+        self._reset_corpus_stats()
+        for doc_idx, doc in enumerate(self.data):
+            doc_title = doc.get('title', '')
+            for i, chunk_content in enumerate(doc.get('chunks', []) or []):
+                ref = len(self._chunk_docs)
+                self._chunk_docs.append(doc_idx)
+                self._chunk_nums.append(i)
+                for term in self._add_chunk_terms(doc_title, chunk_content):
+                    postings = self._index.get(term)
+                    if postings is None:
+                        postings = self._index[term] = array('i')
+                    postings.append(ref)
+
+    def _build_tag_bits(self):
+        """Computes each document's tag bitmap, shared by all of its chunks."""
+        self._doc_tag_bits = [tag_bitmap(doc.get("tags")) if doc is not None else 0 for doc in self.data]
+
+    def _apply_reload(self, data_path: str):
+        """
+        Applies the documents added, changed or removed since the last load,
+        matched by document id. The chunks of a changed or removed document
+        are unlinked from the index (their refs point at document -1) and
+        the new chunks are appended, so only their postings are rebuilt.
+        A changed document keeps its position; a removed one leaves None.
+        Everything is rebuilt instead once unlinked refs would make up more
+        than RELOAD_REBUILD_FRACTION of all refs.
+        """
+        previous = self.data
+        self._read_data()
+        delta = self._diff_records(previous, self.data)
+        if delta is not None:
+            changed, appended = delta
+            unlinked = sum(len(previous[doc_idx].get('chunks', []) or []) for doc_idx in changed if doc_idx < len(previous))
+            new_refs = sum(len(doc.get('chunks', []) or []) for doc in changed.values() if doc is not None)
+            new_refs += sum(len(doc.get('chunks', []) or []) for doc in appended)
+            dead_refs = self._chunk_docs.count(-1) + unlinked
+            if dead_refs > self.RELOAD_REBUILD_FRACTION * (len(self._chunk_docs) + new_refs):
+                delta = None
+        if delta is None:
+            self._build_index()
+            self._build_tag_bits()
+            return
+
+        data = list(previous)
+        doc_tag_bits = list(self._doc_tag_bits)
+        for doc in appended:
+            changed[len(data)] = doc
+            data.append(None)
+            doc_tag_bits.append(0)
+        chunk_docs = array('i', self._chunk_docs)
+        chunk_nums = array('i', self._chunk_nums)
+        self._copy_corpus_stats()
+        removed, added = {}, {}
+        if any(doc_idx < len(previous) for doc_idx in changed):
+            for ref, doc_idx in enumerate(chunk_docs):
+                if doc_idx in changed and doc_idx < len(previous):
+                    doc = previous[doc_idx]
+                    for term in self._remove_chunk_terms(doc.get('title', ''), doc['chunks'][chunk_nums[ref]]):
+                        removed.setdefault(term, set()).add(ref)
+                    chunk_docs[ref] = -1
+        for doc_idx in sorted(changed):
+            doc = data[doc_idx] = changed[doc_idx]
+            doc_tag_bits[doc_idx] = tag_bitmap(doc.get("tags")) if doc is not None else 0
+            if doc is None:
+                continue
+            doc_title = doc.get('title', '')
+            for i, chunk_content in enumerate(doc.get('chunks', []) or []):
+                ref = len(chunk_docs)
+                chunk_docs.append(doc_idx)
+                chunk_nums.append(i)
+                for term in self._add_chunk_terms(doc_title, chunk_content):
+                    added.setdefault(term, []).append(ref)
+
+        self.data, self._chunk_docs, self._chunk_nums = data, chunk_docs, chunk_nums
+        self._doc_tag_bits = doc_tag_bits
+        self._index = apply_postings_delta(self._index, removed, added, make=lambda refs: array('i', refs))
+
+    def _add_chunk_terms(self, doc_title: str, chunk_content: str) -> Set[str]:
+        """
+        Records a chunk in the corpus statistics and returns the terms it is
+        indexed under. The statistics are taken over the rendered content,
+        the text BM25 scores; the index covers the title and chunk text.
+        """
+        self._add_corpus_terms(self._render_content(doc_title, chunk_content).lower().split())
+        return set(f"{doc_title} {chunk_content}".lower().split())
+
+    def _remove_chunk_terms(self, doc_title: str, chunk_content: str) -> Set[str]:
+        """Removes a chunk from the corpus statistics; the inverse of `_add_chunk_terms`."""
+        self._remove_corpus_terms(self._render_content(doc_title, chunk_content).lower().split())
+        return set(f"{doc_title} {chunk_content}".lower().split())
+
+    def _make_chunk(self, doc_idx: int, i: int, **extra_metadata) -> Dict[str, Any]:
+        """Formats chunk `i` of the document at position `doc_idx` as a context chunk."""
+        doc = self.data[doc_idx]
+        doc_title = doc.get('title', '')
+        metadata = {
+            "type": "document_chunk",
+            "document_id": doc.get("id"),
+            "document_title": doc_title,
+            "tags": doc.get("tags", []),
+        }
+        metadata.update(extra_metadata)
+        return self._format_chunk(
+            id=f"{doc.get('id')}_chunk{i}",
+            metadata=metadata,
+            render=functools.partial(self._render_content, doc_title, doc['chunks'][i]),
+            record_key=(doc_idx, i)
+        )
+
+    @staticmethod
+    def _render_content(doc_title: str, chunk_text: str) -> str:
+        """Renders a document chunk as it appears in context."""
+        return f"From Document '{doc_title}': {chunk_text}"
 
     def _chunk_text(self, text: str, max_chars: int = 800) -> List[str]:
         """Naive chunking by paragraphs/sentences into ~max_chars chunks."""
         if not isinstance(text, str) or not text.strip():
             return []
-        # Split on double newlines first, then fallback to single newline; then by sentences.
-        parts = [p.strip() for p in text.replace('\r\n', '\n').split('\n\n') if p.strip()]
-        if not parts:
-            parts = [p.strip() for p in text.split('\n') if p.strip()]
-        if not parts:
-            parts = [text.strip()]
+        return list(self._iter_text_chunks([text.replace('\r\n', '\n')], max_chars))
 
-        chunks: List[str] = []
-        buf = ''
-        for p in parts:
-            # Further split paragraphs by sentences to keep chunks more balanced
-            sentences = [s.strip() for s in p.replace('! ', '!\n').replace('? ', '?\n').replace('. ', '.\n').split('\n') if s.strip()]
-            for s in sentences:
-                if len(buf) + len(s) + 1 <= max_chars:
-                    buf = (buf + ' ' + s).strip() if buf else s
-                else:
-                    if buf:
-                        chunks.append(buf)
-                    buf = s
-        if buf:
-            chunks.append(buf)
-        return chunks
+    @staticmethod
+    def _cut_sentence(sentence: str, max_chars: int) -> Tuple[str, str]:
+        """
+        Splits a stripped sentence longer than `max_chars` at its last space
+        within that length (or hard at it), returning the head and the rest.
+        """
+        space = sentence.rfind(' ', 0, max_chars + 1)
+        if space > 0:
+            return sentence[:space].rstrip(), sentence[space + 1:].lstrip()
+        return sentence[:max_chars], sentence[max_chars:].lstrip()
+
+    @classmethod
+    def _split_sentences(cls, text: str, max_chars: Optional[int] = None) -> Iterator[str]:
+        """Yields the stripped, non-empty sentences of text that ends at a boundary."""
+        for line in text.replace('! ', '!\n').replace('? ', '?\n').replace('. ', '.\n').split('\n'):
+            line = line.strip()
+            while max_chars and len(line) > max_chars:
+                piece, line = cls._cut_sentence(line, max_chars)
+                yield piece
+            if line:
+                yield line
+
+    @classmethod
+    def _iter_sentences(cls, blocks: Iterable[str], max_chars: Optional[int] = None) -> Iterator[str]:
+        """
+        Splits streamed text into stripped, non-empty sentences: lines, further
+        split after '. ', '! ' and '? ', with sentences longer than `max_chars`
+        cut at a space. Each block is cut after its last complete boundary and
+        the remainder carried into the next. Only the new block is searched
+        for a boundary, and a carry longer than `max_chars` is cut as soon as
+        it gets there, so every character is scanned a bounded number of times.
+        """
+        carry = ''
+        for block in blocks:
+            # A boundary can straddle the carry's last character and the block.
+            start = max(0, len(carry) - 1)
+            text = carry + block
+            cut = max(text.rfind('\n', start), text.rfind('. ', start), text.rfind('! ', start), text.rfind('? ', start))
+            if cut >= 0:
+                # Keep the boundary's trailing space with the processed part
+                cut += 1 if text[cut] == '\n' else 2
+                yield from cls._split_sentences(text[:cut], max_chars)
+                text = text[cut:]
+            # What is left is the start of one sentence.
+            text = text.lstrip()
+            while max_chars and len(text.rstrip()) > max_chars:
+                piece, text = cls._cut_sentence(text, max_chars)
+                yield piece
+            carry = text
+        yield from cls._split_sentences(carry, max_chars)
+
+    @classmethod
+    def _iter_text_chunks(cls, blocks: Iterable[str], max_chars: int = 800) -> Iterator[str]:
+        """
+        Packs the sentences of streamed text greedily into chunks of at most
+        `max_chars` characters (longer sentences are cut at a space).
+
+        Args:
+            blocks (Iterable[str]): The text, in consecutive pieces.
+            max_chars (int): Target maximum chunk length.
+
+        Yields:
+            str: Chunks in text order.
+        """
+        parts: List[str] = []
+        length = 0
+        for sentence in cls._iter_sentences(blocks, max_chars):
+            if length + len(sentence) + 1 <= max_chars:
+                length += len(sentence) + (1 if parts else 0)
+                parts.append(sentence)
+            else:
+                if parts:
+                    yield ' '.join(parts)
+                parts = [sentence]
+                length = len(sentence)
+        if parts:
+            yield ' '.join(parts)
 
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
         """
         Retrieves document chunks where content or title matches the query.
+        Matching chunks are looked up in the inverted index built at load time.
+        'tag_mask' skips chunks of documents a role may not see.
         """
-        query_terms = set(query.lower().split())
-        relevant_chunks = []
+        tag_mask = kwargs.get("tag_mask")
+        doc_tag_bits = self._doc_tag_bits
+        matched_refs = set()
+        for term in set(query.lower().split()):
+            matched_refs.update(self._index.get(term, ()))
 
-        for doc in self.data:
-            doc_title = doc.get('title', '')
-            for i, chunk_content in enumerate(doc.get('chunks', [])):
-                content_to_search = f"{doc_title} {chunk_content}"
-                content_terms = set(content_to_search.lower().split())
-
-                if query_terms.intersection(content_terms):
-                    chunk_id = f"{doc.get('id')}_chunk{i}"
-                    content = f"From Document '{doc_title}': {chunk_content}"
-                    metadata = {
-                        "type": "document_chunk",
-                        "document_id": doc.get("id"),
-                        "document_title": doc_title,
-                        "tags": doc.get("tags", []),
-                    }
-                    formatted_chunk = self._format_chunk(
-                        id=chunk_id,
-                        content=content,
-                        metadata=metadata
-                    )
-                    relevant_chunks.append(formatted_chunk)
+        # Refs of documents changed by a reload are appended out of place, so
+        # order by position in the data, as a fresh load numbers them.
+        chunk_docs, chunk_nums = self._chunk_docs, self._chunk_nums
+        relevant_chunks = []
+        for ref in sorted(matched_refs, key=lambda ref: (chunk_docs[ref], chunk_nums[ref])):
+            doc_idx, i = chunk_docs[ref], chunk_nums[ref]
+            if tag_mask is not None and doc_tag_bits[doc_idx] and not doc_tag_bits[doc_idx] & tag_mask:
+                continue
+            relevant_chunks.append(self._make_chunk(doc_idx, i))
 
         # If no matches found, return up to first 3 chunks as a fallback to indicate data is loaded
-        if not relevant_chunks:
+        if not matched_refs:
             preview = []
-            for doc in self.data:
-                doc_title = doc.get('title', '')
-                for i, chunk_content in enumerate(doc.get('chunks', [])[:3]):
-                    chunk_id = f"{doc.get('id')}_chunk{i}"
-                    content = f"From Document '{doc_title}': {chunk_content}"
-                    metadata = {
-                        "type": "document_chunk",
-                        "document_id": doc.get("id"),
-                        "document_title": doc_title,
-                        "tags": doc.get("tags", []),
-                        "note": "fallback_preview"
-                    }
-                    preview.append(self._format_chunk(id=chunk_id, content=content, metadata=metadata))
-                    if len(preview) >= 3:
-                        break
-                if len(preview) >= 3:
+            previewed = 0
+            for doc_idx, doc in enumerate(self.data):
+                if doc is None:
+                    continue
+                allowed = tag_mask is None or not doc_tag_bits[doc_idx] or doc_tag_bits[doc_idx] & tag_mask
+                for i in range(min(3 - previewed, len(doc.get('chunks', []) or []))):
+                    previewed += 1
+                    if allowed:
+                        preview.append(self._make_chunk(doc_idx, i, note="fallback_preview"))
+                if previewed >= 3:
                     break
             return preview
 
@@ -156,25 +435,26 @@ class DocumentContextSource(BaseContextSource):
 
     def get_all_chunks(self) -> List[Dict[str, Any]]:
         """Return all document chunks without filtering by query."""
-        all_chunks: List[Dict[str, Any]] = []
+        return [
+            self._make_chunk(doc_idx, i)
+            for doc_idx, doc in enumerate(self.data) if doc is not None
+            for i in range(len(doc.get('chunks', []) or []))
+        ]
+
+    def iter_chunk_records(self) -> Iterator[Tuple[Dict[str, Any], int, str]]:
+        """Yields (document, chunk index, chunk text) for every chunk in load order."""
         for doc in self.data:
-            doc_title = doc.get('title', '')
+            if doc is None:
+                continue # Slot of a document removed by a reload
             for i, chunk_content in enumerate(doc.get('chunks', []) or []):
-                chunk_id = f"{doc.get('id')}_chunk{i}"
-                content = f"From Document '{doc_title}': {chunk_content}"
-                metadata = {
-                    "type": "document_chunk",
-                    "document_id": doc.get("id"),
-                    "document_title": doc_title,
-                    "tags": doc.get("tags", []),
-                }
-                all_chunks.append(self._format_chunk(id=chunk_id, content=content, metadata=metadata))
-        return all_chunks
+                yield doc, i, chunk_content
 
     def get_raw_text(self) -> str:
         """Concatenate all chunk texts into a single string for simple local extraction."""
         parts: List[str] = []
         for doc in self.data:
+            if doc is None:
+                continue
             for chunk_content in (doc.get('chunks', []) or []):
                 if isinstance(chunk_content, str):
                     parts.append(chunk_content)
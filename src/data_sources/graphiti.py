@@ -1,8 +1,10 @@
 # path: src/data_sources/graphiti.py
 
+import functools
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set
 from .base import BaseContextSource
+from .chunk import tag_bitmap
 
 class GraphitiContextSource(BaseContextSource):
     """
@@ -18,8 +20,30 @@ class GraphitiContextSource(BaseContextSource):
             raise ValueError("Path for graphiti data source is not specified in config.")
         self._load_data()
 
+    # Names are indexed by all of their n-grams up to this length.
+    NGRAM_SIZE = 3
+
+    SNAPSHOT_ATTRS = ("data", "_names", "_name_connections", "_ngram_index", "_corpus_stats")
+
+    SUPPORTS_TAG_MASK = True
+
     def _load_data(self):
-        """Loads graph data from the JSON file."""
+        """
+        Loads graph data from the JSON file and builds the entity-name index,
+        or restores both from a valid index snapshot.
+        """
+        if not self._restore_snapshot(self.graph_path):
+            self._read_data()
+            self._build_index()
+            self._save_snapshot(self.graph_path)
+        self._build_tag_bits()
+
+    def _build_tag_bits(self):
+        """Computes each connection's tag bitmap."""
+        self._tag_bits = [tag_bitmap(connection.get("tags")) for connection in self.data]
+
+    def _read_data(self):
+        """Reads the graph connections from the JSON file."""
         try:
             with open(self.graph_path, 'r', encoding='utf-8-sig') as f:
                 self.data = json.load(f)
@@ -31,34 +55,110 @@ class GraphitiContextSource(BaseContextSource):
         except json.JSONDecodeError as e:
             self.data = []
 
+    def _build_index(self):
+        """
+        Builds an n-gram index over the distinct lowercased entity names.
+
+        Every n-gram of length 1..NGRAM_SIZE of a name points at that name,
+        and every name points at the connections it appears in as source or
+        target. Short query terms are answered straight from the n-gram map;
+        longer ones intersect the postings of their n-grams and verify the
+        few surviving names with a substring check.
+        """
+        self._names: List[str] = []
+        self._name_connections: List[List[int]] = []
+        self._ngram_index: Dict[str, Set[int]] = {}
+        name_ids: Dict[str, int] = {}
+        self._reset_corpus_stats()
+
+        for conn_idx, connection in enumerate(self.data):
+            self._add_corpus_terms(self._format_content(connection).lower().split())
+            endpoint_names = {
+                connection.get("source", {}).get("name", "").lower(),
+                connection.get("target", {}).get("name", "").lower(),
+            }
+            for name in endpoint_names:
+                name_id = name_ids.get(name)
+                if name_id is None:
+                    name_id = name_ids[name] = len(self._names)
+                    self._names.append(name)
+                    self._name_connections.append([])
+                    for n in range(1, self.NGRAM_SIZE + 1):
+                        for i in range(len(name) - n + 1):
+                            self._ngram_index.setdefault(name[i:i + n], set()).add(name_id)
+                self._name_connections[name_id].append(conn_idx)
+
+    def _names_containing(self, term: str) -> Set[int]:
+        """Returns the ids of indexed names that contain `term` as a substring."""
+        if len(term) <= self.NGRAM_SIZE:
+            return self._ngram_index.get(term, set())
+
+        n = self.NGRAM_SIZE
+        postings = sorted(
+            (self._ngram_index.get(term[i:i + n], set()) for i in range(len(term) - n + 1)),
+            key=len
+        )
+        candidates = set(postings[0])
+        for posting in postings[1:]:
+            if not candidates:
+                break
+            candidates &= posting
+        return {name_id for name_id in candidates if term in self._names[name_id]}
+
+    def _format_content(self, connection: Dict[str, Any]) -> str:
+        """Renders a connection as a readable sentence."""
+        return (
+            f"Knowledge Graph Connection: "
+            f"Entity '{connection.get('source', {}).get('name')}' ({connection.get('source', {}).get('type')}) "
+            f"is '{connection.get('relationship')}' "
+            f"Entity '{connection.get('target', {}).get('name')}' ({connection.get('target', {}).get('type')})."
+        )
+
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
         """
         Retrieves graph connections where a node's name matches the query.
+
+        A connection matches if the whole query or any query term is a
+        substring of either endpoint's name. When the query has at least one
+        term the whole-query test is implied by the per-term test, so only
+        the terms are looked up in the name index. 'tag_mask' skips
+        connections a role may not see.
         """
         query_lower = query.lower()
-        relevant_chunks = []
-
-        for connection in self.data:
-            source_name = connection.get("source", {}).get("name", "").lower()
-            target_name = connection.get("target", {}).get("name", "").lower()
-
-            if query_lower in source_name or query_lower in target_name or any(term in source_name or term in target_name for term in query.lower().split()):
-                content = (
-                    f"Knowledge Graph Connection: "
-                    f"Entity '{connection.get('source', {}).get('name')}' ({connection.get('source', {}).get('type')}) "
-                    f"is '{connection.get('relationship')}' "
-                    f"Entity '{connection.get('target', {}).get('name')}' ({connection.get('target', {}).get('type')})."
-                )
-                metadata = {
-                    "type": "graph_connection",
-                    "relationship": connection.get("relationship"),
-                    "tags": connection.get("tags", []),
-                }
-                formatted_chunk = self._format_chunk(
-                    id=connection.get("id"),
-                    content=content,
-                    metadata=metadata
-                )
-                relevant_chunks.append(formatted_chunk)
-
-        return relevant_chunks
+        query_terms = set(query_lower.split())
+
+        if query_terms:
+            matched_names = set()
+            for term in query_terms:
+                matched_names |= self._names_containing(term)
+        else:
+            matched_names = {name_id for name_id, name in enumerate(self._names) if query_lower in name}
+
+        matched_connections = set()
+        for name_id in matched_names:
+            matched_connections.update(self._name_connections[name_id])
+
+        tag_mask = kwargs.get("tag_mask")
+        if tag_mask is not None:
+            tag_bits = self._tag_bits
+            matched_connections = [idx for idx in matched_connections if not tag_bits[idx] or tag_bits[idx] & tag_mask]
+        return [self._make_chunk(conn_idx) for conn_idx in sorted(matched_connections)]
+
+    def _make_chunk(self, conn_idx: int) -> Dict[str, Any]:
+        """Formats the graph connection at position `conn_idx` as a context chunk."""
+        connection = self.data[conn_idx]
+        metadata = {
+            "type": "graph_connection",
+            "relationship": connection.get("relationship"),
+            "tags": connection.get("tags", []),
+        }
+        return self._format_chunk(
+            id=connection.get("id"),
+            metadata=metadata,
+            render=functools.partial(self._format_content, connection),
+            record_key=conn_idx
+        )
+
+    def get_all_chunks(self) -> List[Dict[str, Any]]:
+        """Return all graph connections as chunks without filtering by query."""
+        return [self._make_chunk(conn_idx) for conn_idx in range(len(self.data))]
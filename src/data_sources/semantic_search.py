@@ -1,33 +1,214 @@
-# This file is a placeholder for a future, more advanced implementation.
-# For example, this could integrate with a vector database using a library
-# like FAISS, ChromaDB, or a managed service.
+# path: src/data_sources/semantic_search.py
+
+import functools
+import json
+import os
+import tempfile
+from typing import List, Dict, Any, Optional
+
+import numpy as np
 
-from typing import List, Dict, Any
 from .base import BaseContextSource
+from .chunk import tag_bitmap
+from .documents import DocumentContextSource
+from .snapshot import file_stamp
+from ..retrieval.vector_index import VectorIndex
+from ..utils.embeddings import load_embedder
 
 class SemanticSearchSource(BaseContextSource):
     """
-    A placeholder for a semantic search (RAG) context source.
-    In a real implementation, this would involve:
-    1. An indexing pipeline to chunk, embed, and store documents.
-    2. A retrieval pipeline to embed a query and find similar vectors.
+    Retrieves document chunks by embedding similarity instead of keyword overlap.
+
+    Documents are loaded and chunked exactly like `DocumentContextSource`.
+    Every chunk is embedded once with a pluggable, offline embedder and the
+    vectors are kept in a contiguous float32 matrix. When `index_path` is
+    configured, the matrix is written as an `.npy` file and memory-mapped
+    on later loads until the documents or embedder settings change.
+    Queries are answered by exact brute-force top-k (`index_type: flat`) or,
+    for very large corpora, through an IVF coarse quantizer (`index_type: ivf`).
     """
 
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], embedder=None):
+        """
+        Args:
+            config (Dict[str, Any]): Source configuration. Besides 'path' it accepts
+                'index_path', 'embedder', 'dim', 'top_k', 'min_score',
+                'index_type' ('flat', 'ivf' or 'auto'), 'ivf_threshold',
+                'nlist', 'nprobe' and 'batch_size'.
+            embedder: An embedder instance to use instead of the configured one.
+        """
         super().__init__(config)
         self.source_id = "semantic_search"
-        print("NOTE: SemanticSearchSource is a placeholder and not fully implemented.")
-        # self.vector_db_client = initialize_vector_db()
+        self.docs_path = config.get("path")
+        if not self.docs_path:
+            raise ValueError("Path for semantic_search data source is not specified in config.")
+        self.index_path = config.get("index_path")
+        self.top_k = config.get("top_k", 5)
+        self.min_score = config.get("min_score", 0.0)
+        self.embedder = embedder or load_embedder(config.get("embedder", "hashing"), dim=config.get("dim", 256))
+        self._load_data()
+
+    def _load_data(self):
+        """Loads and chunks the documents, then loads or builds the vector index."""
+        self._file_stamp = file_stamp(self.docs_path)
+        self._documents = DocumentContextSource({
+            "path": self.docs_path,
+            "snapshot_dir": self.config.get("snapshot_dir"),
+            "snapshot_verify_hash": self.config.get("snapshot_verify_hash", False)
+        })
+        self._records = list(self._documents.iter_chunk_records())
+        self._build_tag_bits()
+
+        self._reset_corpus_stats()
+        for doc, i, chunk_text in self._records:
+            self._add_corpus_terms(self._render(doc, chunk_text).lower().split())
+
+        vectors = self._load_vectors()
+        if vectors is None:
+            vectors = self._build_vectors()
+        self.index = VectorIndex(vectors, nprobe=self.config.get("nprobe", 8))
+
+        if self._use_ivf(len(self._records)):
+            ivf_path = f"{self.index_path}.ivf.npz" if self.index_path else None
+            if not (ivf_path and self.index.load_ivf(ivf_path)):
+                nlist = self.config.get("nlist") or max(1, int(np.sqrt(len(self._records))))
+                self.index.train_ivf(nlist)
+                if ivf_path:
+                    self.index.save_ivf(ivf_path)
+
+    SUPPORTS_TAG_MASK = True
+
+    # The embedding matrix has no per-record structure to patch, so a changed
+    # documents file is reloaded by rebuilding the source.
+    SUPPORTS_RELOAD = True
+
+    def _apply_reload(self, data_path: str):
+        """Rebuilds the chunks, tag bitmaps and vector index from the changed documents file."""
+        self._load_data()
+
+    def _build_tag_bits(self):
+        """Computes the tag bitmap of each indexed chunk (its document's tags)."""
+        self._tag_bits = [tag_bitmap(doc.get("tags")) for doc, _, _ in self._records]
+
+    def _use_ivf(self, num_chunks: int) -> bool:
+        """Decides whether to build a coarse quantizer for this corpus size."""
+        index_type = self.config.get("index_type", "auto")
+        if index_type == "auto":
+            return num_chunks >= self.config.get("ivf_threshold", 1000000)
+        return index_type == "ivf"
+
+    def _index_stamp(self) -> Dict[str, Any]:
+        """Describes the inputs a persisted index was built from."""
+        st = os.stat(self.docs_path) if os.path.exists(self.docs_path) else None
+        return {
+            "docs_path": os.path.abspath(self.docs_path),
+            "docs_size": st.st_size if st else None,
+            "docs_mtime_ns": st.st_mtime_ns if st else None,
+            "embedder": self.embedder.fingerprint,
+            "num_chunks": len(self._records),
+        }
+
+    def _load_vectors(self) -> Optional[np.ndarray]:
+        """Memory-maps a persisted embedding matrix if it matches the current inputs."""
+        if not self.index_path:
+            return None
+        meta_path = f"{self.index_path}.meta.json"
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                if json.load(f) != self._index_stamp():
+                    return None
+            vectors = np.load(self.index_path, mmap_mode='r')
+        except (FileNotFoundError, ValueError, json.JSONDecodeError):
+            return None
+        if vectors.shape != (len(self._records), self.embedder.dim) or vectors.dtype != np.float32:
+            return None
+        return vectors
+
+    def _build_vectors(self) -> np.ndarray:
+        """
+        Embeds every chunk in batches into a float32 matrix, written straight
+        to a memory-mapped `.npy` file when `index_path` is configured. The
+        file is built beside the index and then moved into place, so a source
+        still mapping the previous index (e.g. before a reload) is unaffected.
+        """
+        shape = (len(self._records), self.embedder.dim)
+        if self.index_path:
+            directory = os.path.dirname(os.path.abspath(self.index_path))
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".npy.tmp")
+            os.close(fd)
+            vectors = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float32, shape=shape)
+        else:
+            vectors = np.empty(shape, dtype=np.float32)
+
+        batch_size = self.config.get("batch_size", 4096)
+        for start in range(0, shape[0], batch_size):
+            batch = self._records[start:start + batch_size]
+            vectors[start:start + len(batch)] = self.embedder.embed([
+                f"{doc.get('title', '')} {chunk_text}" for doc, _, chunk_text in batch
+            ])
+
+        if self.index_path:
+            vectors.flush()
+            del vectors
+            os.replace(tmp_path, self.index_path)
+            with open(f"{self.index_path}.meta.json", 'w', encoding='utf-8') as f:
+                json.dump(self._index_stamp(), f)
+            # Drop any quantizer trained on the previous vectors.
+            ivf_path = f"{self.index_path}.ivf.npz"
+            if os.path.exists(ivf_path):
+                os.remove(ivf_path)
+            vectors = np.load(self.index_path, mmap_mode='r')
+        return vectors
+
+    @staticmethod
+    def _render(doc: Dict[str, Any], chunk_text: str) -> str:
+        """Renders a chunk the same way as the documents source."""
+        return f"From Document '{doc.get('title', '')}': {chunk_text}"
 
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
         """
-        Placeholder for semantic retrieval.
+        Retrieves the document chunks whose embeddings are most similar to the query.
+
+        Args:
+            query (str): The user's query.
+            **kwargs: 'top_k' and 'min_score' override the configured values.
+                      'tag_mask' drops top-k hits a role may not see.
         """
-        # 1. Embed the query: `query_vector = self.embedding_model.embed(query)`
-        # 2. Search the vector DB: `results = self.vector_db_client.search(query_vector)`
-        # 3. Format results into context chunks.
-        
-        print(f"Semantic search for '{query}' would happen here.")
-        
-        # Returning an empty list as this is just a placeholder.
-        return []
+        if not query.strip() or not self._records:
+            return []
+        top_k = kwargs.get("top_k", self.top_k)
+        min_score = kwargs.get("min_score", self.min_score)
+
+        tag_mask = kwargs.get("tag_mask")
+        tag_bits = self._tag_bits
+
+        query_vector = self.embedder.embed([query])[0]
+        ids, scores = self.index.search(query_vector, top_k)
+
+        return [
+            self._make_chunk(idx, similarity=similarity)
+            for idx, similarity in zip(ids.tolist(), scores.tolist())
+            if similarity > min_score and (tag_mask is None or not tag_bits[idx] or tag_bits[idx] & tag_mask)
+        ]
+
+    def _make_chunk(self, idx: int, **extra_metadata) -> Dict[str, Any]:
+        """Formats the chunk at position `idx` of the index as a context chunk."""
+        doc, i, chunk_text = self._records[idx]
+        metadata = {
+            "type": "document_chunk",
+            "document_id": doc.get("id"),
+            "document_title": doc.get("title", ""),
+            "tags": doc.get("tags", []),
+        }
+        metadata.update(extra_metadata)
+        return self._format_chunk(
+            id=f"{doc.get('id')}_chunk{i}",
+            metadata=metadata,
+            render=functools.partial(self._render, doc, chunk_text),
+            record_key=idx
+        )
+
+    def get_all_chunks(self) -> List[Dict[str, Any]]:
+        """Return all indexed chunks without filtering by query."""
+        return [self._make_chunk(idx) for idx in range(len(self._records))]
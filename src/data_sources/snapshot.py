@@ -0,0 +1,198 @@
+# path: src/data_sources/snapshot.py
+
+import base64
+import gc
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from array import array
+from typing import Any, Dict, Optional
+
+# Bump when the layout of any source's snapshot state changes.
+SNAPSHOT_VERSION = 4
+
+_MAGIC = b"CCSNAP\x00\x02"
+
+# Marks the JSON objects that stand for values JSON has no type for.
+_TYPE_KEY = "$snapshot_type"
+
+def _encode_value(value: Any) -> Dict[str, Any]:
+    """`json.dumps` hook for the non-JSON types in source state: int arrays and sets."""
+    if isinstance(value, array):
+        return {
+            _TYPE_KEY: "array",
+            "typecode": value.typecode,
+            "byteorder": sys.byteorder,
+            "data": base64.b64encode(value.tobytes()).decode("ascii"),
+        }
+    if isinstance(value, (set, frozenset)):
+        return {_TYPE_KEY: "set", "items": list(value)}
+    raise TypeError(f"Cannot snapshot a value of type {type(value).__name__}")
+
+def _decode_value(obj: Dict[str, Any]) -> Any:
+    """`json.loads` object hook undoing `_encode_value`."""
+    kind = obj.get(_TYPE_KEY)
+    if kind is None:
+        return obj
+    if kind == "array":
+        values = array(obj["typecode"])
+        values.frombytes(base64.b64decode(obj["data"]))
+        if obj["byteorder"] != sys.byteorder:
+            values.byteswap()
+        return values
+    if kind == "set":
+        return set(obj["items"])
+    raise ValueError(f"Unknown snapshot value type {kind!r}")
+
+def file_stamp(path: str) -> Optional[Dict[str, Any]]:
+    """
+    Returns the cheap identity of a data file: absolute path, size and mtime.
+
+    Args:
+        path (str): The data file.
+
+    Returns:
+        Optional[Dict[str, Any]]: The stamp, or None if the file does not exist.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return {"path": os.path.abspath(path), "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def file_hash(path: str, block_size: int = 1 << 20) -> str:
+    """Returns the BLAKE2b hex digest of a file's content, read in blocks."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexSnapshotStore:
+    """
+    Persists the parsed, chunked and indexed state of data sources so that
+    a restart can skip parsing and indexing.
+
+    Each snapshot is one file: a magic header, a one-line JSON key (source
+    class, source config, snapshot version, and the data file's path, size,
+    mtime and content hash) and the source state as JSON, with int arrays
+    stored as base64 buffers. Only the key is read to decide whether a
+    snapshot is valid, so stale snapshots are rejected without decoding the
+    state. Snapshots are plain data and are never unpickled, so a tampered
+    file cannot run code; it can still change what the source returns, so
+    the snapshot directory should only be writable by the service. A matching path,
+    size and mtime is trusted as-is; if only the mtime changed, the content
+    hash decides, so touching a file does not force a rebuild. With
+    `verify_hash` the hash is always checked.
+    """
+
+    def __init__(self, snapshot_dir: str, verify_hash: bool = False):
+        """
+        Initializes the store.
+
+        Args:
+            snapshot_dir (str): Directory the snapshot files are written to.
+            verify_hash (bool): Re-hash the data file even if size and mtime match.
+        """
+        self.snapshot_dir = snapshot_dir
+        self.verify_hash = verify_hash
+
+    def snapshot_path(self, source: Any, data_path: str) -> str:
+        """
+        Returns the snapshot file used for a source reading `data_path`.
+        Differently configured sources over the same file get separate files.
+        """
+        identity = f"{os.path.abspath(data_path)}\n{self._config_key(source)}"
+        digest = hashlib.sha1(identity.encode("utf-8")).hexdigest()[:16]
+        return os.path.join(self.snapshot_dir, f"{source.source_id}-{digest}.snapshot")
+
+    @staticmethod
+    def _config_key(source: Any) -> str:
+        """Serializes the parts of a source's identity that affect its state."""
+        config = {k: v for k, v in source.config.items() if k not in ("enabled", "timeout", "snapshot_dir", "snapshot_verify_hash")}
+        return json.dumps([type(source).__name__, SNAPSHOT_VERSION, config], sort_keys=True, default=str)
+
+    def load(self, source: Any, data_path: str) -> Optional[Dict[str, Any]]:
+        """
+        Returns the snapshot state saved for `source` if it is still valid.
+
+        Args:
+            source (Any): The data source (its class, id and config are checked).
+            data_path (str): The file the source reads.
+
+        Returns:
+            Optional[Dict[str, Any]]: The saved state, or None if there is no
+                                      valid snapshot and the source must rebuild.
+        """
+        stamp = file_stamp(data_path)
+        path = self.snapshot_path(source, data_path)
+        if stamp is None or not os.path.exists(path):
+            return None
+        refresh = False
+        try:
+            with open(path, "rb") as f:
+                if f.read(len(_MAGIC)) != _MAGIC:
+                    return None
+                key = json.loads(f.readline())
+                if key.get("config") != self._config_key(source) or key.get("path") != stamp["path"]:
+                    return None
+                same_file = key.get("size") == stamp["size"] and key.get("mtime_ns") == stamp["mtime_ns"]
+                if not same_file or self.verify_hash:
+                    if key.get("size") != stamp["size"] or key.get("hash") != file_hash(data_path):
+                        return None
+                    # Same content under a new mtime: refresh the key.
+                    refresh = not same_file
+                # The state is mostly containers that cannot form cycles; collecting
+                # while decoding millions of them only slows the load down.
+                gc_was_enabled = gc.isenabled()
+                gc.disable()
+                try:
+                    state = json.loads(f.read(), object_hook=_decode_value)
+                finally:
+                    if gc_was_enabled:
+                        gc.enable()
+        except Exception as e:
+            print(f"Warning: Ignoring unreadable index snapshot {path}: {e}")
+            return None
+        if refresh:
+            self.save(source, data_path, state, stamp)
+        return state
+
+    def save(self, source: Any, data_path: str, state: Dict[str, Any], stamp: Optional[Dict[str, Any]] = None):
+        """
+        Writes a snapshot atomically (to a temporary file, then renamed).
+
+        Args:
+            source (Any): The data source the state belongs to.
+            data_path (str): The file the state was built from.
+            state (Dict[str, Any]): The source's snapshot state.
+            stamp (Optional[Dict[str, Any]]): The file's `file_stamp` taken
+                      before it was read. Nothing is written if the file has
+                      changed since, as the state may be a mix of both versions.
+        """
+        current = file_stamp(data_path)
+        if current is None or (stamp is not None and stamp != current):
+            return
+        key = dict(current, config=self._config_key(source), hash=file_hash(data_path))
+        # The file may also have changed while it was being hashed.
+        if file_stamp(data_path) != current:
+            return
+        path = self.snapshot_path(source, data_path)
+        try:
+            payload = json.dumps(state, ensure_ascii=False, separators=(",", ":"), default=_encode_value)
+        except (TypeError, ValueError) as e:
+            print(f"Warning: Could not serialize index snapshot {path}: {e}")
+            return
+        try:
+            os.makedirs(self.snapshot_dir, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=self.snapshot_dir, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(_MAGIC)
+                f.write(json.dumps(key).encode("utf-8") + b"\n")
+                f.write(payload.encode("utf-8"))
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Warning: Could not write index snapshot {path}: {e}")
@@ -1,8 +1,9 @@
  #path: src/data_sources/tasks.py
 
 import json
-from typing import List, Dict, Any
-from .base import BaseContextSource
+from typing import List, Dict, Any, Optional, Set
+from .base import BaseContextSource, apply_postings_delta
+from .chunk import tag_bitmap
 
 class TaskContextSource(BaseContextSource):
     """
@@ -17,8 +18,26 @@ class TaskContextSource(BaseContextSource):
             raise ValueError("Path for tasks data source is not specified in config.")
         self._load_data()
 
+    # Task fields with a hash index that `retrieve` accepts as filters.
+    FILTER_FIELDS = ("project", "assignee", "status", "tags")
+
+    SNAPSHOT_ATTRS = ("data", "_contents", "_term_index", "_field_index", "_corpus_stats")
+
+    SUPPORTS_TAG_MASK = True
+
     def _load_data(self):
-        """Loads task data from the JSON file."""
+        """
+        Loads task data from the JSON file and builds the lookup indexes,
+        or restores both from a valid index snapshot.
+        """
+        if not self._restore_snapshot(self.tasks_path):
+            self._read_data()
+            self._build_index()
+            self._save_snapshot(self.tasks_path)
+        self._build_tag_bits()
+
+    def _read_data(self):
+        """Reads the task list from the JSON file."""
         try:
             with open(self.tasks_path, 'r', encoding='utf-8-sig') as f:
                 self.data = json.load(f)
@@ -30,32 +49,177 @@ class TaskContextSource(BaseContextSource):
         except json.JSONDecodeError as e:
             self.data = []
 
+    @staticmethod
+    def _task_content(task: Dict[str, Any]) -> str:
+        """Formats a task as the content string shown in context."""
+        return f"Task: {task.get('title', '')}. Status: {task.get('status', '')}. Description: {task.get('description', '')}"
+
+    @staticmethod
+    def _field_values(task: Dict[str, Any]):
+        """Yields the (field, value) pairs of a task that the hash indexes cover."""
+        for field in ("project", "assignee", "status"):
+            value = task.get(field)
+            if value is not None:
+                yield field, value
+        for tag in task.get("tags", []) or []:
+            yield "tags", tag
+
+    def _build_index(self):
+        """
+        Precomputes each task's content string and builds an inverted term
+        index plus hash indexes on the filterable fields.
+        """
+        self._contents: List[str] = []
+        self._term_index: Dict[str, List[int]] = {}
+        self._field_index: Dict[str, Dict[Any, List[int]]] = {field: {} for field in self.FILTER_FIELDS}
+        self._reset_corpus_stats()
+
+        for idx, task in enumerate(self.data):
+            content = self._task_content(task)
+            self._contents.append(content)
+            for term in self._add_corpus_terms(content.lower().split()):
+                self._term_index.setdefault(term, []).append(idx)
+
+            for field, value in self._field_values(task):
+                self._field_index[field].setdefault(value, []).append(idx)
+
+    def _snapshot_state(self) -> Dict[str, Any]:
+        # Field values can be ints or bools, which JSON object keys would turn into strings.
+        state = super()._snapshot_state()
+        state["_field_index"] = {field: list(index.items()) for field, index in self._field_index.items()}
+        return state
+
+    def _restore_snapshot_state(self, state: Dict[str, Any]):
+        state = dict(state, _field_index={field: dict(map(tuple, pairs)) for field, pairs in state["_field_index"].items()})
+        super()._restore_snapshot_state(state)
+
+    def _build_tag_bits(self):
+        """Computes each task's tag bitmap (0 for removed slots)."""
+        self._tag_bits = [tag_bitmap(task.get("tags")) if task is not None else 0 for task in self.data]
+
+    def _apply_reload(self, data_path: str):
+        """
+        Applies the tasks added, changed or removed since the last load,
+        matched by task id. A changed task keeps its position, a removed one
+        leaves an empty slot (None) and new ones are appended, so only the
+        postings of those tasks are rebuilt.
+        """
+        previous = self.data
+        self._read_data()
+        delta = self._diff_records(previous, self.data)
+        if delta is None:
+            self._build_index()
+            self._build_tag_bits()
+            return
+        changed, appended = delta
+
+        data = list(previous)
+        contents = list(self._contents)
+        tag_bits = list(self._tag_bits)
+        for task in appended:
+            changed[len(data)] = task
+            data.append(None)
+            contents.append("")
+            tag_bits.append(0)
+        self._copy_corpus_stats()
+        terms_removed, terms_added = {}, {}
+        fields_removed, fields_added = {}, {}
+        for idx in sorted(changed):
+            old_task, task = data[idx], changed[idx]
+            if old_task is not None:
+                for term in self._remove_corpus_terms(contents[idx].lower().split()):
+                    terms_removed.setdefault(term, set()).add(idx)
+                for field, value in self._field_values(old_task):
+                    fields_removed.setdefault(field, {}).setdefault(value, set()).add(idx)
+            data[idx] = task
+            contents[idx] = self._task_content(task) if task is not None else ""
+            tag_bits[idx] = tag_bitmap(task.get("tags")) if task is not None else 0
+            if task is not None:
+                for term in self._add_corpus_terms(contents[idx].lower().split()):
+                    terms_added.setdefault(term, []).append(idx)
+                for field, value in self._field_values(task):
+                    fields_added.setdefault(field, {}).setdefault(value, []).append(idx)
+
+        self.data, self._contents, self._tag_bits = data, contents, tag_bits
+        self._term_index = apply_postings_delta(self._term_index, terms_removed, terms_added)
+        self._field_index = {
+            field: apply_postings_delta(index, fields_removed.get(field, {}), fields_added.get(field, {}))
+            for field, index in self._field_index.items()
+        }
+
+    def _resolve_filters(self, filters: Dict[str, Any]) -> Optional[Set[int]]:
+        """
+        Resolves structured field filters through the hash indexes.
+
+        Each filter value may be a single value or a list of values, which
+        match if the task has any of them. Filters on different fields are
+        combined with AND.
+
+        Returns:
+            Optional[Set[int]]: Indices of matching tasks, or None if no filters were given.
+        """
+        matched = None
+        for field in self.FILTER_FIELDS:
+            value = filters.get(field)
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            index = self._field_index[field]
+            ids = set()
+            for v in values:
+                ids.update(index.get(v, ()))
+            matched = ids if matched is None else matched & ids
+        return matched
+
     def retrieve(self, query: str, **kwargs) -> List[Dict[str, Any]]:
         """
         Retrieves tasks that match keywords in the query.
         A simple keyword match is used for this example.
+
+        Args:
+            query (str): The user's query.
+            **kwargs: Optional structured filters on `project`, `assignee`,
+                      `status` or `tags` (e.g. `project="QuantumLeap"`).
+                      If the query has no terms, tasks matching the filters
+                      are returned as-is. 'tag_mask' skips tasks a role
+                      may not see.
         """
         query_terms = set(query.lower().split())
-        relevant_chunks = []
+        candidates = self._resolve_filters(kwargs)
 
-        for task in self.data:
-            content = f"Task: {task.get('title', '')}. Status: {task.get('status', '')}. Description: {task.get('description', '')}"
-            content_terms = set(content.lower().split())
-            
+        if query_terms:
             # Check for keyword overlap
-            if query_terms.intersection(content_terms):
-                metadata = {
-                    "type": "task",
-                    "project": task.get("project"),
-                    "assignee": task.get("assignee"),
-                    "tags": task.get("tags", []),
-                    "original_title": task.get('title')
-                }
-                formatted_chunk = self._format_chunk(
-                    id=task.get("id"),
-                    content=content,
-                    metadata=metadata
-                )
-                relevant_chunks.append(formatted_chunk)
-        
-        return relevant_chunks
+            matched = set()
+            for term in query_terms:
+                matched.update(self._term_index.get(term, ()))
+            if candidates is not None:
+                matched &= candidates
+        else:
+            matched = candidates or set()
+
+        tag_mask = kwargs.get("tag_mask")
+        if tag_mask is not None:
+            tag_bits = self._tag_bits
+            matched = [idx for idx in matched if not tag_bits[idx] or tag_bits[idx] & tag_mask]
+        return [self._make_chunk(idx) for idx in sorted(matched)]
+
+    def _make_chunk(self, idx: int) -> Dict[str, Any]:
+        """Formats the task at position `idx` as a context chunk."""
+        task = self.data[idx]
+        metadata = {
+            "type": "task",
+            "project": task.get("project"),
+            "assignee": task.get("assignee"),
+            "tags": task.get("tags", []),
+            "original_title": task.get('title')
+        }
+        return self._format_chunk(
+            id=task.get("id"),
+            content=self._contents[idx],
+            metadata=metadata,
+            record_key=idx
+        )
+
+    def get_all_chunks(self) -> List[Dict[str, Any]]:
+        """Return all tasks as chunks without filtering by query."""
+        return [self._make_chunk(idx) for idx, task in enumerate(self.data) if task is not None]
@@ -1,13 +1,19 @@
 # This file makes the src directory a Python package.
+import asyncio
+import hashlib
+import json
 import os
-from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
 from .utils.config_loader import load_config, load_user_roles
 from .retrieval.context_retriever import ContextRetriever
 from .optimization.ranking import Ranker
+from .optimization.tfidf import TfidfIndex
 from .optimization.deduplication import Deduplicator
 from .optimization.token_budget import TokenBudgetManager
 from .personalization.role_handler import RoleHandler
+from .utils.result_cache import ResultCache
 
 class ContextEngineer:
     """
@@ -33,13 +39,60 @@ class ContextEngineer:
         self.role_handler = RoleHandler(self.roles_config)
         
         # Initialize optimization components
-        self.ranker = Ranker(method=self.config['optimization']['ranking']['method'])
-        self.deduplicator = Deduplicator(threshold=self.config['optimization']['deduplication']['similarity_threshold'])
+        self.ranker = self._make_ranker()
+        dedup_config = self.config['optimization']['deduplication']
+        self.deduplicator = Deduplicator(
+            threshold=dedup_config['similarity_threshold'],
+            method=dedup_config.get('method', 'pairwise'),
+            num_perm=dedup_config.get('num_perm', 128)
+        )
+        budget_config = self.config['optimization'].get('token_budget', {}) or {}
         self.budget_manager = TokenBudgetManager(
             max_tokens=self.config['defaults']['max_context_tokens'],
-            tokenizer_model=self.config['defaults']['tokenizer_model']
+            tokenizer_model=self.config['defaults']['tokenizer_model'],
+            token_cache_size=self.config['defaults'].get('token_cache_size', 100000),
+            packing=budget_config.get('packing', 'sequential'),
+            truncate_last=budget_config.get('truncate_last', False)
+        )
+        self._cpu_executor = None
+
+        # Result cache for repeated (query, role) pairs
+        defaults = self.config['defaults']
+        self.cache_enabled = defaults.get('cache_enabled', False)
+        self.result_cache = ResultCache(
+            max_entries=defaults.get('cache_max_entries', 1024),
+            ttl_seconds=defaults.get('cache_ttl_seconds', 300)
+        )
+        self._config_fingerprint = hashlib.sha256(
+            json.dumps([self.config, self.roles_config], sort_keys=True, default=str).encode('utf-8')
+        ).hexdigest()
+        self.retriever.add_reload_listener(self._on_sources_reloaded)
+
+    def _make_ranker(self) -> Ranker:
+        """Creates the ranker over the current corpus statistics of the sources."""
+        ranking_config = self.config['optimization']['ranking']
+        tfidf_index = None
+        if ranking_config['method'] in ('cosine', 'dot'):
+            tfidf_index = TfidfIndex(
+                chunk for source in list(self.retriever.sources.values()) for chunk in source.get_all_chunks()
+            )
+        return Ranker(
+            method=ranking_config['method'],
+            corpus_stats=self.retriever.get_corpus_stats(),
+            k1=ranking_config.get('k1', 1.5),
+            b=ranking_config.get('b', 0.75),
+            tfidf_index=tfidf_index
         )
 
+    def _on_sources_reloaded(self, source_names: List[str]):
+        """
+        Refreshes what depends on the sources' content after a hot reload:
+        the ranker's corpus statistics (and TF-IDF index) are rebuilt and
+        swapped in, and cached contexts built from the old data are dropped.
+        """
+        self.ranker = self._make_ranker()
+        self.result_cache.clear()
+
     def build_context(self, query: str, user_role: str) -> str:
         """
         Executes the full context engineering pipeline.
@@ -55,21 +108,232 @@ class ContextEngineer:
         try:
             permissions = self.role_handler.get_permissions(user_role)
             allowed_sources = permissions.get('allowed_sources', [])
-            filter_tags = permissions.get('filter_by_tags', [])
+            tag_mask = self.role_handler.get_tag_mask(user_role)
+        except ValueError as e:
+            return "Error: Invalid user role specified."
+
+        cache_key, data_stamp, cached = self._cache_lookup(query, user_role)
+        if cached is not None:
+            return cached
+
+        # 2. Retrieval: Fetch raw context from allowed sources, skipping
+        # chunks the role's tag filter rejects before they are built
+        raw_context_chunks = self.retriever.retrieve(query, allowed_sources, tag_mask)
+
+        final_context_string = self._optimize_context(query, raw_context_chunks)
+        if cache_key is not None:
+            self.result_cache.put(cache_key, final_context_string, data_stamp)
+        return final_context_string
+
+    async def abuild_context(self, query: str, user_role: str) -> str:
+        """
+        Asynchronous counterpart of `build_context` for use from an event loop.
+        Sources are awaited concurrently, and the CPU-bound stages (ranking,
+        deduplication and token counting) run on a dedicated worker
+        pool so the loop stays responsive while many requests are in flight.
+        
+        Args:
+            query (str): The user's query.
+            user_role (str): The role of the user making the query.
+            
+        Returns:
+            str: The final, optimized context string.
+        """
+        try:
+            permissions = self.role_handler.get_permissions(user_role)
+            allowed_sources = permissions.get('allowed_sources', [])
+            tag_mask = self.role_handler.get_tag_mask(user_role)
         except ValueError as e:
             return "Error: Invalid user role specified."
 
-        # 2. Retrieval: Fetch raw context from allowed sources
-        raw_context_chunks = self.retriever.retrieve(query, allowed_sources)
+        cache_key, data_stamp, cached = self._cache_lookup(query, user_role)
+        if cached is not None:
+            return cached
+
+        raw_context_chunks = await self.retriever.aretrieve(query, allowed_sources, tag_mask)
+
+        loop = asyncio.get_running_loop()
+        final_context_string = await loop.run_in_executor(
+            self._get_cpu_executor(), self._optimize_context, query, raw_context_chunks
+        )
+        if cache_key is not None:
+            self.result_cache.put(cache_key, final_context_string, data_stamp)
+        return final_context_string
+
+    def build_context_stream(self, query: str, user_role: str) -> Iterator[Dict[str, Any]]:
+        """
+        Streams the pipeline chunk by chunk. Only the stages after ranking
+        are lazy: retrieval and scoring of all candidates run eagerly before
+        the first chunk is yielded, after which candidates are pulled in
+        score order through deduplication and token counting, stopping as
+        soon as the budget is full. Joining the yielded 'text' values gives
+        the same string as `build_context`. Streaming requires 'sequential'
+        packing, since 'greedy' and 'dp' must see every candidate's cost
+        before admitting any.
+        
+        Args:
+            query (str): The user's query.
+            user_role (str): The role of the user making the query.
+            
+        Yields:
+            Dict[str, Any]: For each admitted chunk, 'chunk', its formatted
+                            'text', its 'tokens', the running 'total_tokens'
+                            and whether it was 'truncated'.
+            
+        Raises:
+            ValueError: If the role is not defined, or the budget manager
+                        does not use 'sequential' packing.
+        """
+        if self.budget_manager.packing != "sequential":
+            raise ValueError(
+                f"build_context_stream requires 'sequential' packing, not '{self.budget_manager.packing}'; "
+                "use build_context instead."
+            )
+        permissions = self.role_handler.get_permissions(user_role)
+        allowed_sources = permissions.get('allowed_sources', [])
+        tag_mask = self.role_handler.get_tag_mask(user_role)
+
+        raw_context_chunks = self.retriever.retrieve(query, allowed_sources, tag_mask)
+
+        ranked = self.ranker.iter_ranked(query, raw_context_chunks)
+        unique = self.deduplicator.iter_unique(ranked)
+        yield from self.budget_manager.iter_admitted(unique)
+
+    def build_context_batch(self, queries: List[Tuple[str, str]], batch_size: int = 64) -> List[str]:
+        """
+        Builds the contexts of many (query, role) pairs, returning the same
+        strings as calling `build_context` for each pair.
+        
+        Queries are grouped by role and processed in slices of `batch_size`.
+        Within a slice, identical queries are built once, candidates of all
+        queries are scored together (`Ranker.rank_batch`), and the token
+        counts of all entries are fetched in one batched call, so work
+        shared between queries is not repeated.
+        
+        Args:
+            queries (List[Tuple[str, str]]): (query, user_role) pairs.
+            batch_size (int): Maximum number of queries scored together,
+                              bounding the memory of the shared score arrays.
+            
+        Returns:
+            List[str]: The final context string of each pair, in input order.
+        """
+        results: List[Optional[str]] = [None] * len(queries)
+        pending: Dict[str, List[int]] = {}
+        cache_entries: Dict[int, Tuple[Optional[tuple], Optional[tuple]]] = {}
+        data_stamp = self._data_stamp() if self.cache_enabled else None
+
+        for pos, (query, user_role) in enumerate(queries):
+            try:
+                self.role_handler.get_permissions(user_role)
+            except ValueError:
+                results[pos] = "Error: Invalid user role specified."
+                continue
+            cache_key, stamp, cached = self._cache_lookup(query, user_role, data_stamp)
+            if cached is not None:
+                results[pos] = cached
+                continue
+            cache_entries[pos] = (cache_key, stamp)
+            pending.setdefault(user_role, []).append(pos)
+
+        for user_role, positions in pending.items():
+            allowed_sources = self.role_handler.get_permissions(user_role).get('allowed_sources', [])
+            tag_mask = self.role_handler.get_tag_mask(user_role)
+            for start in range(0, len(positions), max(1, batch_size)):
+                group = positions[start:start + max(1, batch_size)]
+                unique_queries = list(dict.fromkeys(queries[pos][0] for pos in group))
+                contexts = self._build_role_batch(unique_queries, allowed_sources, tag_mask)
+                for pos in group:
+                    results[pos] = contexts[queries[pos][0]]
+                    cache_key, stamp = cache_entries[pos]
+                    if cache_key is not None:
+                        self.result_cache.put(cache_key, results[pos], stamp)
+        return results
+
+    def _build_role_batch(self, queries: List[str], allowed_sources: List[str], tag_mask: Optional[int]) -> Dict[str, str]:
+        """
+        Runs the pipeline for distinct queries of one role, sharing scoring
+        and token counting across them (see `build_context_batch`).
+        
+        Returns:
+            Dict[str, str]: The final context string of each query.
+        """
+        raw_context_lists = [self.retriever.retrieve(query, allowed_sources, tag_mask) for query in queries]
+        ranked_lists = self.ranker.rank_batch(queries, raw_context_lists)
+        deduplicated_lists = [self.deduplicator.deduplicate(chunks) for chunks in ranked_lists]
+        self.budget_manager.prefetch_token_counts(deduplicated_lists)
+        return {
+            query: self.budget_manager.construct_context(chunks)
+            for query, chunks in zip(queries, deduplicated_lists)
+        }
+
+    def _cache_lookup(self, query: str, user_role: str,
+                      data_stamp: Optional[tuple] = None) -> Tuple[Optional[tuple], Optional[tuple], Optional[str]]:
+        """
+        Looks up a previously built context for this query and role.
+        The key combines the normalized query, the role and a fingerprint of
+        the loaded configuration; entries are stamped with the size and mtime
+        of every backing data file so any change to them forces a rebuild.
+        
+        Args:
+            query (str): The user's query.
+            user_role (str): The role of the user making the query.
+            data_stamp (Optional[tuple]): A `_data_stamp()` taken by the
+                       caller, to check many lookups against one stat pass.
+            
+        Returns:
+            Tuple: (cache key, data stamp, cached context). The key is None
+                   when caching is disabled or the query is blank; the cached
+                   context is None on a miss.
+        """
+        normalized_query = " ".join(query.lower().split())
+        if not self.cache_enabled or not normalized_query:
+            return None, None, None
+        cache_key = (normalized_query, user_role, self._config_fingerprint)
+        if data_stamp is None:
+            data_stamp = self._data_stamp()
+        return cache_key, data_stamp, self.result_cache.get(cache_key, data_stamp)
+
+    def _data_stamp(self) -> tuple:
+        """Returns (source, path, mtime, size) for the data file of every loaded source."""
+        stamp = []
+        for key in self.retriever.sources:
+            path = (self.config.get('data_sources', {}).get(key, {}) or {}).get('path')
+            try:
+                st = os.stat(path) if path else None
+            except OSError:
+                st = None
+            stamp.append((key, path, st.st_mtime_ns if st else None, st.st_size if st else None))
+        return tuple(stamp)
 
-        # 3. Personalization: Filter retrieved context based on tags
-        filtered_context = self.role_handler.filter_context_by_role(raw_context_chunks, user_role)
+    def _get_cpu_executor(self) -> ThreadPoolExecutor:
+        """Lazily creates the worker pool used by `abuild_context` for CPU-bound stages."""
+        if self._cpu_executor is None:
+            workers = (self.config.get('concurrency', {}) or {}).get('cpu_workers')
+            self._cpu_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="context-cpu")
+        return self._cpu_executor
+
+    def _optimize_context(self, query: str, raw_context_chunks: List[Dict[str, Any]]) -> str:
+        """
+        Runs the post-retrieval stages of the pipeline on raw chunks.
+        
+        Args:
+            query (str): The user's query.
+            raw_context_chunks (List[Dict[str, Any]]): Chunks from the allowed
+                      sources, already filtered by the role's tags.
+            
+        Returns:
+            str: The final, optimized context string.
+        """
+        # 3. Personalization: tag filtering already happened during retrieval
 
         # 4. Optimization: Rank the filtered context
-        ranked_context = self.ranker.rank(query, filtered_context)
+        ranked_context = self.ranker.rank(query, raw_context_chunks)
 
-        # 5. Optimization: Deduplicate the ranked context
-        deduplicated_context = self.deduplicator.deduplicate(ranked_context)
+        # 5. Optimization: Deduplicate the ranked context. Lazily, so that
+        # 'sequential' packing stops deduplicating (and rendering content)
+        # once the budget is full.
+        deduplicated_context = self.deduplicator.iter_unique(ranked_context)
         
         # 6. Optimization: Manage token budget
         final_context_string = self.budget_manager.construct_context(deduplicated_context)
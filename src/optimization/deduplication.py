@@ -1,29 +1,92 @@
 #path: src/optimization/deduplication.py
 
-from typing import List, Dict, Any
+import functools
+import zlib
+from typing import List, Dict, Any, Iterable, Iterator, Set, Tuple
+
+import numpy as np
+
+# Modulus of the MinHash permutation family; a Mersenne prime small enough
+# that a * x + b fits in 64 bits for 31-bit inputs.
+_MINHASH_PRIME = (1 << 31) - 1
 
 class Deduplicator:
     """
     Removes duplicate or highly similar context chunks.
     """
 
-    def __init__(self, threshold: float = 0.9):
+    def __init__(self, threshold: float = 0.9, method: str = "pairwise", num_perm: int = 128, seed: int = 1):
         """
         Initializes the Deduplicator.
         
         Args:
             threshold (float): The Jaccard similarity threshold above which
                                content is considered a duplicate.
+            method (str): 'pairwise' compares each chunk with every kept chunk.
+                          'lsh' only compares chunks that share a MinHash
+                          band bucket, which scales to large candidate sets
+                          at the cost of occasionally missing a near-duplicate.
+            num_perm (int): Number of MinHash permutations for 'lsh'.
+            seed (int): Seed for the MinHash permutations.
         """
         self.threshold = threshold
+        self.method = method
+        self.num_perm = num_perm
+
+        rng = np.random.RandomState(seed)
+        self._perm_a = rng.randint(1, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+        self._perm_b = rng.randint(0, _MINHASH_PRIME, size=num_perm).astype(np.uint64)
+
+    @property
+    def bands(self) -> int:
+        """Number of LSH bands for the threshold; only computed once 'lsh' needs it."""
+        return self._lsh_params(self.threshold, self.num_perm)[0]
+
+    @property
+    def rows(self) -> int:
+        """MinHash rows per LSH band for the threshold."""
+        return self._lsh_params(self.threshold, self.num_perm)[1]
+
+    @staticmethod
+    @functools.lru_cache(maxsize=64)
+    def _lsh_params(threshold: float, num_perm: int, false_positive_weight: float = 0.1) -> Tuple[int, int]:
+        """
+        Picks the number of bands and rows per band for the LSH index.
+
+        A pair with similarity s becomes a candidate with probability
+        1 - (1 - s ** rows) ** bands. The chosen split minimizes the weighted
+        area of false positives below the threshold and false negatives above
+        it. Candidates are verified with exact Jaccard, so false positives
+        only cost a comparison and are weighted lightly. The search is cached
+        per (threshold, num_perm).
+        """
+        similarities = np.linspace(0.0, 1.0, 201)
+        below = similarities <= threshold
+        step = similarities[1] - similarities[0]
+
+        best = (1, num_perm)
+        best_error = float("inf")
+        for bands in range(1, num_perm + 1):
+            for rows in range(1, num_perm // bands + 1):
+                probability = 1.0 - (1.0 - similarities ** rows) ** bands
+                false_positives = probability[below].sum() * step
+                false_negatives = (1.0 - probability[~below]).sum() * step
+                error = false_positive_weight * false_positives + (1.0 - false_positive_weight) * false_negatives
+                if error < best_error:
+                    best, best_error = (bands, rows), error
+        return best
 
     def _jaccard_similarity(self, text1: str, text2: str) -> float:
         """
         Calculates the Jaccard similarity between two texts.
         """
-        set1 = set(text1.lower().split())
-        set2 = set(text2.lower().split())
-        
+        return self._jaccard_sets(set(text1.lower().split()), set(text2.lower().split()))
+
+    @staticmethod
+    def _jaccard_sets(set1: Set[str], set2: Set[str]) -> float:
+        """
+        Calculates the Jaccard similarity between two term sets.
+        """
         if not set1 and not set2:
             return 1.0 # Both empty
         
@@ -32,10 +95,23 @@ class Deduplicator:
         
         return intersection / union if union > 0 else 0.0
 
+    def _minhash(self, terms: Set[str]) -> np.ndarray:
+        """
+        Computes the MinHash signature of a non-empty term set.
+        """
+        hashes = np.fromiter(
+            (zlib.crc32(term.encode("utf-8")) & _MINHASH_PRIME for term in terms),
+            dtype=np.uint64, count=len(terms)
+        )
+        permuted = (self._perm_a[:, None] * hashes[None, :] + self._perm_b[:, None]) % _MINHASH_PRIME
+        return permuted.min(axis=1)
+
     def deduplicate(self, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """
         Filters a list of chunks, removing near-duplicates.
         It keeps the first occurrence of a piece of content.
+        Byte-identical content is dropped by an exact-hash check before any
+        similarity comparison.
         
         Args:
             chunks (List[Dict[str, Any]]): A list of context chunks,
@@ -44,19 +120,88 @@ class Deduplicator:
         Returns:
             List[Dict[str, Any]]: A list of unique context chunks.
         """
-        unique_chunks = []
-        seen_contents = []
+        return list(self.iter_unique(chunks))
+
+    def iter_unique(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yields the chunks `deduplicate` would keep, in order.
+        Each chunk is only examined when the consumer asks for the next
+        unique chunk, so a consumer that stops early skips the rest.
+        
+        Args:
+            chunks (Iterable[Dict[str, Any]]): Context chunks, ideally ranked by relevance.
+            
+        Yields:
+            Dict[str, Any]: Unique context chunks.
+        """
+        if self.method == "lsh":
+            yield from self._iter_unique_lsh(chunks)
+            return
+
+        seen_exact = set()
+        seen_terms = []
 
         for chunk in chunks:
             content = chunk.get("content", "")
+            # Identical content has similarity 1.0, a duplicate for any threshold below 1.
+            if self.threshold < 1.0 and content in seen_exact:
+                continue
+
+            terms = set(content.lower().split())
             is_duplicate = False
-            for seen_content in seen_contents:
-                if self._jaccard_similarity(content, seen_content) > self.threshold:
+            for seen in seen_terms:
+                if self._jaccard_sets(terms, seen) > self.threshold:
                     is_duplicate = True
                     break
             
             if not is_duplicate:
-                unique_chunks.append(chunk)
-                seen_contents.append(content)
-        
-        return unique_chunks
+                seen_exact.add(content)
+                seen_terms.append(terms)
+                yield chunk
+
+    def _iter_unique_lsh(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Deduplicates using MinHash signatures and banded LSH buckets.
+        Each kept chunk is inserted into one bucket per band; a new chunk is
+        only compared (with exact Jaccard) against kept chunks it shares a
+        bucket with, so no pair is reported that is not above the threshold.
+        """
+        seen_exact = set()
+        kept_terms: List[Set[str]] = []
+        buckets: Dict[Tuple[int, bytes], List[int]] = {}
+        empty_kept = False
+        bands, rows = self._lsh_params(self.threshold, self.num_perm)
+
+        for chunk in chunks:
+            content = chunk.get("content", "")
+            if self.threshold < 1.0 and content in seen_exact:
+                continue
+
+            terms = set(content.lower().split())
+            if not terms:
+                # Two empty chunks have similarity 1.0; an empty and a non-empty one 0.0.
+                if empty_kept and self.threshold < 1.0:
+                    continue
+                empty_kept = True
+                seen_exact.add(content)
+                yield chunk
+                continue
+
+            signature = self._minhash(terms)
+            keys = [
+                (band, signature[band * rows:(band + 1) * rows].tobytes())
+                for band in range(bands)
+            ]
+
+            candidates = set()
+            for key in keys:
+                candidates.update(buckets.get(key, ()))
+            if any(self._jaccard_sets(terms, kept_terms[idx]) > self.threshold for idx in candidates):
+                continue
+
+            kept_idx = len(kept_terms)
+            kept_terms.append(terms)
+            for key in keys:
+                buckets.setdefault(key, []).append(kept_idx)
+            seen_exact.add(content)
+            yield chunk
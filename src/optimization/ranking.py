@@ -1,65 +1,363 @@
 #path: src/optimization/ranking.py
 
-from typing import List, Dict, Any
+import heapq
+from itertools import chain, repeat
+from typing import List, Dict, Any, Iterator, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .tfidf import TfidfIndex
 
 class Ranker:
     """
     Ranks a list of context chunks based on their relevance to a query.
     """
 
-    def __init__(self, method: str = "keyword_match"):
+    def __init__(self, method: str = "keyword_match", corpus_stats: Dict[str, Any] = None,
+                 k1: float = 1.5, b: float = 0.75, tfidf_index: Optional[TfidfIndex] = None):
         """
         Initializes the Ranker.
         
         Args:
             method (str): The ranking method to use.
                           'keyword_match' is a simple default.
+                          'bm25' scores chunks with Okapi BM25.
+                          'cosine' and 'dot' score chunks by TF-IDF cosine
+                          similarity or raw TF-IDF dot product.
                           Future methods could include 'embedding_similarity'.
+            corpus_stats (Dict[str, Any]): Term statistics of the loaded sources
+                          (see `ContextRetriever.get_corpus_stats`), used by 'bm25'
+                          for document frequencies and average chunk length.
+                          If omitted, statistics of the candidate set are used.
+            k1 (float): BM25 term-frequency saturation parameter.
+            b (float): BM25 length-normalization parameter.
+            tfidf_index (TfidfIndex): TF-IDF matrix over the loaded sources,
+                          used by 'cosine' and 'dot'. If omitted, one is
+                          fitted on each candidate set.
         """
         self.method = method
+        self.corpus_stats = corpus_stats
+        self.k1 = k1
+        self.b = b
+        self.tfidf_index = tfidf_index
 
-    def _rank_by_keyword_match(self, query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def _keyword_match_scores(self, query: str, chunks: List[Dict[str, Any]]) -> Optional[List[int]]:
         """
-        Ranks chunks based on the number of query keywords they contain.
+        Scores chunks by the number of query keywords they contain.
         
         Args:
             query (str): The user's query.
             chunks (List[Dict[str, Any]]): The list of context chunks.
             
         Returns:
-            List[Dict[str, Any]]: Chunks sorted by relevance score, descending.
+            Optional[List[int]]: One score per chunk, or None if the query has no terms.
         """
         query_terms = set(query.lower().split())
         if not query_terms:
-            return chunks
+            return None
 
-        scored_chunks = []
-        for chunk in chunks:
-            content = chunk.get("content", "").lower()
-            match_count = sum(1 for term in query_terms if term in content)
+        return [
+            sum(1 for term in query_terms if term in chunk.get("content", "").lower())
+            for chunk in chunks
+        ]
+
+    @staticmethod
+    def _term_frequencies(contents: List[str], col_of: Dict[str, int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Counts the terms of `col_of` in each content. All contents are split
+        into one flat token list, mapped to term columns in a single pass,
+        and summed into a sparse (contents x terms) matrix.
+        
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: The dense term-frequency matrix and
+                                           each content's token count.
+        """
+        # scipy is a dependency of scikit-learn and only needed for BM25.
+        from scipy import sparse
+
+        token_lists = [content.lower().split() for content in contents]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=len(contents))
+        tokens = list(chain.from_iterable(token_lists))
+        cols = np.fromiter(map(col_of.get, tokens, repeat(-1)), dtype=np.int64, count=len(tokens))
+        rows = np.repeat(np.arange(len(contents), dtype=np.int64), lengths)
+        hits = cols >= 0
+        tf = sparse.csr_matrix(
+            (np.ones(int(hits.sum()), dtype=np.float64), (rows[hits], cols[hits])),
+            shape=(len(contents), len(col_of))
+        ).toarray()
+        return tf, lengths.astype(np.float64)
+
+    def _bm25_scores(self, query: str, chunks: List[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Scores chunks with Okapi BM25 over whitespace-split, lowercased terms.
+        Term frequencies are gathered into a (chunks x query terms) matrix
+        and the whole candidate set is scored with array operations.
+        
+        Args:
+            query (str): The user's query.
+            chunks (List[Dict[str, Any]]): The list of context chunks.
             
-            # Add score to each chunk's metadata for transparency
-            if 'metadata' not in chunk:
-                chunk['metadata'] = {}
-            chunk['metadata']['relevance_score'] = match_count
-            scored_chunks.append(chunk)
+        Returns:
+            Optional[np.ndarray]: One score per chunk, or None if there is nothing to score.
+        """
+        query_terms = list(dict.fromkeys(query.lower().split()))
+        if not query_terms or not chunks:
+            return None
 
-        # Sort chunks by score in descending order
-        return sorted(scored_chunks, key=lambda x: x['metadata']['relevance_score'], reverse=True)
+        tf, lengths = self._term_frequencies([chunk.get("content", "") for chunk in chunks],
+                                             {term: col for col, term in enumerate(query_terms)})
 
-    def rank(self, query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        stats = self.corpus_stats
+        if stats and stats.get("num_chunks"):
+            num_docs = stats["num_chunks"]
+            avg_length = stats["total_length"] / num_docs
+            doc_freqs = np.array([stats["doc_freqs"].get(term, 0) for term in query_terms], dtype=np.float64)
+        else:
+            num_docs = len(chunks)
+            avg_length = lengths.mean()
+            doc_freqs = np.count_nonzero(tf, axis=0).astype(np.float64)
+        # A candidate can contain a term the corpus statistics have not seen.
+        doc_freqs = np.minimum(doc_freqs, num_docs)
+
+        idf = np.log((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5) + 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(avg_length, 1e-9))
+        return (tf * (self.k1 + 1.0) / (tf + norm[:, None])) @ idf
+
+    def _tfidf_scores(self, query: str, chunks: List[Dict[str, Any]]) -> Optional[np.ndarray]:
         """
-        Applies the configured ranking method to the chunks.
+        Scores chunks by TF-IDF similarity with one sparse matrix-vector product.
+        'cosine' normalizes both sides; 'dot' uses the raw TF-IDF weights.
         
         Args:
             query (str): The user's query.
             chunks (List[Dict[str, Any]]): The list of context chunks.
             
         Returns:
-            List[Dict[str, Any]]: The sorted list of context chunks.
+            Optional[np.ndarray]: One score per chunk, or None if there is nothing to score.
+        """
+        if not query.strip() or not chunks:
+            return None
+        index = self.tfidf_index if self.tfidf_index is not None else TfidfIndex(chunks)
+        return index.score(query, chunks, normalize=(self.method == "cosine"))
+
+    def score(self, query: str, chunks: List[Dict[str, Any]]) -> Optional[Sequence[float]]:
+        """
+        Scores chunks with the configured method and records each score in
+        the chunk's metadata as 'relevance_score' for transparency.
+        
+        Args:
+            query (str): The user's query.
+            chunks (List[Dict[str, Any]]): The list of context chunks.
+            
+        Returns:
+            Optional[Sequence[float]]: One score per chunk, or None if the
+                                       chunks should keep their original order.
         """
         if self.method == "keyword_match":
-            return self._rank_by_keyword_match(query, chunks)
+            scores = self._keyword_match_scores(query, chunks)
+        elif self.method == "bm25":
+            scores = self._bm25_scores(query, chunks)
+            if scores is not None:
+                scores = scores.tolist()
+        elif self.method in ("cosine", "dot"):
+            scores = self._tfidf_scores(query, chunks)
+            if scores is not None:
+                scores = scores.tolist()
         else:
             print(f"Warning: Unknown ranking method '{self.method}'. Returning original order.")
+            return None
+
+        if scores is not None:
+            for chunk, chunk_score in zip(chunks, scores):
+                if 'metadata' not in chunk:
+                    chunk['metadata'] = {}
+                chunk['metadata']['relevance_score'] = chunk_score
+        return scores
+
+    def score_batch(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]]) -> List[Optional[Sequence[float]]]:
+        """
+        Scores many queries, each against its own candidate chunks, giving
+        the same scores as calling `score` for each pair. Work that does not
+        depend on the query is done once over the distinct candidate
+        contents of the whole batch: lowercasing for 'keyword_match', term
+        counting and BM25 weights for 'bm25', and a single sparse product of
+        all queries with all candidates for 'cosine' and 'dot'.
+        
+        Args:
+            queries (List[str]): The queries.
+            chunk_lists (List[List[Dict[str, Any]]]): The candidate chunks of each query.
+            
+        Returns:
+            List[Optional[Sequence[float]]]: The scores of each query, as from `score`.
+        """
+        if self.method == "keyword_match":
+            all_scores = self._keyword_match_scores_batch(queries, chunk_lists)
+        elif self.method == "bm25" and self.corpus_stats and self.corpus_stats.get("num_chunks"):
+            all_scores = self._bm25_scores_batch(queries, chunk_lists)
+        elif self.method in ("cosine", "dot") and self.tfidf_index is not None:
+            all_scores = self._tfidf_scores_batch(queries, chunk_lists)
+        else:
+            # Scores that depend on statistics of each candidate set are not shared.
+            return [self.score(query, chunks) for query, chunks in zip(queries, chunk_lists)]
+
+        for chunks, scores in zip(chunk_lists, all_scores):
+            if scores is None:
+                continue
+            for chunk, chunk_score in zip(chunks, scores):
+                if 'metadata' not in chunk:
+                    chunk['metadata'] = {}
+                chunk['metadata']['relevance_score'] = chunk_score
+        return all_scores
+
+    @staticmethod
+    def _content_rows(chunk_lists: List[List[Dict[str, Any]]]):
+        """
+        Maps every candidate to a row of the batch's distinct contents.
+        
+        Returns:
+            Tuple[List[str], List[np.ndarray]]: The distinct contents and, per
+                                                query, the row of each candidate.
+        """
+        row_of: Dict[str, int] = {}
+        rows = []
+        for chunks in chunk_lists:
+            rows.append(np.fromiter(
+                (row_of.setdefault(chunk.get("content", ""), len(row_of)) for chunk in chunks),
+                dtype=np.int64, count=len(chunks)
+            ))
+        return list(row_of), rows
+
+    def _keyword_match_scores_batch(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]]) -> List[Optional[List[int]]]:
+        """Batch form of `_keyword_match_scores`; each distinct content is lowercased once."""
+        contents, rows = self._content_rows(chunk_lists)
+        lowered = [content.lower() for content in contents]
+        all_scores = []
+        for query, query_rows in zip(queries, rows):
+            query_terms = set(query.lower().split())
+            if not query_terms:
+                all_scores.append(None)
+                continue
+            all_scores.append([sum(1 for term in query_terms if term in lowered[row]) for row in query_rows.tolist()])
+        return all_scores
+
+    def _bm25_scores_batch(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]]) -> List[Optional[np.ndarray]]:
+        """
+        Batch form of `_bm25_scores` with corpus statistics. Each distinct
+        content is tokenized once, and the saturated term weights of every
+        (content, query term) pair are computed in one array operation; each
+        query then sums its own terms for its own candidates.
+        """
+        contents, rows = self._content_rows(chunk_lists)
+        query_terms = [list(dict.fromkeys(query.lower().split())) for query in queries]
+        col_of: Dict[str, int] = {}
+        for terms in query_terms:
+            for term in terms:
+                col_of.setdefault(term, len(col_of))
+        if not col_of or not contents:
+            return [None] * len(queries)
+
+        vocabulary = list(col_of)
+        tf, lengths = self._term_frequencies(contents, col_of)
+
+        stats = self.corpus_stats
+        num_docs = stats["num_chunks"]
+        avg_length = stats["total_length"] / num_docs
+        doc_freqs = np.minimum(np.array([stats["doc_freqs"].get(term, 0) for term in vocabulary], dtype=np.float64), num_docs)
+        idf = np.log((num_docs - doc_freqs + 0.5) / (doc_freqs + 0.5) + 1.0)
+        norm = self.k1 * (1.0 - self.b + self.b * lengths / max(avg_length, 1e-9))
+        weights = tf * (self.k1 + 1.0) / (tf + norm[:, None])
+
+        all_scores = []
+        for terms, query_rows in zip(query_terms, rows):
+            if not terms or not query_rows.size:
+                all_scores.append(None)
+                continue
+            cols = np.array([col_of[term] for term in terms], dtype=np.int64)
+            all_scores.append((weights[np.ix_(query_rows, cols)] @ idf[cols]).tolist())
+        return all_scores
+
+    def _tfidf_scores_batch(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]]) -> List[Optional[List[float]]]:
+        """Batch form of `_tfidf_scores`: one sparse product of all queries with all distinct candidates."""
+        union: Dict[Any, int] = {}
+        union_chunks: List[Dict[str, Any]] = []
+        columns = []
+        for chunks in chunk_lists:
+            cols = []
+            for chunk in chunks:
+                key = (chunk.get("id"), chunk.get("content", ""))
+                if key not in union:
+                    union[key] = len(union_chunks)
+                    union_chunks.append(chunk)
+                cols.append(union[key])
+            columns.append(np.array(cols, dtype=np.int64))
+
+        active = [i for i, (query, chunks) in enumerate(zip(queries, chunk_lists)) if query.strip() and chunks]
+        all_scores: List[Optional[List[float]]] = [None] * len(queries)
+        if not active:
+            return all_scores
+        matrix = self.tfidf_index.score_batch([queries[i] for i in active], union_chunks,
+                                              normalize=(self.method == "cosine"))
+        for row, i in enumerate(active):
+            all_scores[i] = matrix[row, columns[i]].tolist()
+        return all_scores
+
+    def rank_batch(self, queries: List[str], chunk_lists: List[List[Dict[str, Any]]]) -> List[List[Dict[str, Any]]]:
+        """
+        Ranks each query's candidates like `rank`, scoring the whole batch with `score_batch`.
+        
+        Args:
+            queries (List[str]): The queries.
+            chunk_lists (List[List[Dict[str, Any]]]): The candidate chunks of each query.
+            
+        Returns:
+            List[List[Dict[str, Any]]]: The sorted candidates of each query.
+        """
+        ranked = []
+        for chunks, scores in zip(chunk_lists, self.score_batch(queries, chunk_lists)):
+            if scores is None:
+                ranked.append(chunks)
+                continue
+            order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+            ranked.append([chunks[i] for i in order])
+        return ranked
+
+    def rank(self, query: str, chunks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Applies the configured ranking method to the chunks.
+        
+        Args:
+            query (str): The user's query.
+            chunks (List[Dict[str, Any]]): The list of context chunks.
+            
+        Returns:
+            List[Dict[str, Any]]: The sorted list of context chunks.
+        """
+        scores = self.score(query, chunks)
+        if scores is None:
             return chunks
+        # Sort chunks by score in descending order; ties keep their original order
+        order = sorted(range(len(chunks)), key=lambda i: scores[i], reverse=True)
+        return [chunks[i] for i in order]
+
+    def iter_ranked(self, query: str, chunks: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yields chunks in the same order as `rank`, but lazily: scores are
+        heapified once and each chunk is popped only when the caller asks
+        for it, so consumers that stop early never pay for a full sort.
+        
+        Args:
+            query (str): The user's query.
+            chunks (List[Dict[str, Any]]): The list of context chunks.
+            
+        Yields:
+            Dict[str, Any]: Chunks in descending relevance order.
+        """
+        scores = self.score(query, chunks)
+        if scores is None:
+            yield from chunks
+            return
+        heap = [(-chunk_score, i) for i, chunk_score in enumerate(scores)]
+        heapq.heapify(heap)
+        while heap:
+            _, i = heapq.heappop(heap)
+            yield chunks[i]
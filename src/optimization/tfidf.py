@@ -0,0 +1,123 @@
+# path: src/optimization/tfidf.py
+
+from typing import List, Dict, Any, Iterable
+
+import numpy as np
+
+class TfidfIndex:
+    """
+    A sparse TF-IDF matrix over every chunk of the loaded sources.
+
+    The vocabulary and IDF weights are fitted once over the whole corpus and
+    each chunk's row is looked up by its id at query time, so scoring a
+    candidate set is one sparse matrix-vector product (or one sparse
+    matrix-matrix product for a batch of queries). Candidates that were not
+    indexed, e.g. chunks from a source that cannot enumerate its content,
+    are vectorized on the fly with the same vocabulary. So are chunks whose
+    id is missing or shared by several indexed chunks, since the id cannot
+    tell their rows apart.
+    """
+
+    def __init__(self, chunks: Iterable[Dict[str, Any]]):
+        """
+        Fits the vectorizer and builds the matrix.
+
+        Args:
+            chunks (Iterable[Dict[str, Any]]): All chunks of the corpus, each
+                                               with an 'id' and 'content'.
+        """
+        # scikit-learn is only imported when a TF-IDF ranking method is configured.
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        ids: List[str] = []
+        contents: List[str] = []
+        for chunk in chunks:
+            ids.append(chunk.get("id"))
+            contents.append(chunk.get("content", ""))
+
+        self.vectorizer = TfidfVectorizer(norm=None, sublinear_tf=True, dtype=np.float32)
+        self.fitted = any(content.strip() for content in contents)
+        if self.fitted:
+            try:
+                self.matrix = self.vectorizer.fit_transform(contents).tocsr()
+            except ValueError:
+                # Only stop words or no alphanumeric tokens anywhere.
+                self.fitted = False
+        if not self.fitted:
+            self.matrix = None
+            self.row_of: Dict[str, int] = {}
+            self.row_norms = np.zeros(0, dtype=np.float32)
+            return
+
+        # Only ids naming exactly one indexed chunk are looked up.
+        self.row_of = {}
+        shared = set()
+        for row, chunk_id in enumerate(ids):
+            if chunk_id is None or chunk_id in shared:
+                continue
+            if chunk_id in self.row_of:
+                del self.row_of[chunk_id]
+                shared.add(chunk_id)
+            else:
+                self.row_of[chunk_id] = row
+        self.row_norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=1)).ravel())
+
+    def __len__(self) -> int:
+        return 0 if self.matrix is None else self.matrix.shape[0]
+
+    def _candidate_rows(self, chunks: List[Dict[str, Any]]):
+        """
+        Returns the TF-IDF matrix of the candidates (in candidate order)
+        and the L2 norm of each row.
+        """
+        from scipy import sparse
+
+        rows = [self.row_of.get(chunk.get("id")) for chunk in chunks]
+        known = [pos for pos, row in enumerate(rows) if row is not None]
+        unknown = [pos for pos, row in enumerate(rows) if row is None]
+
+        if not unknown:
+            return self.matrix[rows], self.row_norms[rows]
+
+        extra = self.vectorizer.transform([chunks[pos].get("content", "") for pos in unknown]).tocsr()
+        extra_norms = np.sqrt(np.asarray(extra.multiply(extra).sum(axis=1)).ravel())
+        stacked = sparse.vstack([self.matrix[[rows[pos] for pos in known]], extra]).tocsr()
+        norms = np.concatenate([self.row_norms[[rows[pos] for pos in known]], extra_norms])
+        # Undo the known-then-unknown stacking so rows follow candidate order.
+        order = np.argsort(np.array(known + unknown, dtype=np.int64), kind="stable")
+        return stacked[order], norms[order]
+
+    def score_batch(self, queries: List[str], chunks: List[Dict[str, Any]], normalize: bool = True) -> np.ndarray:
+        """
+        Scores every candidate against every query with one sparse product.
+
+        Args:
+            queries (List[str]): The queries.
+            chunks (List[Dict[str, Any]]): The candidate chunks.
+            normalize (bool): True for cosine similarity, False for the raw
+                              TF-IDF dot product.
+
+        Returns:
+            np.ndarray: A (len(queries), len(chunks)) float32 score matrix.
+        """
+        if not self.fitted or not queries or not chunks:
+            return np.zeros((len(queries), len(chunks)), dtype=np.float32)
+
+        query_matrix = self.vectorizer.transform(queries).tocsr()
+        candidate_matrix, candidate_norms = self._candidate_rows(chunks)
+        scores = np.asarray((query_matrix @ candidate_matrix.T).todense(), dtype=np.float32)
+
+        if normalize:
+            query_norms = np.sqrt(np.asarray(query_matrix.multiply(query_matrix).sum(axis=1)).ravel())
+            denominator = np.outer(query_norms, candidate_norms)
+            np.divide(scores, denominator, out=scores, where=denominator > 0)
+        return scores
+
+    def score(self, query: str, chunks: List[Dict[str, Any]], normalize: bool = True) -> np.ndarray:
+        """
+        Scores the candidates against one query with one sparse matrix-vector product.
+
+        Returns:
+            np.ndarray: One float32 score per chunk.
+        """
+        return self.score_batch([query], chunks, normalize=normalize)[0]
@@ -1,7 +1,12 @@
 # path: src/optimization/token_budget.py
 
-from typing import List, Dict, Any
+from itertools import islice
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set, Tuple
+
+import numpy as np
+
 from ..utils.tokenizer import Tokenizer
+from ..utils.result_cache import ResultCache
 
 class TokenBudgetManager:
     """
@@ -9,44 +14,291 @@ class TokenBudgetManager:
     exceed the LLM's context window limit.
     """
 
-    def __init__(self, max_tokens: int, tokenizer_model: str):
+    # Upper bound on the 'dp' packer's choice table (items x capacity cells).
+    DP_MAX_CELLS = 1 << 22
+
+    def __init__(self, max_tokens: int, tokenizer_model: str, token_cache_size: int = 100000,
+                 count_batch_size: int = 64, packing: str = "sequential", truncate_last: bool = False,
+                 dp_max_items: int = 256, min_truncate_tokens: int = 16):
         """
         Initializes the TokenBudgetManager.
         
         Args:
             max_tokens (int): The maximum number of tokens allowed in the context.
             tokenizer_model (str): The model name for the tiktoken tokenizer.
+            token_cache_size (int): Size of the tokenizer's token-count cache.
+            count_batch_size (int): Number of chunks whose tokens are counted
+                                    together in one batch call.
+            packing (str): How chunks are admitted to the budget.
+                           'sequential' adds chunks in order and stops at the
+                           first one that does not fit.
+                           'greedy' admits chunks by relevance per token.
+                           'dp' solves a 0/1 knapsack over relevance scores.
+                           Packed chunks keep their ranked order in the output.
+            truncate_last (bool): Fill leftover space with a token-boundary
+                                  prefix of the best chunk that did not fit.
+            dp_max_items (int): Number of top-ranked chunks the 'dp' packer
+                                optimizes over; the rest only fill leftover space.
+            min_truncate_tokens (int): Smallest content prefix worth adding
+                                       when truncating.
         """
         self.max_tokens = max_tokens
-        self.tokenizer = Tokenizer(tokenizer_model)
+        self.tokenizer = Tokenizer(tokenizer_model, cache_size=token_cache_size)
+        self.count_batch_size = max(1, count_batch_size)
+        self.packing = packing
+        self.truncate_last = truncate_last
+        self.dp_max_items = dp_max_items
+        self.min_truncate_tokens = min_truncate_tokens
+        # Token cost of each chunk's formatted entry, keyed by the chunk's
+        # `cost_key`, so known chunks are costed without rendering anything.
+        self.entry_costs = ResultCache(max_entries=token_cache_size, ttl_seconds=0)
+
+    def _format_entry(self, chunk: Dict[str, Any], content: Optional[str] = None) -> str:
+        """Formats a chunk with its source for clarity."""
+        if content is None:
+            content = chunk.get('content', '')
+        return f"Source: {chunk.get('source', 'unknown')}\nContent: {content}\n---\n"
 
-    def construct_context(self, chunks: List[Dict[str, Any]]) -> str:
+    def _entry_costs(self, chunks: List[Dict[str, Any]]) -> Tuple[List[int], Dict[int, str]]:
+        """
+        Returns the token count of each chunk's formatted entry.
+        
+        Chunks with a cached cost (see `Chunk.cost_key`) are neither rendered
+        nor formatted; the others are formatted and counted in one batch.
+        
+        Returns:
+            Tuple[List[int], Dict[int, str]]: The counts, and the entries that
+                had to be formatted by position, for reuse by the caller.
+        """
+        costs = [0] * len(chunks)
+        formatted: Dict[int, str] = {}
+        for pos, chunk in enumerate(chunks):
+            cost_key = getattr(chunk, "cost_key", None)
+            cost = self.entry_costs.get(cost_key) if cost_key is not None else None
+            if cost is None:
+                formatted[pos] = self._format_entry(chunk)
+            else:
+                costs[pos] = cost
+        if formatted:
+            counts = self.tokenizer.count_tokens_batch(list(formatted.values()))
+            for pos, count in zip(formatted, counts):
+                costs[pos] = count
+                cost_key = getattr(chunks[pos], "cost_key", None)
+                if cost_key is not None:
+                    self.entry_costs.put(cost_key, count)
+        return costs, formatted
+
+    def construct_context(self, chunks: Iterable[Dict[str, Any]]) -> str:
         """
         Constructs the final context string from chunks, respecting the token limit.
-        It iterates through ranked and deduplicated chunks, adding them until the
-        budget is nearly full.
+        In the default 'sequential' mode it iterates through ranked and
+        deduplicated chunks, adding them until the budget is nearly full.
+        Chunks are pulled one counting batch at a time, so a lazy iterable
+        (e.g. `Deduplicator.iter_unique`) is not consumed past the batch in
+        which the budget fills up, and entry strings are only built for
+        admitted chunks and for cost-cache misses.
         
         Args:
-            chunks (List[Dict[str, Any]]): A list of chunks, sorted by importance.
+            chunks (Iterable[Dict[str, Any]]): Chunks, sorted by importance.
             
         Returns:
             str: A single string containing the formatted context.
         """
+        if self.packing in ("greedy", "dp"):
+            return self._construct_packed(list(chunks))
+
         final_context = []
         current_tokens = 0
+        remaining = iter(chunks)
 
-        for chunk in chunks:
-            # Format the chunk content with its source for clarity
-            content_str = f"Source: {chunk.get('source', 'unknown')}\nContent: {chunk.get('content', '')}\n---\n"
+        while True:
+            batch = list(islice(remaining, self.count_batch_size))
+            if not batch:
+                break
+            token_counts, formatted = self._entry_costs(batch)
+
+            for offset, (chunk, chunk_token_count) in enumerate(zip(batch, token_counts)):
+                if current_tokens + chunk_token_count <= self.max_tokens:
+                    final_context.append(formatted.get(offset) or self._format_entry(chunk))
+                    current_tokens += chunk_token_count
+                else:
+                    # Stop adding chunks if the next one would exceed the budget
+                    print(f"Token budget reached. Stopping context construction. Total tokens: {current_tokens}")
+                    if self.truncate_last:
+                        partial = self._truncate_entry(chunk, self.max_tokens - current_tokens)
+                        if partial:
+                            final_context.append(partial)
+                    return "".join(final_context)
+        
+        return "".join(final_context)
+
+    def prefetch_token_counts(self, chunk_lists: List[List[Dict[str, Any]]]):
+        """
+        Counts the tokens of the entries that `construct_context` will need
+        for several chunk lists in one batched call, so entries shared by
+        many lists are encoded once and later lookups hit the token cache.
+        In 'sequential' mode only the first counting batch of each list is
+        prefetched, since construction often stops inside it.
+        
+        Args:
+            chunk_lists (List[List[Dict[str, Any]]]): Chunk lists about to be
+                                                       passed to `construct_context`.
+        """
+        if self.tokenizer.cache_size <= 0:
+            return
+        limit = None if self.packing in ("greedy", "dp") else self.count_batch_size
+        entries: Dict[str, List[Any]] = {}
+        for chunks in chunk_lists:
+            for chunk in chunks[:limit]:
+                cost_key = getattr(chunk, "cost_key", None)
+                if cost_key is not None and self.entry_costs.get(cost_key) is not None:
+                    continue
+                entries.setdefault(self._format_entry(chunk), []).append(cost_key)
+        # Keep the prefetch within the cache so it cannot evict itself.
+        texts = list(entries)[:self.tokenizer.cache_size]
+        for text, count in zip(texts, self.tokenizer.count_tokens_batch(texts)):
+            for cost_key in entries[text]:
+                if cost_key is not None:
+                    self.entry_costs.put(cost_key, count)
+
+    def iter_admitted(self, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily admits chunks in order with 'sequential' semantics, counting
+        tokens only for the chunk about to be admitted and stopping at the
+        first one that does not fit (after truncating it if `truncate_last`).
+        
+        Args:
+            chunks (Iterable[Dict[str, Any]]): Chunks, sorted by importance.
             
-            chunk_token_count = self.tokenizer.count_tokens(content_str)
+        Yields:
+            Dict[str, Any]: For each admitted chunk, 'chunk', its formatted
+                            'text', its 'tokens', the running 'total_tokens'
+                            and whether it was 'truncated'.
             
+        Raises:
+            ValueError: If `packing` is not 'sequential'.
+        """
+        if self.packing != "sequential":
+            raise ValueError(f"Lazy admission requires 'sequential' packing, not '{self.packing}'.")
+        current_tokens = 0
+        for chunk in chunks:
+            (chunk_token_count,), formatted = self._entry_costs([chunk])
             if current_tokens + chunk_token_count <= self.max_tokens:
-                final_context.append(content_str)
                 current_tokens += chunk_token_count
-            else:
-                # Stop adding chunks if the next one would exceed the budget
-                print(f"Token budget reached. Stopping context construction. Total tokens: {current_tokens}")
+                content_str = formatted.get(0) or self._format_entry(chunk)
+                yield {"chunk": chunk, "text": content_str, "tokens": chunk_token_count,
+                       "total_tokens": current_tokens, "truncated": False}
+                continue
+
+            if self.truncate_last:
+                partial = self._truncate_entry(chunk, self.max_tokens - current_tokens)
+                if partial:
+                    partial_tokens = self.tokenizer.count_tokens(partial)
+                    current_tokens += partial_tokens
+                    yield {"chunk": chunk, "text": partial, "tokens": partial_tokens,
+                           "total_tokens": current_tokens, "truncated": True}
+            return
+
+    def _construct_packed(self, chunks: List[Dict[str, Any]]) -> str:
+        """
+        Selects the subset of chunks with the highest total `relevance_score`
+        that fits in the budget, then fills any leftover space in ranked order.
+        """
+        token_counts, formatted = self._entry_costs(chunks)
+        values = [float(chunk.get('metadata', {}).get('relevance_score', 0) or 0) for chunk in chunks]
+
+        if self.packing == "dp":
+            selected = self._pack_dp(token_counts, values)
+        else:
+            selected = self._pack_greedy(token_counts, values)
+
+        used_tokens = sum(token_counts[i] for i in selected)
+        for i, count in enumerate(token_counts):
+            if i not in selected and used_tokens + count <= self.max_tokens:
+                selected.add(i)
+                used_tokens += count
+
+        entries = {i: formatted.get(i) or self._format_entry(chunks[i]) for i in selected}
+        if self.truncate_last:
+            skipped = next((i for i in range(len(chunks)) if i not in selected), None)
+            if skipped is not None:
+                partial = self._truncate_entry(chunks[skipped], self.max_tokens - used_tokens)
+                if partial:
+                    entries[skipped] = partial
+
+        return "".join(entries[i] for i in sorted(entries))
+
+    def _pack_greedy(self, token_counts: List[int], values: List[float]) -> Set[int]:
+        """Admits chunks in order of relevance per token, skipping those that do not fit."""
+        selected = set()
+        used_tokens = 0
+        order = sorted(range(len(token_counts)), key=lambda i: (-values[i] / max(token_counts[i], 1), i))
+        for i in order:
+            if values[i] <= 0:
                 break
-        
-        return "".join(final_context)
+            if used_tokens + token_counts[i] <= self.max_tokens:
+                selected.add(i)
+                used_tokens += token_counts[i]
+        return selected
+
+    def _pack_dp(self, token_counts: List[int], values: List[float]) -> Set[int]:
+        """
+        Solves the 0/1 knapsack over the top `dp_max_items` chunks with a
+        capacity-indexed value table, updated one item at a time with array ops.
+
+        The table is bounded by DP_MAX_CELLS: the capacity is first cut to the
+        items' total size, and if that is still too large, token counts are
+        measured in coarser units (rounded up, with the capacity rounded
+        down), so the selection always fits the real budget.
+        """
+        if self.max_tokens <= 0:
+            return set()
+        items = [
+            i for i in range(min(len(token_counts), self.dp_max_items))
+            if values[i] > 0 and token_counts[i] <= self.max_tokens
+        ]
+        if not items:
+            return set()
+        total = sum(token_counts[i] for i in items)
+        if total <= self.max_tokens:
+            return set(items)
+        unit = -(-len(items) * (total + 1) // self.DP_MAX_CELLS)
+        weights = [-(-token_counts[i] // unit) for i in items]
+        capacity = min(self.max_tokens, total) // unit
+        best = np.zeros(capacity + 1)
+        taken = np.zeros((len(items), capacity + 1), dtype=bool)
+
+        for row, i in enumerate(items):
+            weight = weights[row]
+            if weight > capacity:
+                continue
+            with_item = best[:capacity + 1 - weight] + values[i]
+            improves = with_item > best[weight:]
+            taken[row, weight:] = improves
+            best[weight:] = np.where(improves, with_item, best[weight:])
+
+        selected = set()
+        remaining = capacity
+        for row in range(len(items) - 1, -1, -1):
+            if taken[row, remaining]:
+                i = items[row]
+                selected.add(i)
+                remaining -= weights[row]
+        return selected
+
+    def _truncate_entry(self, chunk: Dict[str, Any], available_tokens: int) -> Optional[str]:
+        """
+        Builds a formatted entry whose content is cut at a token boundary so
+        the whole entry fits in `available_tokens`, or None if too little
+        space is left to be useful.
+        """
+        overhead = self.tokenizer.count_tokens(self._format_entry(chunk, content=""))
+        content_budget = available_tokens - overhead
+        content = chunk.get('content', '')
+        while content_budget >= self.min_truncate_tokens:
+            entry = self._format_entry(chunk, content=self.tokenizer.truncate(content, content_budget))
+            # Tokens can merge differently at the seams, so re-check the whole entry.
+            if self.tokenizer.count_tokens(entry) <= available_tokens:
+                return entry
+            content_budget -= 1
+        return None
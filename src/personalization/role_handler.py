@@ -1,4 +1,6 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+from ..data_sources.chunk import chunk_tags, tag_bitmap
 
 class RoleHandler:
     """
@@ -13,6 +15,11 @@ class RoleHandler:
             roles_config (Dict[str, Any]): The loaded user roles configuration.
         """
         self.roles = roles_config.get("roles", {})
+        # Each role's 'filter_by_tags' compiled to a tag bitmap (None: no filter).
+        self._tag_masks = {
+            role: tag_bitmap(set((definition or {}).get("permissions", {}).get("filter_by_tags", []) or [])) or None
+            for role, definition in self.roles.items()
+        }
 
     def get_permissions(self, role: str) -> Dict[str, Any]:
         """
@@ -31,6 +38,26 @@ class RoleHandler:
             raise ValueError(f"Role '{role}' is not defined in user_roles.yaml.")
         return self.roles[role].get("permissions", {})
 
+    def get_tag_mask(self, role: str) -> Optional[int]:
+        """
+        Returns the role's tag filter as a bitmap for sources to apply while
+        retrieving (see `tag_mask_allows`), so chunks the role cannot see are
+        never built.
+        
+        Args:
+            role (str): The name of the role.
+            
+        Returns:
+            Optional[int]: The bitmap of the role's allowed tags, or None if
+                           the role does not filter by tags.
+            
+        Raises:
+            ValueError: If the role is not defined in the configuration.
+        """
+        if role not in self._tag_masks:
+            raise ValueError(f"Role '{role}' is not defined in user_roles.yaml.")
+        return self._tag_masks[role]
+
     def filter_context_by_role(self, chunks: List[Dict[str, Any]], role: str) -> List[Dict[str, Any]]:
         """
         Filters a list of context chunks based on the user's role permissions.
@@ -43,20 +70,32 @@ class RoleHandler:
         Returns:
             List[Dict[str, Any]]: A filtered list of chunks the user is allowed to see.
         """
+        return list(self.iter_filtered_by_role(chunks, role))
+
+    def iter_filtered_by_role(self, chunks: Iterable[Dict[str, Any]], role: str) -> Iterator[Dict[str, Any]]:
+        """
+        Lazily yields the chunks `filter_context_by_role` would keep.
+        
+        Args:
+            chunks (Iterable[Dict[str, Any]]): The context chunks.
+            role (str): The user's role.
+            
+        Yields:
+            Dict[str, Any]: Chunks the user is allowed to see. Nothing is
+                            yielded if the role is invalid.
+        """
         try:
             permissions = self.get_permissions(role)
         except ValueError:
-            return [] # Return empty if role is invalid
+            return # Yield nothing if role is invalid
 
         allowed_tags = set(permissions.get("filter_by_tags", []))
         if not allowed_tags:
-            return chunks # If no tags are specified, allow all
+            yield from chunks # If no tags are specified, allow all
+            return
 
-        permitted_chunks = []
         for chunk in chunks:
-            chunk_tags = set(chunk.get("metadata", {}).get("tags", []))
+            tags = chunk_tags(chunk)
             # If a chunk has no tags, or if its tags intersect with allowed tags, permit it.
-            if not chunk_tags or chunk_tags.intersection(allowed_tags):
-                permitted_chunks.append(chunk)
-                
-        return permitted_chunks
+            if not tags or not allowed_tags.isdisjoint(tags):
+                yield chunk
@@ -1,12 +1,18 @@
 # path: src/retrieval/context_retriever.py
 
-from typing import List, Dict, Any
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import List, Dict, Any, Callable, Optional
 
 # Import all available data source classes
+from ..data_sources.base import BaseContextSource
 from ..data_sources.tasks import TaskContextSource
 from ..data_sources.graphiti import GraphitiContextSource
 from ..data_sources.documents import DocumentContextSource
 from ..data_sources.semantic_search import SemanticSearchSource
+from ..data_sources.chunk import chunk_tags, tag_bitmap, tag_mask_allows
 
 class ContextRetriever:
     """
@@ -15,8 +21,30 @@ class ContextRetriever:
 
     def __init__(self, config: Dict[str, Any]):
         self.config = config.get("data_sources", {})
+        retrieval_config = config.get("retrieval", {}) or {}
+        # 'sequential' queries sources one after another; 'parallel' fans out on a thread pool.
+        self.mode = retrieval_config.get("mode", "sequential")
+        self.source_timeout = retrieval_config.get("source_timeout", 5.0)
+        self.max_workers = retrieval_config.get("max_workers")
+        # Queries expected to fan out at once; sizes the default worker pool.
+        self.concurrent_queries = retrieval_config.get("concurrent_queries", 4)
+        # Directory for on-disk index snapshots of the sources (None disables them).
+        self.snapshot_dir = retrieval_config.get("snapshot_dir")
+        # Seconds between checks of the sources' data files for changes (None disables hot reload).
+        self.reload_interval = retrieval_config.get("reload_interval")
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        # Calls that missed their deadline and are still running, by source name.
+        self._stuck_calls: Dict[str, Any] = {}
+        self._stuck_lock = threading.Lock()
+        self._reload_listeners: List[Callable[[List[str]], None]] = []
+        self._reload_lock = threading.Lock()
+        self._reload_stop = threading.Event()
+        self._reload_thread = None
         self.sources = {}
         self._initialize_sources()
+        if self.reload_interval:
+            self.start_reloading()
 
     def _initialize_sources(self):
         """
@@ -33,6 +61,8 @@ class ContextRetriever:
         for key, source_config in self.config.items():
             if source_config.get("enabled", False):
                 if key in source_class_map:
+                    if self.snapshot_dir and "snapshot_dir" not in source_config:
+                        source_config = dict(source_config, snapshot_dir=self.snapshot_dir)
                     try:
                         self.sources[key] = source_class_map[key](source_config)
                     except ValueError:
@@ -40,7 +70,7 @@ class ContextRetriever:
                 else:
                     pass
 
-    def retrieve(self, query: str, allowed_sources: List[str] = None) -> List[Dict[str, Any]]:
+    def retrieve(self, query: str, allowed_sources: List[str] = None, tag_mask: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Retrieves context from all specified and allowed data sources.
         
@@ -49,21 +79,347 @@ class ContextRetriever:
             allowed_sources (List[str]): A list of source keys that are
                                          permitted for the current query.
                                          If None, all initialized sources are used.
+            tag_mask (Optional[int]): A role's tag filter (`RoleHandler.get_tag_mask`).
+                                      Sources skip chunks it rejects while
+                                      retrieving; None returns all chunks.
                                          
         Returns:
             List[Dict[str, Any]]: An aggregated list of context chunks from all queried sources.
         """
-        all_chunks = []
+        return self.retrieve_with_status(query, allowed_sources, tag_mask)["chunks"]
+
+    def retrieve_with_status(self, query: str, allowed_sources: List[str] = None,
+                             tag_mask: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Retrieves context like `retrieve` and reports how each source fared.
+        In 'parallel' mode sources are queried concurrently and a source that
+        misses its deadline is reported as 'timeout' and contributes nothing;
+        the results of the other sources are still returned.
+        
+        Args:
+            query (str): The user's query.
+            allowed_sources (List[str]): Source keys permitted for this query.
+                                         If None, all initialized sources are used.
+            tag_mask (Optional[int]): A role's tag filter, as for `retrieve`.
+                                         
+        Returns:
+            Dict[str, Any]: 'chunks', the aggregated context chunks in source
+                            order, and 'sources', mapping each queried source
+                            to its 'status' ('ok', 'error' or 'timeout'),
+                            'elapsed_ms', 'num_chunks' and, on failure, 'error'.
+        """
+        sources_to_query = self._select_sources(allowed_sources)
+
+        if self.mode == "parallel" and len(sources_to_query) > 1:
+            outcomes = self._retrieve_parallel(query, sources_to_query, tag_mask)
+        else:
+            outcomes = {name: self._query_source(source_instance, query, tag_mask)
+                        for name, source_instance in sources_to_query.items()}
+        return self._collect(outcomes)
+
+    async def aretrieve(self, query: str, allowed_sources: List[str] = None,
+                        tag_mask: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Asynchronous counterpart of `retrieve`.
+        
+        Args:
+            query (str): The user's query.
+            allowed_sources (List[str]): Source keys permitted for this query.
+                                         If None, all initialized sources are used.
+            tag_mask (Optional[int]): A role's tag filter, as for `retrieve`.
+                                         
+        Returns:
+            List[Dict[str, Any]]: An aggregated list of context chunks from all queried sources.
+        """
+        return (await self.aretrieve_with_status(query, allowed_sources, tag_mask))["chunks"]
+
+    async def aretrieve_with_status(self, query: str, allowed_sources: List[str] = None,
+                                    tag_mask: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Asynchronous counterpart of `retrieve_with_status`.
+        All sources are awaited concurrently, each bounded by its own timeout
+        regardless of the configured mode. Sources without a native `aretrieve`
+        run on the retriever's worker pool and, like in parallel mode, are
+        skipped while a call that timed out earlier is still running.
         
-        sources_to_query = self.sources
-        if allowed_sources is not None:
-            sources_to_query = {key: self.sources[key] for key in allowed_sources if key in self.sources}
+        Args:
+            query (str): The user's query.
+            allowed_sources (List[str]): Source keys permitted for this query.
+                                         If None, all initialized sources are used.
+            tag_mask (Optional[int]): A role's tag filter, as for `retrieve`.
+                                         
+        Returns:
+            Dict[str, Any]: 'chunks' and per-source 'sources' status, as from `retrieve_with_status`.
+        """
+        sources_to_query = self._select_sources(allowed_sources)
 
-        for source_name, source_instance in sources_to_query.items():
+        async def query_source(name, source_instance):
+            start = time.perf_counter()
+            timeout = self._source_timeout(name)
+            if not self._has_native_aretrieve(source_instance):
+                return await self._aquery_on_pool(name, source_instance, query, tag_mask, timeout, start)
             try:
-                chunks = source_instance.retrieve(query)
-                all_chunks.extend(chunks)
-            except Exception:
-                pass
+                if self._applies_tag_mask(source_instance, tag_mask):
+                    chunks = await asyncio.wait_for(source_instance.aretrieve(query, tag_mask=tag_mask), timeout=timeout)
+                else:
+                    chunks = self._filter_by_tag_mask(
+                        await asyncio.wait_for(source_instance.aretrieve(query), timeout=timeout), tag_mask
+                    )
+                status = {"status": "ok", "num_chunks": len(chunks)}
+            except asyncio.TimeoutError:
+                chunks = []
+                status = {"status": "timeout", "num_chunks": 0, "error": f"no result within {timeout}s"}
+            except Exception as e:
+                chunks = []
+                status = {"status": "error", "num_chunks": 0, "error": f"{type(e).__name__}: {e}"}
+            status["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+            return chunks, status
+
+        names = list(sources_to_query)
+        results = await asyncio.gather(*(query_source(name, sources_to_query[name]) for name in names))
+        return self._collect(dict(zip(names, results)))
+
+    @staticmethod
+    def _has_native_aretrieve(source_instance) -> bool:
+        """Whether a source overrides `aretrieve` instead of running `retrieve` on an executor."""
+        aretrieve = getattr(type(source_instance), "aretrieve", None)
+        return aretrieve is not None and aretrieve is not BaseContextSource.aretrieve
+
+    async def _aquery_on_pool(self, name: str, source_instance, query: str, tag_mask: Optional[int],
+                              timeout: float, start: float):
+        """
+        Awaits a blocking source call submitted to the worker pool. A call that
+        misses its deadline is recorded as stuck rather than left running
+        untracked on the event loop's default executor.
+        """
+        call = self._submit_call(name, source_instance, query, tag_mask)
+        if call is None:
+            return self._timeout_outcome(0.0, "a call that timed out earlier is still running")
+        _, future = call
+        try:
+            chunks, status = await asyncio.wait_for(asyncio.wrap_future(future), timeout=timeout)
+        except asyncio.TimeoutError:
+            elapsed_ms = (time.perf_counter() - start) * 1000.0
+            # Timing out cancels the call if it never reached a worker.
+            if future.cancelled():
+                return self._timeout_outcome(elapsed_ms, f"no worker free within {timeout}s")
+            self._mark_stuck(name, future)
+            return self._timeout_outcome(elapsed_ms, f"no result within {timeout}s")
+        status["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+        return chunks, status
+
+    def _collect(self, outcomes: Dict[str, Any]) -> Dict[str, Any]:
+        """Merges per-source (chunks, status) outcomes in source order."""
+        all_chunks = []
+        statuses = {}
+        for source_name, (chunks, status) in outcomes.items():
+            all_chunks.extend(chunks)
+            statuses[source_name] = status
+            if status["status"] != "ok":
+                print(f"Warning: Source '{source_name}' {status['status']}: {status.get('error', '')}")
+
+        return {"chunks": all_chunks, "sources": statuses}
+
+    def _select_sources(self, allowed_sources: List[str] = None) -> Dict[str, Any]:
+        """Returns the initialized sources permitted for a query."""
+        if allowed_sources is None:
+            return self.sources
+        return {key: self.sources[key] for key in allowed_sources if key in self.sources}
+
+    @staticmethod
+    def _applies_tag_mask(source_instance, tag_mask: Optional[int]) -> bool:
+        """Whether a tag filter is set and the source applies it while retrieving."""
+        return tag_mask is not None and getattr(source_instance, "SUPPORTS_TAG_MASK", False)
+
+    @staticmethod
+    def _filter_by_tag_mask(chunks: List[Dict[str, Any]], tag_mask: Optional[int]) -> List[Dict[str, Any]]:
+        """Applies a tag filter to chunks returned by a source that does not support it."""
+        if tag_mask is None:
+            return chunks
+        return [chunk for chunk in chunks if tag_mask_allows(tag_mask, tag_bitmap(chunk_tags(chunk)))]
+
+    def _query_source(self, source_instance, query: str, tag_mask: Optional[int] = None):
+        """Queries one source, capturing its chunks, status and elapsed time."""
+        start = time.perf_counter()
+        try:
+            if self._applies_tag_mask(source_instance, tag_mask):
+                chunks = source_instance.retrieve(query, tag_mask=tag_mask)
+            else:
+                chunks = self._filter_by_tag_mask(source_instance.retrieve(query), tag_mask)
+            status = {"status": "ok", "num_chunks": len(chunks)}
+        except Exception as e:
+            chunks = []
+            status = {"status": "error", "num_chunks": 0, "error": f"{type(e).__name__}: {e}"}
+        status["elapsed_ms"] = (time.perf_counter() - start) * 1000.0
+        return chunks, status
+
+    def _source_timeout(self, source_name: str) -> float:
+        """Returns the deadline for a source, preferring its own 'timeout' setting."""
+        return (self.config.get(source_name, {}) or {}).get("timeout", self.source_timeout)
+
+    def _retrieve_parallel(self, query: str, sources_to_query: Dict[str, Any], tag_mask: Optional[int] = None):
+        """
+        Submits every source to the thread pool at once and collects results
+        in source order. Each source's deadline runs from when its call
+        actually starts; time spent queued for a worker is bounded by the
+        same deadline, and a call still queued at that point is cancelled.
+        A call that times out keeps running in its worker (threads cannot be
+        interrupted), so the source is not queried again until it returns.
+        """
+        outcomes = {}
+        calls = {}
+        for name, source_instance in sources_to_query.items():
+            call = self._submit_call(name, source_instance, query, tag_mask)
+            if call is None:
+                outcomes[name] = self._timeout_outcome(0.0, "a call that timed out earlier is still running")
+            else:
+                calls[name] = call
+
+        submitted = time.perf_counter()
+        for name, (started, future) in calls.items():
+            timeout = self._source_timeout(name)
+            if not started["event"].wait(max(0.0, submitted + timeout - time.perf_counter())) and future.cancel():
+                outcomes[name] = self._timeout_outcome(
+                    (time.perf_counter() - submitted) * 1000.0, f"no worker free within {timeout}s"
+                )
+                continue
+            started["event"].wait()
+            try:
+                outcomes[name] = future.result(timeout=max(0.0, started["at"] + timeout - time.perf_counter()))
+            except FutureTimeoutError:
+                self._mark_stuck(name, future)
+                outcomes[name] = self._timeout_outcome(
+                    (time.perf_counter() - started["at"]) * 1000.0, f"no result within {timeout}s"
+                )
+        return {name: outcomes[name] for name in sources_to_query}
+
+    def _submit_call(self, name: str, source_instance, query: str, tag_mask: Optional[int] = None):
+        """
+        Submits a source call to the worker pool, unless an earlier call to the
+        source timed out and is still running.
+
+        Returns:
+            The call's (started, future) pair, or None if the source is stuck.
+        """
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers or max(1, len(self.sources)) * max(1, self.concurrent_queries),
+                    thread_name_prefix="context-source"
+                )
+            executor = self._executor
+        # Checked and submitted under one lock, so concurrent queries cannot
+        # both find a stuck source free and each start a new call to it.
+        with self._stuck_lock:
+            stuck = self._stuck_calls.get(name)
+            if stuck is not None:
+                if not stuck.done():
+                    return None
+                del self._stuck_calls[name]
+            started = {"event": threading.Event(), "at": None}
+            return started, executor.submit(self._run_started, started, source_instance, query, tag_mask)
+
+    def _mark_stuck(self, name: str, future):
+        """Records a call that missed its deadline, so the source is skipped until it returns."""
+        with self._stuck_lock:
+            self._stuck_calls[name] = future
+
+    def _run_started(self, started: Dict[str, Any], source_instance, query: str, tag_mask: Optional[int] = None):
+        """Runs `_query_source` on a worker after recording when the call started."""
+        started["at"] = time.perf_counter()
+        started["event"].set()
+        return self._query_source(source_instance, query, tag_mask)
+
+    @staticmethod
+    def _timeout_outcome(elapsed_ms: float, error: str):
+        """Returns the (chunks, status) outcome of a source that timed out."""
+        return [], {"status": "timeout", "num_chunks": 0, "elapsed_ms": elapsed_ms, "error": error}
+
+    def reload_changed(self) -> List[str]:
+        """
+        Checks each source's data file once and swaps in an updated source
+        for every file that changed. Each swap replaces one dict entry, so a
+        query sees either the old or the new source, and queries already
+        running keep reading the instance they started with.
+        
+        Returns:
+            List[str]: The names of the reloaded sources.
+        """
+        reloaded = []
+        with self._reload_lock:
+            for name, source_instance in list(self.sources.items()):
+                try:
+                    updated = source_instance.reloaded()
+                except Exception as e:
+                    print(f"Warning: Reloading source '{name}' failed: {type(e).__name__}: {e}")
+                    continue
+                if updated is not None:
+                    self.sources[name] = updated
+                    reloaded.append(name)
+        if reloaded:
+            for listener in list(self._reload_listeners):
+                listener(reloaded)
+        return reloaded
+
+    def add_reload_listener(self, listener: Callable[[List[str]], None]):
+        """Registers a callback run with the names of the sources after each reload."""
+        self._reload_listeners.append(listener)
+
+    def start_reloading(self, interval: float = None):
+        """
+        Starts a background thread that polls the sources' data files
+        (size and mtime) and reloads changed sources incrementally.
+        
+        Args:
+            interval (float): Seconds between checks; defaults to 'reload_interval'.
+        """
+        if self._reload_thread is not None:
+            return
+        interval = interval or self.reload_interval or 5.0
+        self._reload_stop.clear()
+
+        def watch():
+            while not self._reload_stop.wait(interval):
+                self.reload_changed()
+
+        self._reload_thread = threading.Thread(target=watch, name="context-source-reload", daemon=True)
+        self._reload_thread.start()
+
+    def stop_reloading(self):
+        """Stops the hot-reload thread, if running."""
+        if self._reload_thread is not None:
+            self._reload_stop.set()
+            self._reload_thread.join()
+            self._reload_thread = None
+
+    def close(self):
+        """Shuts down the worker pool used by 'parallel' mode and the hot-reload thread, if any."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self.stop_reloading()
+
+    def get_corpus_stats(self, allowed_sources: List[str] = None) -> Dict[str, Any]:
+        """
+        Aggregates the term statistics of the initialized data sources.
+        
+        Args:
+            allowed_sources (List[str]): Source keys to include. If None,
+                                         all initialized sources are used.
+                                         
+        Returns:
+            Dict[str, Any]: Combined 'num_chunks', 'total_length' and 'doc_freqs'.
+        """
+        combined = {"num_chunks": 0, "total_length": 0, "doc_freqs": {}}
+        doc_freqs = combined["doc_freqs"]
+
+        for key, source_instance in self.sources.items():
+            if allowed_sources is not None and key not in allowed_sources:
+                continue
+            stats = source_instance.get_corpus_stats()
+            combined["num_chunks"] += stats.get("num_chunks", 0)
+            combined["total_length"] += stats.get("total_length", 0)
+            for term, df in stats.get("doc_freqs", {}).items():
+                doc_freqs[term] = doc_freqs.get(term, 0) + df
 
-        return all_chunks
\ No newline at end of file
+        return combined
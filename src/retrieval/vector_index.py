@@ -0,0 +1,138 @@
+# path: src/retrieval/vector_index.py
+
+import os
+from typing import Optional, Tuple
+
+import numpy as np
+
+class VectorIndex:
+    """
+    Top-k inner-product search over a contiguous float32 embedding matrix.
+
+    Two modes are supported:
+    - 'flat' scores every vector with a single matrix-vector product (exact).
+    - 'ivf' clusters the vectors around `nlist` centroids (a coarse
+      quantizer) and only scores the vectors in the `nprobe` lists whose
+      centroids are closest to the query (approximate, for very large corpora).
+
+    The matrix may be a read-only memory map, so the index can be larger
+    than the working set and loads without copying.
+    """
+
+    def __init__(self, vectors: np.ndarray, nprobe: int = 8):
+        """
+        Initializes a flat index over existing vectors.
+
+        Args:
+            vectors (np.ndarray): A (n, dim) float32 matrix, ideally C-contiguous.
+            nprobe (int): Number of inverted lists scanned per query in 'ivf' mode.
+        """
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.centroids: Optional[np.ndarray] = None
+        self.list_order: Optional[np.ndarray] = None
+        self.list_offsets: Optional[np.ndarray] = None
+
+    @property
+    def index_type(self) -> str:
+        """'ivf' once a coarse quantizer has been trained or loaded, else 'flat'."""
+        return "ivf" if self.centroids is not None else "flat"
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    def train_ivf(self, nlist: int, iterations: int = 10, sample_size: int = 100000,
+                  block_size: int = 65536, seed: int = 0):
+        """
+        Trains a spherical k-means coarse quantizer and builds the inverted
+        lists as one permutation of vector ids plus per-list offsets.
+
+        Args:
+            nlist (int): Number of clusters / inverted lists.
+            iterations (int): k-means iterations on the training sample.
+            sample_size (int): Number of vectors sampled for training.
+            block_size (int): Vectors assigned per block, bounding memory use.
+            seed (int): Seed for sampling and centroid initialization.
+        """
+        n = len(self)
+        if n == 0:
+            return
+        nlist = max(1, min(nlist, n))
+        rng = np.random.RandomState(seed)
+        sample_ids = np.sort(rng.choice(n, size=min(n, max(sample_size, nlist)), replace=False))
+        sample = np.asarray(self.vectors[sample_ids], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid.
+            centroids = np.where(norms > 0, sums / np.maximum(norms, 1e-12), centroids).astype(np.float32)
+
+        assignment = np.empty(n, dtype=np.int64)
+        for start in range(0, n, block_size):
+            block = np.asarray(self.vectors[start:start + block_size], dtype=np.float32)
+            assignment[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+
+        self.centroids = centroids
+        self.list_order = np.argsort(assignment, kind="stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(assignment, minlength=nlist)))).astype(np.int64)
+
+    def search(self, query_vector: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Finds the vectors with the highest inner product with the query.
+
+        Args:
+            query_vector (np.ndarray): A (dim,) query vector.
+            top_k (int): Number of results to return.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Vector ids and their scores, best first.
+        """
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        if len(self) == 0 or top_k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        if self.centroids is None:
+            candidate_ids = None
+            scores = self.vectors @ query_vector
+        else:
+            nprobe = min(self.nprobe, len(self.centroids))
+            probe = np.argpartition(-(self.centroids @ query_vector), nprobe - 1)[:nprobe]
+            candidate_ids = np.sort(np.concatenate([
+                self.list_order[self.list_offsets[c]:self.list_offsets[c + 1]] for c in probe
+            ]))
+            if candidate_ids.size == 0:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            scores = self.vectors[candidate_ids] @ query_vector
+
+        k = min(top_k, scores.shape[0])
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        ids = best if candidate_ids is None else candidate_ids[best]
+        return ids.astype(np.int64), scores[best]
+
+    def save_ivf(self, path: str):
+        """Writes the coarse quantizer and inverted lists to an .npz file."""
+        if self.centroids is None:
+            return
+        np.savez(path, centroids=self.centroids, list_order=self.list_order, list_offsets=self.list_offsets)
+
+    def load_ivf(self, path: str) -> bool:
+        """
+        Loads a coarse quantizer saved by `save_ivf`.
+
+        Returns:
+            bool: False if the file is missing or does not match the vectors.
+        """
+        if not os.path.exists(path):
+            return False
+        with np.load(path) as data:
+            if data["list_order"].shape[0] != len(self):
+                return False
+            self.centroids = data["centroids"]
+            self.list_order = data["list_order"]
+            self.list_offsets = data["list_offsets"]
+        return True
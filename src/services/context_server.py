@@ -0,0 +1,314 @@
+import http.client
+import json
+import os
+import socket
+import socketserver
+import stat
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Pending connections the listening socket queues while all threads are busy.
+LISTEN_BACKLOG = 128
+
+class ThreadingTCPHTTPServer(ThreadingHTTPServer):
+    """An HTTP server on a TCP port that handles each request in a thread."""
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+
+class ThreadingUnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """An HTTP server on a Unix domain socket that handles each request in a thread."""
+
+    daemon_threads = True
+    request_queue_size = LISTEN_BACKLOG
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ("unix", 0)
+
+
+class ContextServer:
+    """
+    Keeps one warm `ContextEngineer` in memory and serves queries over HTTP,
+    on a TCP port or a local Unix socket. Requests are handled concurrently,
+    one thread each.
+
+    Endpoints:
+    - POST /query    {"role", "query", "file_only"?, "doc_chunks"?, "user"?} -> {"result"}
+    - POST /context  {"role", "query"} -> {"context"} (context only, no model call)
+    - GET  /health   -> {"status": "ok", "sources": [...]}
+    - GET  /stats    -> request counts and latencies, cache statistics, uptime
+    """
+
+    def __init__(self, engineer: Any, answer_fn: Optional[Callable[..., str]] = None,
+                 stats_fn: Optional[Callable[[], Dict[str, Any]]] = None):
+        """
+        Initializes the server.
+
+        Args:
+            engineer (Any): The `ContextEngineer` shared by all requests.
+            answer_fn (Optional[Callable[..., str]]): Answers a /query request,
+                      called as answer_fn(role, query, file_only=..., doc_chunks=...),
+                      plus user=... when the request names a user.
+                      Without it, /query returns the built context.
+            stats_fn (Optional[Callable[[], Dict[str, Any]]]): Returns extra
+                      entries for /stats, e.g. the answer caches' statistics.
+        """
+        self.engineer = engineer
+        self.answer_fn = answer_fn
+        self.stats_fn = stats_fn
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._endpoint_stats: Dict[str, Dict[str, float]] = {}
+        self._httpd = None
+
+    def handle(self, method: str, path: str, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        """
+        Dispatches one request.
+
+        Args:
+            method (str): 'GET' or 'POST'.
+            path (str): The request path; a query string is ignored.
+            payload (Dict[str, Any]): The decoded JSON body (empty for GET).
+
+        Returns:
+            Tuple[int, Dict[str, Any]]: The HTTP status and the JSON response.
+        """
+        path = path.split("?", 1)[0]
+        routes = {
+            ("GET", "/health"): self._health,
+            ("GET", "/stats"): self._stats,
+            ("POST", "/query"): self._query,
+            ("POST", "/context"): self._context,
+        }
+        route = routes.get((method, path))
+        if route is None:
+            return 404, {"error": f"Unknown endpoint {method} {path}"}
+
+        start = time.perf_counter()
+        with self._lock:
+            self._in_flight += 1
+        status = 500
+        try:
+            status, response = route(payload)
+        except Exception as e:
+            response = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            self._record(path, time.perf_counter() - start, status)
+        return status, response
+
+    def _record(self, path: str, elapsed: float, status: int):
+        """Updates the per-endpoint counters shown by /stats."""
+        with self._lock:
+            self._in_flight -= 1
+            stats = self._endpoint_stats.setdefault(path, {"requests": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            stats["requests"] += 1
+            if status >= 400:
+                stats["errors"] += 1
+            stats["total_ms"] += elapsed * 1000.0
+            stats["max_ms"] = max(stats["max_ms"], elapsed * 1000.0)
+
+    @staticmethod
+    def _require_query(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Returns an error response if 'role' or 'query' is missing."""
+        missing = [field for field in ("role", "query") if not isinstance(payload.get(field), str)]
+        if missing:
+            return {"error": f"Missing string field(s): {', '.join(missing)}"}
+        return None
+
+    def _query(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        error = self._require_query(payload)
+        if error:
+            return 400, error
+        doc_chunks = payload.get("doc_chunks", 12)
+        if type(doc_chunks) is not int or doc_chunks < 0:
+            return 400, {"error": "'doc_chunks' must be a non-negative integer"}
+        file_only = payload.get("file_only", False)
+        if not isinstance(file_only, bool):
+            return 400, {"error": "'file_only' must be a boolean"}
+        if self.answer_fn is None:
+            return self._context(payload)
+        options = {}
+        if isinstance(payload.get("user"), str):
+            options["user"] = payload["user"]
+        result = self.answer_fn(
+            payload["role"],
+            payload["query"],
+            file_only=file_only,
+            doc_chunks=doc_chunks,
+            **options
+        )
+        return 200, {"result": result}
+
+    def _context(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        error = self._require_query(payload)
+        if error:
+            return 400, error
+        return 200, {"context": self.engineer.build_context(payload["query"], user_role=payload["role"])}
+
+    def _health(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        return 200, {"status": "ok", "sources": sorted(self.engineer.retriever.sources)}
+
+    def _stats(self, payload: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        with self._lock:
+            endpoints = {
+                path: dict(stats, mean_ms=stats["total_ms"] / stats["requests"] if stats["requests"] else 0.0)
+                for path, stats in self._endpoint_stats.items()
+            }
+            in_flight = self._in_flight
+        extra = self.stats_fn() if self.stats_fn is not None else {}
+        return 200, dict({
+            "uptime_seconds": time.time() - self.started_at,
+            "in_flight": in_flight,
+            "endpoints": endpoints,
+            "result_cache": self.engineer.result_cache.stats(),
+            "token_cache": self.engineer.budget_manager.tokenizer.cache_info(),
+            "entry_cost_cache": self.engineer.budget_manager.entry_costs.stats(),
+        }, **extra)
+
+    def make_handler(self):
+        """Returns a request handler class bound to this server."""
+        context_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def _respond(self, status: int, response: Dict[str, Any]):
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._respond(*context_server.handle("GET", self.path, {}))
+
+            def do_POST(self):
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    payload = json.loads(self.rfile.read(length) or b"{}")
+                    if not isinstance(payload, dict):
+                        raise ValueError("request body must be a JSON object")
+                except ValueError as e:
+                    self._respond(400, {"error": f"Invalid JSON body: {e}"})
+                    return
+                self._respond(*context_server.handle("POST", self.path, payload))
+
+            def log_message(self, format, *args):
+                pass # Keep the console quiet; /stats has the numbers
+
+        return Handler
+
+    def create_server(self, address: str):
+        """
+        Binds the server without starting it.
+
+        Args:
+            address (str): 'host:port' for HTTP over TCP, or 'unix:/path.sock'.
+
+        Returns:
+            The bound socketserver instance.
+
+        Raises:
+            OSError: If a Unix socket path is taken by something other than
+                     a stale socket (a live server, a file or a symlink).
+        """
+        handler = self.make_handler()
+        if address.startswith("unix:"):
+            path = address[len("unix:"):]
+            self._remove_stale_socket(path)
+            self._httpd = ThreadingUnixHTTPServer(path, handler)
+        else:
+            host, _, port = address.rpartition(":")
+            self._httpd = ThreadingTCPHTTPServer((host or "127.0.0.1", int(port)), handler)
+        return self._httpd
+
+    @staticmethod
+    def _remove_stale_socket(path: str):
+        """Removes a socket left at `path` by a previous run; refuses to touch anything else."""
+        try:
+            mode = os.lstat(path).st_mode
+        except FileNotFoundError:
+            return
+        if not stat.S_ISSOCK(mode):
+            raise FileExistsError(f"{path} exists and is not a socket; refusing to replace it")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+        except OSError:
+            os.remove(path) # Nobody is listening: stale socket from a previous run
+            return
+        finally:
+            probe.close()
+        raise OSError(f"{path} is in use by a running server")
+
+    def serve(self, address: str):
+        """Binds to `address` and serves requests until interrupted."""
+        httpd = self.create_server(address)
+        print(f"Serving ContextCore on {address} (Ctrl+C to stop)")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def shutdown(self):
+        """Closes the listening socket and the engineer's worker pools."""
+        if self._httpd is not None:
+            self._httpd.server_close()
+            if isinstance(self._httpd, ThreadingUnixHTTPServer) and os.path.exists(self._httpd.server_address):
+                os.remove(self._httpd.server_address)
+            self._httpd = None
+        self.engineer.retriever.close()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, path: str, timeout: float):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_path)
+
+
+def request_server(address: str, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                   timeout: float = 300.0) -> Dict[str, Any]:
+    """
+    Sends one request to a running `ContextServer`.
+
+    Args:
+        address (str): 'host:port' or 'unix:/path.sock', as passed to `serve`.
+        method (str): 'GET' or 'POST'.
+        path (str): The endpoint, e.g. '/query'.
+        payload (Optional[Dict[str, Any]]): JSON body for POST requests.
+        timeout (float): Socket timeout in seconds.
+
+    Returns:
+        Dict[str, Any]: The decoded JSON response (with an 'error' key on failure).
+
+    Raises:
+        OSError: If the server cannot be reached.
+    """
+    if address.startswith("unix:"):
+        connection = _UnixHTTPConnection(address[len("unix:"):], timeout)
+    else:
+        host, _, port = address.rpartition(":")
+        connection = http.client.HTTPConnection(host or "127.0.0.1", int(port), timeout=timeout)
+    try:
+        body = json.dumps(payload).encode("utf-8") if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        connection.request(method, path, body=body, headers=headers)
+        return json.loads(connection.getresponse().read() or b"{}")
+    finally:
+        connection.close()
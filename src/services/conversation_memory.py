@@ -1,35 +1,266 @@
+import atexit
+import contextlib
 import json
 import os
-from typing import List, Dict
+import tempfile
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
 
 class ConversationMemory:
-    def __init__(self, memory_file: str = "conversation_memory.json", max_history: int = 10):
+    """
+    Keeps the most recent interactions, per role and per user, and persists them.
+
+    With a '.jsonl' memory file (the default) each interaction is appended
+    to the file as one JSON line instead of rewriting the whole history.
+    The file is compacted (rewritten with only the retained interactions)
+    once it holds `compact_after` lines, so it stays small and loading it
+    stays cheap. With `write_behind`, appends are queued and written in
+    batches by a background thread every `flush_interval` seconds; call
+    `close` (also run at exit) to flush the rest.
+
+    With a '.json' memory file the whole history is rewritten on every
+    interaction, as in earlier versions.
+    """
+
+    # Queued write-behind lines that wake the writer before its next interval.
+    FLUSH_BATCH = 256
+
+    def __init__(self, memory_file: str = "conversation_memory.jsonl", max_history: int = 10,
+                 write_behind: bool = False, flush_interval: float = 1.0, compact_after: Optional[int] = None):
+        """
+        Initializes the memory and loads the saved interactions.
+
+        Args:
+            memory_file (str): '.jsonl' for the append-only store, '.json' for
+                               a single rewritten JSON list. A new '.jsonl' store
+                               imports the '.json' file of the same name, if any.
+            max_history (int): Interactions kept per role, per user, and overall.
+            write_behind (bool): Append from a background thread in batches
+                                 instead of on every interaction.
+            flush_interval (float): Seconds between write-behind flushes.
+            compact_after (Optional[int]): Lines the '.jsonl' file may grow to
+                                           before it is compacted. Defaults to
+                                           max(1000, 50 * max_history).
+        """
         self.memory_file = memory_file
         self.max_history = max_history
-        self.history = self._load_memory()
+        self.append_only = memory_file.lower().endswith(".jsonl")
+        self.compact_after = compact_after or max(1000, 50 * max_history)
+        self.flush_interval = flush_interval
+        # Server mode records interactions from concurrent request threads.
+        self._lock = threading.Lock()
+        # Serializes file writes; re-entrant as flush() may compact().
+        self._io_lock = threading.RLock()
+        self._seq = 0
+        self._recent: Deque[Tuple[int, Dict[str, Any]]] = deque(maxlen=max_history)
+        self._by_role: Dict[str, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self._by_user: Dict[str, Deque[Tuple[int, Dict[str, Any]]]] = {}
+        self._pending: List[Tuple[int, str]] = []
+        self._written_seq = 0 # Last interaction appended to the file
+        self._file_lines = 0
+        for interaction in self._load_memory():
+            self._remember(interaction)
+        self._written_seq = self._seq
+
+        self._writer = None
+        self._closed = threading.Event()
+        self._wakeup = threading.Event()
+        if write_behind and self.append_only:
+            self._writer = threading.Thread(target=self._write_behind, name="conversation-memory", daemon=True)
+            self._writer.start()
+            atexit.register(self.close)
 
     def _load_memory(self) -> List[Dict]:
-        if os.path.exists(self.memory_file):
-            with open(self.memory_file, 'r', encoding='utf-8') as f:
+        if not self.append_only:
+            return self._load_json(self.memory_file)
+        if not os.path.exists(self.memory_file):
+            legacy = self._load_json(os.path.splitext(self.memory_file)[0] + ".json")
+            if legacy:
+                self._rewrite(legacy)
+            return legacy
+
+        interactions = []
+        skipped = 0
+        with open(self.memory_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                self._file_lines += 1
+                if not line.strip():
+                    continue
                 try:
-                    return json.load(f)
+                    interaction = json.loads(line)
+                except ValueError:
+                    skipped += 1 # e.g. a line cut off by a crash mid-write
+                    continue
+                if isinstance(interaction, dict):
+                    interactions.append(interaction)
+                else:
+                    skipped += 1
+        if skipped:
+            print(f"Warning: Skipped {skipped} unreadable line(s) in {self.memory_file}")
+        return interactions
+
+    @staticmethod
+    def _load_json(path: str) -> List[Dict]:
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                try:
+                    records = json.load(f)
                 except Exception:
                     return []
+            if not isinstance(records, list):
+                print(f"Warning: Ignored {path}, which does not hold a list of interactions")
+                return []
+            interactions = [record for record in records if isinstance(record, dict)]
+            if len(interactions) < len(records):
+                print(f"Warning: Skipped {len(records) - len(interactions)} unreadable record(s) in {path}")
+            return interactions
         return []
 
-    def add_interaction(self, role: str, query: str, response: str):
-        self.history.append({
-            "role": role,
-            "query": query,
-            "response": response
-        })
-        # Keep only the most recent max_history items
-        self.history = self.history[-self.max_history:]
-        self._save_memory()
+    def _remember(self, interaction: Dict[str, Any]):
+        """Adds an interaction to the in-memory ring buffers (caller holds the lock or is __init__)."""
+        self._seq += 1
+        entry = (self._seq, interaction)
+        self._recent.append(entry)
+        role = interaction.get("role")
+        if role not in self._by_role:
+            self._by_role[role] = deque(maxlen=self.max_history)
+        self._by_role[role].append(entry)
+        user = interaction.get("user")
+        if user is not None:
+            if user not in self._by_user:
+                self._by_user[user] = deque(maxlen=self.max_history)
+            self._by_user[user].append(entry)
+
+    def add_interaction(self, role: str, query: str, response: str, user: Optional[str] = None):
+        """
+        Records an interaction and persists it (or queues it, with write-behind).
+
+        Args:
+            role (str): The role that asked.
+            query (str): The query.
+            response (str): The answer given.
+            user (Optional[str]): The user that asked, for per-user history.
+        """
+        interaction = {"role": role, "query": query, "response": response}
+        if user is not None:
+            interaction["user"] = user
+        with self._lock:
+            self._remember(interaction)
+            if not self.append_only:
+                self._save_memory()
+                return
+            self._pending.append((self._seq, json.dumps(interaction, ensure_ascii=False) + "\n"))
+            wake_writer = len(self._pending) >= self.FLUSH_BATCH
+        if self._writer is None:
+            self.flush()
+        elif wake_writer:
+            self._wakeup.set()
+
+    def get_recent_history(self, role: Optional[str] = None, user: Optional[str] = None) -> List[Dict]:
+        """
+        Returns recent interactions, oldest first.
+
+        Args:
+            role (Optional[str]): Only this role's last `max_history` interactions.
+            user (Optional[str]): Only this user's last `max_history` interactions
+                                  (combined with `role`, those of the user's
+                                  interactions that were made in that role).
+
+        Returns:
+            List[Dict]: The interactions ('role', 'query', 'response' and,
+                        if recorded, 'user'). Without filters, the last
+                        `max_history` interactions overall.
+        """
+        with self._lock:
+            if user is not None:
+                entries = self._by_user.get(user, ())
+                if role is not None:
+                    return [interaction for _, interaction in entries if interaction.get("role") == role]
+            elif role is not None:
+                entries = self._by_role.get(role, ())
+            else:
+                entries = self._recent
+            return [interaction for _, interaction in entries]
+
+    @property
+    def history(self) -> List[Dict]:
+        """The last `max_history` interactions overall."""
+        return self.get_recent_history()
+
+    def flush(self):
+        """
+        Appends queued interactions to the '.jsonl' file, compacting it when it has grown too long.
+        
+        Raises:
+            OSError: If the file cannot be written. The batch stays queued
+                     (and any partly written tail is cut off) for the next flush.
+        """
+        with self._io_lock:
+            with self._lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            try:
+                with open(self.memory_file, 'a', encoding='utf-8') as f:
+                    start = f.tell()
+                    try:
+                        f.write("".join(line for _, line in pending))
+                        f.flush()
+                    except OSError:
+                        with contextlib.suppress(OSError):
+                            f.truncate(start)
+                        raise
+            except OSError:
+                with self._lock:
+                    self._pending[:0] = pending
+                raise
+            self._written_seq = pending[-1][0]
+            self._file_lines += len(pending)
+            if self._file_lines > self.compact_after:
+                self.compact()
+
+    def compact(self):
+        """Rewrites the '.jsonl' file with only the interactions still held in memory."""
+        with self._io_lock:
+            with self._lock:
+                retained = {}
+                for entries in (self._recent, *self._by_role.values(), *self._by_user.values()):
+                    retained.update(entries)
+                # Still-queued interactions are appended by the next flush.
+                interactions = [retained[seq] for seq in sorted(retained) if seq <= self._written_seq]
+            self._rewrite(interactions)
+
+    def _rewrite(self, interactions: List[Dict]):
+        """Atomically replaces the '.jsonl' file with `interactions`."""
+        directory = os.path.dirname(os.path.abspath(self.memory_file))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            for interaction in interactions:
+                f.write(json.dumps(interaction, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.memory_file)
+        self._file_lines = len(interactions)
+
+    def _write_behind(self):
+        """Background writer: flushes queued interactions until closed."""
+        while not self._closed.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except OSError as e:
+                print(f"Warning: Could not write conversation memory {self.memory_file}: {e}")
 
-    def get_recent_history(self) -> List[Dict]:
-        return self.history[-self.max_history:]
+    def close(self):
+        """Stops the write-behind thread, if any, and flushes what is still queued."""
+        if self._writer is not None:
+            self._closed.set()
+            self._wakeup.set()
+            self._writer.join()
+            self._writer = None
+        if self.append_only:
+            self.flush()
 
     def _save_memory(self):
         with open(self.memory_file, 'w', encoding='utf-8') as f:
-            json.dump(self.history, f, indent=2)
+            json.dump([interaction for _, interaction in self._recent], f, indent=2)
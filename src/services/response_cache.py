@@ -0,0 +1,152 @@
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Any, Hashable, List, Optional, Tuple
+
+from ..utils.result_cache import ResultCache
+
+class ResponseCache(ResultCache):
+    """
+    A `ResultCache` of model responses that persists to a JSONL file.
+
+    Entries are keyed by a hash of everything that determines a response
+    (see `make_key`). With a `path`, every stored response is appended to
+    the file and the live entries are loaded back on start, so repeat
+    questions are answered from the cache across runs. Expiry uses wall-
+    clock time for the same reason. The file is compacted to the live
+    entries once it holds twice `max_entries` lines.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_entries: int = 1024, ttl_seconds: float = 86400.0):
+        """
+        Initializes the cache and loads the live entries saved at `path`.
+
+        Args:
+            path (Optional[str]): JSONL file the cache persists to; None keeps
+                                  it in memory only.
+            max_entries (int): Maximum number of entries before the least
+                               recently used one is evicted (0 disables caching).
+            ttl_seconds (float): Seconds an entry stays valid. 0 or less
+                                 means entries never expire.
+        """
+        super().__init__(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self.path = path
+        self._file_lines = 0
+        # Serializes writes to the file, which happen outside the entry lock
+        # so lookups never wait on disk I/O.
+        self._io_lock = threading.Lock()
+        self._pending_write = None
+        if path and max_entries > 0:
+            self._load()
+
+    @staticmethod
+    def make_key(model: str, prompt: str, max_tokens: int, temperature: float, base_url: Optional[str] = None) -> str:
+        """
+        Returns the cache key of a request.
+
+        Args:
+            model (str): The model name.
+            prompt (str): The full prompt (all messages, serialized).
+            max_tokens (int): The completion token limit.
+            temperature (float): The sampling temperature.
+            base_url (Optional[str]): The endpoint answering the request, since
+                                      the same model name can differ between endpoints.
+
+        Returns:
+            str: The SHA-256 hex digest of the request's parameters.
+        """
+        payload = json.dumps([base_url, model, prompt, max_tokens, temperature], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _now(self) -> float:
+        return time.time()
+
+    def _load(self):
+        """
+        Loads the entries saved at `path` that have not expired, keeping the
+        most recently used ones. Later lines for a key replace earlier ones,
+        and lines that cannot be parsed are skipped.
+        """
+        if not os.path.exists(self.path):
+            return
+        now = self._now()
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    self._file_lines += 1
+                    try:
+                        record = json.loads(line)
+                        key, response, expires_at = record["key"], record["response"], record.get("expires_at")
+                    except (ValueError, KeyError, TypeError):
+                        continue # e.g. a line cut off by a crash mid-write
+                    self._entries.pop(key, None)
+                    if expires_at is None or now < expires_at:
+                        self._entries[key] = (response, None, expires_at)
+        except OSError as e:
+            print(f"Warning: Could not read response cache {self.path}: {e}")
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def put(self, key: Hashable, value: Any, stamp: Any = None):
+        """Stores a value as `ResultCache.put` does, then writes it to the cache file."""
+        if not self.path:
+            super().put(key, value, stamp)
+            return
+        with self._io_lock:
+            super().put(key, value, stamp)
+            pending, self._pending_write = self._pending_write, None
+            if pending is not None:
+                self._write(*pending)
+
+    def _on_put(self, key: Hashable, value: Any, stamp: Any, expires_at: Optional[float]):
+        """Prepares the file write for the stored entry, done by `put` once the entry lock is released."""
+        if not self.path:
+            return
+        line = json.dumps({"key": key, "response": value, "expires_at": expires_at}, ensure_ascii=False) + "\n"
+        # Compaction writes the live entries as of this put.
+        records = list(self._entries.items()) if self._file_lines + 1 > 2 * self.max_entries else None
+        self._pending_write = (line, records)
+
+    def _write(self, line: str, records: Optional[List[Tuple[Hashable, tuple]]]):
+        """Appends `line` to the cache file, or compacts it to `records` if given (the I/O lock is held)."""
+        try:
+            directory = os.path.dirname(os.path.abspath(self.path))
+            os.makedirs(directory, exist_ok=True)
+            if records is not None:
+                self._rewrite(directory, records)
+            else:
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(line)
+                self._file_lines += 1
+        except OSError as e:
+            print(f"Warning: Could not write response cache {self.path}: {e}")
+
+    def _rewrite(self, directory: str, records: List[Tuple[Hashable, tuple]]):
+        """
+        Atomically replaces the cache file with `records`, writing them to a
+        temporary file in `directory` first. The temporary file is removed if
+        the write fails, and the old cache file is left in place.
+        """
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                for key, (response, _, expires_at) in records:
+                    f.write(json.dumps({"key": key, "response": response, "expires_at": expires_at}, ensure_ascii=False) + "\n")
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp_path)
+            raise
+        self._file_lines = len(records)
+
+    def clear(self):
+        """Removes all entries, including the cache file, and resets the counters."""
+        with self._io_lock:
+            super().clear()
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+            self._file_lines = 0
@@ -0,0 +1,194 @@
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..utils.embeddings import load_embedder
+
+def context_fingerprint(*parts: Any) -> int:
+    """
+    Returns a 63-bit hash of the context an answer was produced from.
+
+    Args:
+        *parts (Any): Everything besides the query that determines the
+                      answer (the context text, answer settings, model).
+
+    Returns:
+        int: The fingerprint, stored in the cache's int64 arrays.
+    """
+    digest = hashlib.blake2b(repr(parts).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "little") >> 1
+
+
+class _RoleIndex:
+    """The cached answers of one role: preallocated arrays searched in one matrix product."""
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.fingerprints = np.zeros(capacity, dtype=np.int64)
+        self.last_used = np.zeros(capacity, dtype=np.int64)
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.size = 0
+
+
+class SemanticAnswerCache:
+    """
+    Caches model answers per role and serves them for near-duplicate queries.
+
+    A lookup embeds the query and compares it with the role's cached
+    queries in one vectorized dot product (the embeddings are unit length,
+    so this is the cosine similarity). The most similar cached query is a
+    hit if it scores at least `threshold` and was answered from the same
+    context fingerprint, so a paraphrase is only reused while the context
+    it would be answered from is unchanged. Each role holds at most
+    `max_entries_per_role` answers; the least recently used one is evicted.
+    """
+
+    def __init__(self, threshold: float = 0.9, max_entries_per_role: int = 1024,
+                 embedder: str = "hashing", embedder_options: Optional[Dict[str, Any]] = None):
+        """
+        Initializes the cache. The embedder is created on first use.
+
+        Args:
+            threshold (float): Minimum cosine similarity (0–1) for a hit.
+            max_entries_per_role (int): Answers kept per role (LRU).
+            embedder (str): Embedder spec, as for `load_embedder`.
+            embedder_options (Optional[Dict[str, Any]]): Embedder constructor options.
+        """
+        self.threshold = threshold
+        self.max_entries_per_role = max_entries_per_role
+        self.embedder_spec = embedder
+        self.embedder_options = embedder_options or {}
+        self._embedder = None
+        self._indexes: Dict[str, _RoleIndex] = {}
+        self._lock = threading.Lock()
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def embedder(self):
+        """The query embedder, created on first use."""
+        if self._embedder is None:
+            with self._lock:
+                if self._embedder is None:
+                    self._embedder = load_embedder(self.embedder_spec, **self.embedder_options)
+        return self._embedder
+
+    def has_entries(self, role: str) -> bool:
+        """Whether any answer is cached for `role`, so a lookup is worth embedding the query."""
+        with self._lock:
+            index = self._indexes.get(role)
+            return index is not None and index.size > 0
+
+    def embed(self, query: str) -> np.ndarray:
+        """Returns the unit-length embedding of a query."""
+        return self.embedder.embed([query])[0]
+
+    def get(self, role: str, vector: np.ndarray, fingerprint: int) -> Optional[str]:
+        """
+        Returns the answer cached for the most similar query of `role`, if it
+        is similar enough and was answered under the same context fingerprint.
+
+        Args:
+            role (str): The role asking.
+            vector (np.ndarray): The query's embedding, from `embed`.
+            fingerprint (int): The current `context_fingerprint`.
+
+        Returns:
+            Optional[str]: The cached answer, or None on a miss.
+        """
+        with self._lock:
+            index = self._indexes.get(role)
+            if index is not None and index.size and np.any(vector):
+                n = index.size
+                scores = index.vectors[:n] @ vector
+                scores[index.fingerprints[:n] != fingerprint] = -np.inf
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self._clock += 1
+                    index.last_used[best] = self._clock
+                    self.hits += 1
+                    return index.answers[best]
+            self.misses += 1
+            return None
+
+    def lookup(self, role: str, query: str, fingerprint: int) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Like `get`, from the query text: the query is only embedded if the
+        role has cached answers, so a cold role costs no embedding.
+
+        Args:
+            role (str): The role asking.
+            query (str): The query.
+            fingerprint (int): The current `context_fingerprint`.
+
+        Returns:
+            Tuple[Optional[str], Optional[np.ndarray]]: The cached answer (None
+                on a miss) and the query's embedding, or None if it was not
+                embedded (embed it with `embed` before a `put`).
+        """
+        if not self.has_entries(role):
+            with self._lock:
+                self.misses += 1
+            return None, None
+        vector = self.embed(query)
+        return self.get(role, vector, fingerprint), vector
+
+    def put(self, role: str, vector: np.ndarray, fingerprint: int, answer: str):
+        """
+        Caches an answer, evicting the role's least recently used one if it is full.
+
+        Args:
+            role (str): The role that asked.
+            vector (np.ndarray): The query's embedding, from `embed`.
+            fingerprint (int): The `context_fingerprint` the answer was produced from.
+            answer (str): The model's answer.
+        """
+        if self.max_entries_per_role <= 0 or not np.any(vector):
+            return
+        with self._lock:
+            index = self._indexes.get(role)
+            if index is None:
+                index = self._indexes[role] = _RoleIndex(self.max_entries_per_role, len(vector))
+            if index.size < self.max_entries_per_role:
+                slot = index.size
+                index.size += 1
+            else:
+                slot = int(np.argmin(index.last_used))
+                self.evictions += 1
+            self._clock += 1
+            index.vectors[slot] = vector
+            index.fingerprints[slot] = fingerprint
+            index.last_used[slot] = self._clock
+            index.answers[slot] = answer
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        with self._lock:
+            self._indexes.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Returns cache statistics.
+
+        Returns:
+            Dict[str, Any]: 'hits', 'misses', 'hit_rate', 'evictions', 'size'
+                            (over all roles), 'roles' and 'max_entries_per_role'.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "size": sum(index.size for index in self._indexes.values()),
+                "roles": len(self._indexes),
+                "max_entries_per_role": self.max_entries_per_role,
+            }
@@ -0,0 +1,117 @@
+import importlib
+from typing import Any, List
+
+import numpy as np
+
+class HashingEmbedder:
+    """
+    An offline text embedder that needs no model download or network access.
+
+    Texts are turned into sparse word n-gram counts with the hashing trick
+    and then reduced to a small dense vector with a fixed sparse random
+    projection. Vectors are L2-normalized, so a dot product is a cosine
+    similarity. The same configuration always yields the same vectors,
+    which keeps persisted indexes valid across processes.
+    """
+
+    name = "hashing"
+
+    def __init__(self, dim: int = 256, n_features: int = 2 ** 18, ngram_max: int = 2,
+                 nonzeros_per_feature: int = 4, seed: int = 0):
+        """
+        Initializes the embedder.
+
+        Args:
+            dim (int): Dimension of the output vectors.
+            n_features (int): Size of the hashed n-gram space before projection.
+            ngram_max (int): Longest word n-gram to hash (1 = unigrams only).
+            nonzeros_per_feature (int): Output dimensions each hashed feature
+                                        is spread over, with random signs.
+            seed (int): Seed of the random projection.
+        """
+        # scikit-learn and scipy are only imported when an embedder is actually created.
+        from scipy import sparse
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dim = dim
+        self.n_features = n_features
+        self.ngram_max = ngram_max
+        self.nonzeros_per_feature = nonzeros_per_feature
+        self.seed = seed
+        self._vectorizer = HashingVectorizer(
+            n_features=n_features,
+            ngram_range=(1, ngram_max),
+            alternate_sign=True,
+            norm="l2",
+            dtype=np.float32,
+        )
+
+        # Sparse random projection with a fixed number of signed entries per
+        # feature, so every n-gram contributes to the output vector.
+        rng = np.random.RandomState(seed)
+        s = nonzeros_per_feature
+        columns = rng.randint(0, dim, size=n_features * s)
+        signs = rng.choice(np.array([-1.0, 1.0], dtype=np.float32), size=n_features * s) / np.float32(np.sqrt(s))
+        self._projection = sparse.csr_matrix(
+            (signs, columns, np.arange(0, n_features * s + 1, s)),
+            shape=(n_features, dim),
+            dtype=np.float32
+        )
+
+    @property
+    def fingerprint(self) -> str:
+        """A string that changes whenever the produced vectors would change."""
+        return f"{self.name}-d{self.dim}-f{self.n_features}-n{self.ngram_max}-k{self.nonzeros_per_feature}-s{self.seed}"
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a batch of texts.
+
+        Args:
+            texts (List[str]): The input texts.
+
+        Returns:
+            np.ndarray: A (len(texts), dim) float32 array of unit-length rows
+                        (all-zero rows for texts without any terms).
+        """
+        if not texts:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        counts = self._vectorizer.transform(texts)
+        vectors = np.asarray((counts @ self._projection).toarray(), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        np.divide(vectors, norms, out=vectors, where=norms > 0)
+        return vectors
+
+
+# Embedders selectable by name in the configuration
+EMBEDDERS = {
+    "hashing": HashingEmbedder,
+}
+
+def load_embedder(spec: str = "hashing", **options: Any):
+    """
+    Creates an embedder from a configuration value.
+
+    Args:
+        spec (str): A registered name such as 'hashing', or an import path
+                    of the form 'package.module:ClassName' for a custom
+                    embedder. Embedders must provide `dim`, `fingerprint`
+                    and `embed(texts) -> np.ndarray`.
+        **options: Keyword arguments passed to the embedder's constructor.
+
+    Returns:
+        An embedder instance.
+
+    Raises:
+        ValueError: If the spec names no known or importable embedder.
+    """
+    if spec in EMBEDDERS:
+        return EMBEDDERS[spec](**options)
+    if ":" in spec:
+        module_name, class_name = spec.split(":", 1)
+        try:
+            embedder_class = getattr(importlib.import_module(module_name), class_name)
+        except (ImportError, AttributeError) as e:
+            raise ValueError(f"Could not import embedder '{spec}': {e}")
+        return embedder_class(**options)
+    raise ValueError(f"Unknown embedder '{spec}'. Use one of {sorted(EMBEDDERS)} or 'module:Class'.")
@@ -0,0 +1,111 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+class ResultCache:
+    """
+    A thread-safe, bounded cache with per-entry time-to-live and
+    least-recently-used eviction.
+
+    Each entry can carry a validation stamp (e.g. the mtimes of the files
+    it was computed from). A lookup with a different stamp is treated as
+    a miss and drops the stale entry.
+
+    Subclasses can persist entries through `_on_put` and measure expiry on
+    another clock by overriding `_now`.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 300.0):
+        """
+        Initializes the cache.
+
+        Args:
+            max_entries (int): Maximum number of entries before the least
+                               recently used one is evicted.
+            ttl_seconds (float): Seconds an entry stays valid. 0 or less
+                                 means entries never expire.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, stamp: Any = None) -> Optional[Any]:
+        """
+        Returns the cached value for `key`, or None if it is missing,
+        expired, or was stored with a different stamp.
+
+        Args:
+            key (Hashable): The cache key.
+            stamp (Any): The current validation stamp for the entry.
+
+        Returns:
+            Optional[Any]: The cached value, or None on a miss.
+        """
+        now = self._now()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, stored_stamp, expires_at = entry
+                if stored_stamp == stamp and (expires_at is None or now < expires_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any, stamp: Any = None):
+        """
+        Stores a value, evicting least recently used entries beyond max_entries.
+
+        Args:
+            key (Hashable): The cache key.
+            value (Any): The value to cache.
+            stamp (Any): The validation stamp the value was computed under.
+        """
+        if self.max_entries <= 0:
+            return
+        expires_at = self._now() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._entries[key] = (value, stamp, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._on_put(key, value, stamp, expires_at)
+
+    def _now(self) -> float:
+        """The clock expiry times are measured on."""
+        return time.monotonic()
+
+    def _on_put(self, key: Hashable, value: Any, stamp: Any, expires_at: Optional[float]):
+        """Called with each stored entry while the lock is held; does nothing by default."""
+
+    def clear(self):
+        """Removes all entries and resets the counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Returns cache statistics.
+
+        Returns:
+            Dict[str, int]: 'hits', 'misses', 'evictions', 'size' and 'max_entries'.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+            }
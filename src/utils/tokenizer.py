@@ -1,17 +1,26 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
 import tiktoken
 
 class Tokenizer:
     """
     A simple wrapper around the tiktoken library for consistent token counting.
+    Token counts are memoized in a bounded LRU cache keyed by a hash of the text,
+    so chunks that recur across queries are only encoded once.
     """
 
-    def __init__(self, model_name: str = "cl100k_base"):
+    def __init__(self, model_name: str = "cl100k_base", cache_size: int = 100000):
         """
         Initializes the tokenizer with a specific encoding model.
-        
+
         Args:
             model_name (str): The name of the model to use for tokenization,
                               e.g., 'cl100k_base' (for GPT-3.5/4) or 'p50k_base'.
+            cache_size (int): Maximum number of token counts kept in the LRU
+                              cache. 0 disables caching.
         """
         try:
             self.encoding = tiktoken.get_encoding(model_name)
@@ -19,16 +28,127 @@ class Tokenizer:
             print(f"Warning: Could not get encoding for '{model_name}'. Falling back to 'cl100k_base'. Error: {e}")
             self.encoding = tiktoken.get_encoding("cl100k_base")
 
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _cache_key(text: str) -> bytes:
+        """Returns a compact content hash used as the cache key."""
+        return hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+
+    def _cache_get(self, key: bytes):
+        """Looks up a cached count, updating recency and hit/miss counters."""
+        with self._lock:
+            count = self._cache.get(key)
+            if count is None:
+                self.misses += 1
+            else:
+                self._cache.move_to_end(key)
+                self.hits += 1
+            return count
+
+    def _cache_put(self, key: bytes, count: int):
+        """Stores a count, evicting the least recently used entries beyond cache_size."""
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = count
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
     def count_tokens(self, text: str) -> int:
         """
         Counts the number of tokens in a given string.
-        
+
         Args:
             text (str): The input string.
-            
+
         Returns:
             int: The number of tokens.
         """
         if not isinstance(text, str):
             return 0
-        return len(self.encoding.encode(text))
\ No newline at end of file
+        key = self._cache_key(text)
+        count = self._cache_get(key)
+        if count is None:
+            count = len(self.encoding.encode(text))
+            self._cache_put(key, count)
+        return count
+
+    def count_tokens_batch(self, texts: List[str]) -> List[int]:
+        """
+        Counts the tokens of many strings at once. Cache misses are encoded
+        together with tiktoken's batch encoder, which spreads the work over
+        a thread pool.
+
+        Args:
+            texts (List[str]): The input strings.
+
+        Returns:
+            List[int]: The number of tokens of each string, in input order.
+        """
+        counts = [0] * len(texts)
+        pending_positions: Dict[bytes, List[int]] = {}
+        pending_texts: List[str] = []
+
+        for pos, text in enumerate(texts):
+            if not isinstance(text, str):
+                continue
+            key = self._cache_key(text)
+            if key in pending_positions:
+                pending_positions[key].append(pos)
+                continue
+            count = self._cache_get(key)
+            if count is None:
+                pending_positions[key] = [pos]
+                pending_texts.append(text)
+            else:
+                counts[pos] = count
+
+        if pending_texts:
+            encoded = self.encoding.encode_batch(pending_texts)
+            for (key, positions), tokens in zip(pending_positions.items(), encoded):
+                self._cache_put(key, len(tokens))
+                for pos in positions:
+                    counts[pos] = len(tokens)
+
+        return counts
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """
+        Cuts a string down to at most `max_tokens` tokens at a token boundary.
+
+        Args:
+            text (str): The input string.
+            max_tokens (int): The maximum number of tokens to keep.
+
+        Returns:
+            str: The longest token-prefix of the text within the limit.
+        """
+        if not isinstance(text, str) or max_tokens <= 0:
+            return ""
+        tokens = self.encoding.encode(text)
+        if len(tokens) <= max_tokens:
+            return text
+        return self.encoding.decode(tokens[:max_tokens])
+
+    def cache_info(self) -> Dict[str, int]:
+        """
+        Returns cache statistics.
+
+        Returns:
+            Dict[str, int]: 'hits', 'misses', 'size' and 'maxsize' of the token-count cache.
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._cache), "maxsize": self.cache_size}
+
+    def clear_cache(self):
+        """Empties the token-count cache and resets its counters."""
+        with self._lock:
+            self._cache.clear()
+            self.hits = 0
+            self.misses = 0
@@ -1,5 +1,11 @@
 ﻿import unittest
+import json
 import os
+import shutil
+import tempfile
+from unittest import mock
+
+import numpy as np
 
 # To make this runnable, we need to add the project's src directory to the path
 import sys
@@ -7,6 +13,11 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 from src.data_sources.tasks import TaskContextSource
 from src.data_sources.documents import DocumentContextSource
+from src.data_sources.graphiti import GraphitiContextSource
+from src.data_sources.semantic_search import SemanticSearchSource
+from src.data_sources import chunk as chunk_module
+from src.data_sources.chunk import Chunk
+from src.personalization.role_handler import RoleHandler
 
 class TestDataSources(unittest.TestCase):
 
@@ -20,6 +31,10 @@ class TestDataSources(unittest.TestCase):
             "path": "data/mock/mock_documents.json",
             "enabled": True
         }
+        self.graph_config = {
+            "path": "data/mock/mock_graphiti.json",
+            "enabled": True
+        }
 
     def test_task_retrieval(self):
         """Test that the Task source retrieves relevant tasks."""
@@ -29,6 +44,258 @@ class TestDataSources(unittest.TestCase):
         # Check if a known task title is in the content of one of the results
         self.assertTrue(any("Implement authentication service" in r['content'] for r in results))
 
+    def test_task_field_filters(self):
+        """Test that structured filters narrow task results through the field indexes."""
+        source = TaskContextSource(self.tasks_config)
+        results = source.retrieve("the new service", project="Phoenix")
+        self.assertEqual([r['id'] for r in results], ["tasks_TASK-002"])
+
+        results = source.retrieve("", assignee="alice", tags=["security"])
+        self.assertEqual([r['id'] for r in results], ["tasks_TASK-001"])
+
+        self.assertEqual(source.retrieve("", status="Nonexistent"), [])
+
+    def test_document_streaming_ingest(self):
+        """Test that JSON-lines, JSON and text files load the same way in small blocks."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            with open(self.docs_config["path"], encoding='utf-8-sig') as f:
+                documents = json.load(f)
+            jsonl_path = os.path.join(tmp_dir, "docs.jsonl")
+            with open(jsonl_path, "w", encoding="utf-8") as f:
+                for doc in documents:
+                    f.write(json.dumps(doc) + "\n")
+                f.write("not json\n")
+                f.write(json.dumps({"id": "RAW", "title": "Raw", "text": "First point. Second point!"}) + "\n")
+
+            reference = DocumentContextSource(self.docs_config)
+            streamed = DocumentContextSource({"path": self.docs_config["path"], "read_block_size": 7})
+            self.assertEqual(streamed.data, reference.data)
+
+            from_lines = DocumentContextSource({"path": jsonl_path})
+            self.assertEqual(from_lines.data[:-1], reference.data)
+            self.assertEqual(from_lines.data[-1]["chunks"], ["First point. Second point!"])
+
+            text = "Alpha beta. Gamma delta!\r\n\r\nEpsilon? Zeta eta.\nTheta " + "iota " * 300
+            text_path = os.path.join(tmp_dir, "notes.txt")
+            with open(text_path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            chunks = DocumentContextSource({"path": text_path, "read_block_size": 5}).data[0]["chunks"]
+            self.assertEqual(chunks, reference._chunk_text(text))
+            self.assertEqual(chunks[0], "Alpha beta. Gamma delta! Epsilon? Zeta eta.")
+
+            # Text without sentence boundaries is cut at spaces, the same way for any block size.
+            text = ("lambda " * 500) + "mu. " + ("x" * 2000) + "\nnu"
+            with open(text_path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            expected = reference._chunk_text(text)
+            self.assertTrue(all(len(chunk) <= 800 for chunk in expected))
+            self.assertEqual(" ".join(expected).split(), text.replace("x" * 800, "x" * 800 + " ").split())
+            for block_size in (3, 64, 4096):
+                chunks = DocumentContextSource({"path": text_path, "read_block_size": block_size}).data[0]["chunks"]
+                self.assertEqual(chunks, expected)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_index_snapshots(self):
+        """Test that sources restore from a snapshot and rebuild when the data changes."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            docs_path = os.path.join(tmp_dir, "docs.json")
+            shutil.copy(self.docs_config["path"], docs_path)
+            tasks_path = os.path.join(tmp_dir, "tasks.json")
+            shutil.copy(self.tasks_config["path"], tasks_path)
+            snapshot_dir = os.path.join(tmp_dir, "snapshots")
+            docs_config = {"path": docs_path, "snapshot_dir": snapshot_dir}
+            tasks_config = {"path": tasks_path, "snapshot_dir": snapshot_dir}
+
+            built_docs = DocumentContextSource(docs_config)
+            built_tasks = TaskContextSource(tasks_config)
+            self.assertEqual(len(os.listdir(snapshot_dir)), 2)
+
+            with mock.patch.object(DocumentContextSource, "_read_data") as read_docs, \
+                 mock.patch.object(TaskContextSource, "_build_index") as build_tasks:
+                restored_docs = DocumentContextSource(docs_config)
+                restored_tasks = TaskContextSource(tasks_config)
+                # Touching a file changes its mtime but not its content hash.
+                os.utime(docs_path, ns=(0, 0))
+                touched_docs = DocumentContextSource(docs_config)
+            read_docs.assert_not_called()
+            build_tasks.assert_not_called()
+            self.assertEqual(restored_docs.retrieve("architecture"), built_docs.retrieve("architecture"))
+            self.assertEqual(touched_docs.get_all_chunks(), built_docs.get_all_chunks())
+            self.assertEqual(restored_tasks.retrieve("", assignee="alice"), built_tasks.retrieve("", assignee="alice"))
+            self.assertEqual(restored_docs._chunk_docs, built_docs._chunk_docs)
+            self.assertEqual(restored_docs._chunk_docs.typecode, built_docs._chunk_docs.typecode)
+
+            # Snapshots are plain JSON after the header, never pickles.
+            for name in os.listdir(snapshot_dir):
+                with open(os.path.join(snapshot_dir, name), "rb") as f:
+                    f.read(8)
+                    self.assertIn("config", json.loads(f.readline()))
+                    self.assertIsInstance(json.loads(f.read()), dict)
+
+            with open(docs_path, "w", encoding="utf-8") as f:
+                json.dump([{"id": "NEW", "title": "Changed", "chunks": ["Fresh content."], "tags": ["public"]}], f)
+            changed = DocumentContextSource(docs_config)
+            self.assertEqual([c['id'] for c in changed.retrieve("fresh")], ["documents_NEW_chunk0"])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_snapshot_keeps_field_value_types(self):
+        """Test that int and bool task field values still match after a restore from a snapshot."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tasks_path = os.path.join(tmp_dir, "tasks.json")
+            with open(tasks_path, "w", encoding="utf-8") as f:
+                json.dump([{"id": 1, "title": "Numbered", "project": 7, "status": True},
+                           {"id": 2, "title": "Named", "project": "7", "status": "true"}], f)
+            config = {"path": tasks_path, "snapshot_dir": os.path.join(tmp_dir, "snapshots")}
+            fresh = TaskContextSource(config)
+            with mock.patch.object(TaskContextSource, "_build_index") as build_tasks:
+                restored = TaskContextSource(config)
+            build_tasks.assert_not_called()
+            for filters in ({"project": 7}, {"status": True}, {"project": "7"}, {"status": "true"}):
+                expected = [c['id'] for c in fresh.retrieve("", **filters)]
+                self.assertEqual(len(expected), 1)
+                self.assertEqual([c['id'] for c in restored.retrieve("", **filters)], expected)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_incremental_reload(self):
+        """Test that a changed data file is applied as a delta without touching the loaded source."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tasks_path = os.path.join(tmp_dir, "tasks.json")
+            docs_path = os.path.join(tmp_dir, "docs.json")
+            with open(self.tasks_config["path"], encoding="utf-8-sig") as f:
+                tasks = json.load(f)
+            with open(self.docs_config["path"], encoding="utf-8-sig") as f:
+                docs = json.load(f)
+            # Enough untouched records that the change is applied as a delta.
+            tasks += [{"id": f"TASK-F{n}", "title": f"Filler task {n}", "status": "Done", "tags": ["public"]} for n in range(10)]
+            docs += [{"id": f"DOC-F{n}", "title": f"Filler {n}", "chunks": [f"Filler text {n}."]} for n in range(10)]
+            for path, records in ((tasks_path, tasks), (docs_path, docs)):
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(records, f)
+            task_source = TaskContextSource({"path": tasks_path})
+            doc_source = DocumentContextSource({"path": docs_path})
+            self.assertIsNone(task_source.reloaded())
+            old_results = task_source.retrieve("authentication")
+
+            tasks[0] = dict(tasks[0], description="Rotate the signing keys of the zeppelin cluster.")
+            removed_task = tasks.pop(1)
+            tasks.append({"id": "TASK-NEW", "project": "Phoenix", "title": "Zeppelin launch",
+                          "status": "To Do", "assignee": "alice", "tags": ["public"]})
+            docs[0] = dict(docs[0], chunks=["Zeppelin docking procedures."])
+            for path, records in ((tasks_path, tasks), (docs_path, docs)):
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(records, f)
+                os.utime(path, ns=(1, 1))
+
+            with mock.patch.object(TaskContextSource, "_build_index") as rebuild_tasks, \
+                 mock.patch.object(DocumentContextSource, "_build_index") as rebuild_docs:
+                new_tasks = task_source.reloaded()
+                new_docs = doc_source.reloaded()
+            rebuild_tasks.assert_not_called()
+            rebuild_docs.assert_not_called()
+
+            # The loaded sources are untouched; the copies match a fresh load.
+            self.assertEqual(task_source.retrieve("authentication"), old_results)
+            self.assertEqual(task_source.retrieve("zeppelin"), [])
+            for updated, fresh in ((new_tasks, TaskContextSource({"path": tasks_path})),
+                                   (new_docs, DocumentContextSource({"path": docs_path}))):
+                self.assertEqual(updated.get_corpus_stats(), fresh.get_corpus_stats())
+                self.assertEqual([c['id'] for c in updated.get_all_chunks()],
+                                 [c['id'] for c in fresh.get_all_chunks()])
+                for query in ("zeppelin", "authentication", "the", "architecture"):
+                    self.assertEqual([c['id'] for c in updated.retrieve(query)],
+                                     [c['id'] for c in fresh.retrieve(query)])
+            self.assertEqual([c['id'] for c in new_tasks.retrieve("zeppelin")], ["tasks_TASK-001", "tasks_TASK-NEW"])
+            self.assertNotIn(f"tasks_{removed_task['id']}", [c['id'] for c in new_tasks.retrieve("", assignee=removed_task.get("assignee"))])
+            self.assertEqual(len(new_tasks.retrieve("", project="Phoenix", assignee="alice")),
+                             len(TaskContextSource({"path": tasks_path}).retrieve("", project="Phoenix", assignee="alice")))
+            self.assertIsNone(new_tasks.reloaded())
+
+            # Repeated edits leave unlinked refs behind until they trigger a rebuild.
+            source = new_docs
+            for n in range(len(docs)):
+                docs[0] = dict(docs[0], chunks=[f"Zeppelin revision {n}.", "Second part."])
+                with open(docs_path, "w", encoding="utf-8") as f:
+                    json.dump(docs, f)
+                os.utime(docs_path, ns=(n + 2, n + 2))
+                source = source.reloaded()
+                dead_refs = source._chunk_docs.count(-1)
+                self.assertLessEqual(dead_refs, source.RELOAD_REBUILD_FRACTION * len(source._chunk_docs))
+                fresh = DocumentContextSource({"path": docs_path})
+                self.assertEqual([c['id'] for c in source.retrieve("zeppelin")], [c['id'] for c in fresh.retrieve("zeppelin")])
+            self.assertEqual([c['content'] for c in source.get_all_chunks()], [c['content'] for c in fresh.get_all_chunks()])
+
+            # Reordered records are rebuilt in the new order.
+            docs.reverse()
+            with open(docs_path, "w", encoding="utf-8") as f:
+                json.dump(docs, f)
+            os.utime(docs_path, ns=(1000, 1000))
+            source = source.reloaded()
+            self.assertEqual([c['id'] for c in source.get_all_chunks()],
+                             [c['id'] for c in DocumentContextSource({"path": docs_path}).get_all_chunks()])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_tag_mask_pushdown(self):
+        """Test that sources skip chunks a role's tag filter rejects before building them."""
+        role_handler = RoleHandler({"roles": {
+            "guest": {"permissions": {"filter_by_tags": ["public"]}},
+            "engineer": {"permissions": {"filter_by_tags": ["technical", "backend"]}},
+            "admin": {"permissions": {}},
+        }})
+        self.assertIsNone(role_handler.get_tag_mask("admin"))
+        with self.assertRaises(ValueError):
+            role_handler.get_tag_mask("unknown")
+
+        sources = [TaskContextSource(self.tasks_config), DocumentContextSource(self.docs_config),
+                   GraphitiContextSource(self.graph_config)]
+        for role in ("guest", "engineer", "admin"):
+            tag_mask = role_handler.get_tag_mask(role)
+            for source in sources:
+                for query in ("QuantumLeap", "service", "architecture", "nonexistentqueryxyz"):
+                    expected = role_handler.filter_context_by_role(source.retrieve(query), role)
+                    with mock.patch.object(type(source), "_make_chunk", wraps=source._make_chunk) as make_chunk:
+                        pushed_down = source.retrieve(query, tag_mask=tag_mask)
+                    self.assertEqual(pushed_down, expected)
+                    self.assertEqual(make_chunk.call_count, len(expected))
+
+    def test_chunks_are_compact_and_dict_compatible(self):
+        """Test that sources return slotted chunks that behave like the old dicts."""
+        source = TaskContextSource(self.tasks_config)
+        first, second = source.get_all_chunks()[:2]
+        self.assertIsInstance(first, Chunk)
+        self.assertFalse(hasattr(first, '__dict__'))
+
+        # Source, type and tag values are shared between chunks.
+        self.assertIs(first['source'], second['source'])
+        self.assertIs(first['metadata']['type'], second['metadata']['type'])
+        self.assertIsInstance(first['metadata']['tags'], tuple)
+
+        as_dict = first.to_dict()
+        self.assertEqual(first, as_dict)
+        self.assertEqual(json.loads(json.dumps(as_dict)), as_dict)
+        self.assertEqual(dict(first, metadata={})['id'], first['id'])
+        self.assertIsNone(first.get('missing'))
+        self.assertEqual(first['metadata'].get('relevance_score', 0), 0)
+        first['metadata']['relevance_score'] = 2.5
+        self.assertEqual(first.get('metadata', {}).get('relevance_score'), 2.5)
+
+        # The metadata keys the sources set all live in slots.
+        for source in (source, DocumentContextSource(self.docs_config), GraphitiContextSource(self.graph_config)):
+            for chunk in source.get_all_chunks():
+                self.assertIsNone(chunk['metadata']._extra)
+
+        # The shared tag table is bounded; tag sets beyond it are not shared.
+        with mock.patch.object(chunk_module, "_TAG_TUPLES_MAX", len(chunk_module._TAG_TUPLES)):
+            self.assertEqual(chunk_module.intern_tags(["unshared-tag"]), ("unshared-tag",))
+            self.assertNotIn(("unshared-tag",), chunk_module._TAG_TUPLES)
+
     def test_document_retrieval(self):
         """Test that the Document source retrieves relevant doc chunks."""
         source = DocumentContextSource(self.docs_config)
@@ -36,6 +303,78 @@ class TestDataSources(unittest.TestCase):
         self.assertEqual(len(results), 1)
         self.assertIn("QuantumLeap Architecture", results[0]['content'])
 
+    def test_document_index_matches_title_terms(self):
+        """Test that the inverted index covers both title and chunk terms."""
+        source = DocumentContextSource(self.docs_config)
+        self.assertIn("architecture", source._index)
+        results = source.retrieve("QuantumLeap")
+        self.assertEqual(len(results), 1)
+        self.assertNotIn("note", results[0]['metadata'])
+
+    def test_corpus_stats_match_scored_content(self):
+        """Test that each source's BM25 statistics are taken over the content its chunks are scored on."""
+        for source in (TaskContextSource(self.tasks_config), DocumentContextSource(self.docs_config),
+                       GraphitiContextSource(self.graph_config)):
+            token_lists = [chunk['content'].lower().split() for chunk in source.get_all_chunks()]
+            doc_freqs = {}
+            for tokens in token_lists:
+                for term in set(tokens):
+                    doc_freqs[term] = doc_freqs.get(term, 0) + 1
+            self.assertEqual(source.get_corpus_stats(), {
+                "num_chunks": len(token_lists),
+                "total_length": sum(map(len, token_lists)),
+                "doc_freqs": doc_freqs,
+            })
+
+    def test_document_fallback_preview(self):
+        """Test that unmatched queries return a preview of loaded chunks."""
+        source = DocumentContextSource(self.docs_config)
+        results = source.retrieve("nonexistentqueryxyz")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0]['metadata']['note'], "fallback_preview")
+
+    def test_graph_substring_matching(self):
+        """Test that query terms match as substrings of either endpoint name."""
+        source = GraphitiContextSource(self.graph_config)
+        results = source.retrieve("Auth")
+        self.assertEqual([r['id'] for r in results], ["graphiti_GRAPH-001", "graphiti_GRAPH-002"])
+
+        results = source.retrieve("which gateway routes")
+        self.assertEqual([r['id'] for r in results], ["graphiti_GRAPH-002"])
+
+    def test_semantic_search_persisted_index(self):
+        """Test embedding retrieval with a memory-mapped index in flat and IVF modes, and reload."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            docs_path = os.path.join(tmp_dir, "docs.json")
+            with open(docs_path, "w", encoding="utf-8") as f:
+                json.dump([
+                    {"id": "D1", "title": "Deployment", "chunks": ["Deploy the service to kubernetes with helm charts."], "tags": ["public"]},
+                    {"id": "D2", "title": "Cooking", "chunks": ["A recipe for tomato soup with basil and garlic."], "tags": ["public"]},
+                    {"id": "D3", "title": "Security", "chunks": ["Rotate JWT signing keys and audit OAuth2 scopes."], "tags": ["public"]},
+                ], f)
+            config = {"path": docs_path, "index_path": os.path.join(tmp_dir, "index", "docs.npy"), "top_k": 1}
+
+            source = SemanticSearchSource(config)
+            results = source.retrieve("tomato soup recipe")
+            self.assertEqual([r['id'] for r in results], ["semantic_search_D2_chunk0"])
+
+            reloaded = SemanticSearchSource(dict(config, index_type="ivf", nlist=2, nprobe=2))
+            self.assertIsInstance(reloaded.index.vectors, np.memmap)
+            self.assertEqual(reloaded.index.index_type, "ivf")
+            self.assertEqual([r['id'] for r in reloaded.retrieve("rotate jwt keys")], ["semantic_search_D3_chunk0"])
+
+            # A changed documents file rebuilds a copy; the loaded source keeps its mapped index.
+            self.assertIsNone(source.reloaded())
+            with open(docs_path, "w", encoding="utf-8") as f:
+                json.dump([{"id": "D4", "title": "Gardening", "chunks": ["Prune tomato plants and water the basil."], "tags": ["public"]}], f)
+            updated = source.reloaded()
+            self.assertEqual([r['id'] for r in updated.retrieve("tomato soup recipe")], ["semantic_search_D4_chunk0"])
+            self.assertEqual([r['id'] for r in source.retrieve("tomato soup recipe")], ["semantic_search_D2_chunk0"])
+            self.assertIsNone(updated.reloaded())
+        finally:
+            shutil.rmtree(tmp_dir)
+
     def test_no_results(self):
         """Test that sources return empty lists for irrelevant queries."""
         task_source = TaskContextSource(self.tasks_config)
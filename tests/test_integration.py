@@ -1,9 +1,26 @@
 ﻿import unittest
+import asyncio
+import json
 import os
+import shutil
+import socket
 import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from benchmarks.corpus import build_corpus
+from benchmarks.run import compare, run_benchmarks
 from src.main_context import ContextEngineer
+from src.services.context_server import ContextServer, request_server
+from src.services.conversation_memory import ConversationMemory
+from src.services.openai_service import OpenAIService
+from src.services.semantic_cache import SemanticAnswerCache, context_fingerprint
 
 class TestIntegration(unittest.TestCase):
 
@@ -57,6 +74,318 @@ class TestIntegration(unittest.TestCase):
         final_context = self.engineer.build_context(query, user_role="ceo")
         self.assertIn("Invalid user role", final_context)
 
+    def test_async_build_matches_sync(self):
+        """Test that abuild_context returns the same context as build_context."""
+        query = "What's the plan for the Phoenix project?"
+
+        async def build_concurrently():
+            return await asyncio.gather(
+                self.engineer.abuild_context(query, user_role="product_manager"),
+                self.engineer.abuild_context(query, user_role="ceo"),
+            )
+
+        pm_context, invalid_context = asyncio.run(build_concurrently())
+        self.assertEqual(pm_context, self.engineer.build_context(query, user_role="product_manager"))
+        self.assertIn("Invalid user role", invalid_context)
+
+    def test_stream_matches_build_context(self):
+        """Test that the streamed chunks join to the same context as build_context."""
+        query = "What's the plan for the Phoenix project?"
+        streamed = list(self.engineer.build_context_stream(query, user_role="product_manager"))
+        self.assertGreater(len(streamed), 0)
+        self.assertEqual("".join(item['text'] for item in streamed),
+                         self.engineer.build_context(query, user_role="product_manager"))
+        self.assertEqual(streamed[-1]['total_tokens'], sum(item['tokens'] for item in streamed))
+
+        with self.assertRaises(ValueError):
+            next(self.engineer.build_context_stream(query, user_role="ceo"))
+
+        packing = self.engineer.budget_manager.packing
+        self.engineer.budget_manager.packing = "dp"
+        try:
+            with self.assertRaises(ValueError):
+                next(self.engineer.build_context_stream(query, user_role="product_manager"))
+        finally:
+            self.engineer.budget_manager.packing = packing
+
+    def test_batch_matches_single_queries(self):
+        """Test that build_context_batch returns what build_context returns for each pair."""
+        pairs = [
+            ("What is the architecture of QuantumLeap?", "engineer"),
+            ("product roadmap", "product_manager"),
+            ("What is the architecture of QuantumLeap?", "engineer"),
+            ("database schema backend", "guest"),
+            ("anything", "invalid_role"),
+            ("", "engineer"),
+        ]
+        engineer = ContextEngineer(config_path="config/context_config.yaml", roles_path="config/user_roles.yaml")
+        engineer.cache_enabled = False
+        expected = [engineer.build_context(query, user_role=role) for query, role in pairs]
+        self.assertEqual(engineer.build_context_batch(pairs, batch_size=2), expected)
+
+        for method in ("bm25", "cosine"):
+            engineer.ranker.method = method
+            expected = [engineer.build_context(query, user_role=role) for query, role in pairs]
+            self.assertEqual(engineer.build_context_batch(pairs), expected)
+
+    def test_server_mode(self):
+        """Test that a warm server answers concurrent requests over a Unix socket."""
+        tmp_dir = tempfile.mkdtemp()
+        server = ContextServer(self.engineer)
+        address = "unix:" + os.path.join(tmp_dir, "contextcore.sock")
+        httpd = server.create_server(address)
+        thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+        thread.start()
+        try:
+            self.assertEqual(request_server(address, "GET", "/health")["status"], "ok")
+
+            query = "What is the architecture of QuantumLeap?"
+            expected = self.engineer.build_context(query, user_role="engineer")
+            with ThreadPoolExecutor(max_workers=8) as pool:
+                responses = list(pool.map(
+                    lambda _: request_server(address, "POST", "/context", {"role": "engineer", "query": query}),
+                    range(16)
+                ))
+            self.assertTrue(all(r["context"] == expected for r in responses))
+
+            self.assertIn("error", request_server(address, "POST", "/context", {"role": "engineer"}))
+            self.assertEqual(request_server(address, "GET", "/health?verbose=1")["status"], "ok")
+            for doc_chunks in ("many", -1, 2.5, None):
+                response = request_server(address, "POST", "/query", {"role": "engineer", "query": query, "doc_chunks": doc_chunks})
+                self.assertIn("doc_chunks", response["error"])
+            stats = request_server(address, "GET", "/stats")
+            self.assertEqual(stats["endpoints"]["/context"]["requests"], 17)
+            self.assertEqual(stats["endpoints"]["/context"]["errors"], 1)
+            self.assertEqual(stats["endpoints"]["/query"]["errors"], 4)
+
+            # The socket of a running server is not replaced.
+            with self.assertRaises(OSError):
+                ContextServer(self.engineer).create_server(address)
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            shutil.rmtree(tmp_dir)
+
+    def test_server_socket_path_checks(self):
+        """Test that only a stale socket is removed before binding a Unix socket path."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, "contextcore.sock")
+            with open(path, "w") as f:
+                f.write("not a socket")
+            with self.assertRaises(FileExistsError):
+                ContextServer(self.engineer).create_server("unix:" + path)
+            self.assertTrue(os.path.isfile(path))
+
+            os.remove(path)
+            stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            stale.bind(path)
+            stale.close()
+            httpd = ContextServer(self.engineer).create_server("unix:" + path)
+            httpd.server_close()
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_result_cache_hit(self):
+        """Test that a repeated query for the same role is served from the result cache."""
+        self.engineer.result_cache.clear()
+        first = self.engineer.build_context("What is the architecture of QuantumLeap?", user_role="engineer")
+        second = self.engineer.build_context("  what is the  ARCHITECTURE of QuantumLeap? ", user_role="engineer")
+        self.assertEqual(first, second)
+        stats = self.engineer.result_cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_result_cache_invalidated_by_data_change(self):
+        """Test that changing a backing data file invalidates cached contexts."""
+        tmp_dir = tempfile.mkdtemp()
+        docs_path = os.path.join(tmp_dir, "docs.json")
+        shutil.copy("data/mock/mock_documents.json", docs_path)
+        os.environ["CONTEXTCORE_DOCS_PATH"] = docs_path
+        try:
+            engineer = ContextEngineer("config/context_config.yaml", "config/user_roles.yaml")
+            engineer.build_context("Phoenix roadmap", user_role="product_manager")
+            with open(docs_path, "a", encoding="utf-8") as f:
+                f.write("\n")
+            engineer.build_context("Phoenix roadmap", user_role="product_manager")
+            self.assertEqual(engineer.result_cache.stats()['hits'], 0)
+        finally:
+            del os.environ["CONTEXTCORE_DOCS_PATH"]
+            shutil.rmtree(tmp_dir)
+
+    def test_conversation_memory_append_only(self):
+        """Test the JSONL memory: per-role/user history, write-behind, compaction and reload."""
+        tmp_dir = tempfile.mkdtemp()
+        legacy_path = os.path.join(tmp_dir, "memory.json")
+        with open(legacy_path, "w", encoding="utf-8") as f:
+            json.dump([{"role": "guest", "query": "old", "response": "answer"}], f)
+        memory_path = os.path.join(tmp_dir, "memory.jsonl")
+        try:
+            memory = ConversationMemory(memory_path, max_history=3, write_behind=True, flush_interval=60, compact_after=20)
+            self.assertEqual(memory.get_recent_history(role="guest")[0]["query"], "old")
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda i: memory.add_interaction(
+                    "engineer" if i % 2 else "guest", f"q{i}", f"r{i}", user=f"user{i % 3}"), range(40)))
+            memory.close()
+
+            self.assertEqual(len(memory.get_recent_history()), 3)
+            self.assertEqual(len(memory.get_recent_history(role="engineer")), 3)
+            self.assertTrue(all(item["user"] == "user1" for item in memory.get_recent_history(user="user1")))
+            self.assertTrue(all(item["role"] == "guest" for item in memory.get_recent_history(role="guest", user="user1")))
+            with open(memory_path, encoding="utf-8") as f:
+                self.assertLessEqual(len(f.readlines()), 20)
+
+            reloaded = ConversationMemory(memory_path, max_history=3)
+            for role, user in ((None, None), ("engineer", None), ("guest", None), (None, "user2"), ("guest", "user0")):
+                self.assertEqual(reloaded.get_recent_history(role=role, user=user),
+                                 memory.get_recent_history(role=role, user=user))
+
+            # A failed write keeps the batch queued for the next flush.
+            missing_dir = os.path.join(tmp_dir, "later")
+            unwritten = ConversationMemory(os.path.join(missing_dir, "memory.jsonl"), write_behind=True, flush_interval=60)
+            unwritten.add_interaction("guest", "kept", "answer")
+            with self.assertRaises(OSError):
+                unwritten.flush()
+            os.makedirs(missing_dir)
+            unwritten.close()
+            self.assertEqual(ConversationMemory(os.path.join(missing_dir, "memory.jsonl")).get_recent_history()[0]["query"], "kept")
+
+            # Records that are not interaction objects are skipped like unreadable lines.
+            odd_path = os.path.join(tmp_dir, "odd.jsonl")
+            with open(odd_path, "w", encoding="utf-8") as f:
+                f.write('[]\n"x"\n1\n{"role": "guest", "query": "kept", "response": "answer"}\n')
+            self.assertEqual([item["query"] for item in ConversationMemory(odd_path).get_recent_history()], ["kept"])
+            odd_path = os.path.join(tmp_dir, "odd.json")
+            with open(odd_path, "w", encoding="utf-8") as f:
+                json.dump([[], "x", {"role": "guest", "query": "kept", "response": "answer"}], f)
+            self.assertEqual([item["query"] for item in ConversationMemory(odd_path).get_recent_history()], ["kept"])
+            with open(odd_path, "w", encoding="utf-8") as f:
+                json.dump({"role": "guest"}, f)
+            self.assertEqual(ConversationMemory(odd_path).get_recent_history(), [])
+        finally:
+            shutil.rmtree(tmp_dir)
+
+    def test_openai_service_cache_and_pooled_client(self):
+        """Test OpenAIService against a local stand-in: one reused connection, cached repeat answers."""
+        requests_seen, connections = [], set()
+
+        class StandIn(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                requests_seen.append(payload)
+                connections.add(self.client_address)
+                body = json.dumps({
+                    "id": "chatcmpl-1", "object": "chat.completion", "created": 0, "model": payload["model"],
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": f" answer {len(requests_seen)} "}}],
+                }).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(("127.0.0.1", 0), StandIn)
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        tmp_dir = tempfile.mkdtemp()
+        options = dict(api_key="test", base_url=f"http://127.0.0.1:{httpd.server_address[1]}/v1",
+                       cache_path=os.path.join(tmp_dir, "responses.jsonl"))
+        try:
+            service = OpenAIService(**options)
+            self.assertEqual(service.semantic_search("What is QuantumLeap?", context="ctx"), "answer 1")
+            self.assertEqual(service.semantic_search("What is QuantumLeap?", context="ctx"), "answer 1")
+            self.assertEqual(service.semantic_search("What is QuantumLeap?", context="ctx", temperature=0.7), "answer 2")
+            self.assertEqual(len(requests_seen), 2)
+            self.assertEqual(len(connections), 1)
+            service.close()
+
+            restarted = OpenAIService(**options)
+            self.assertEqual(restarted.semantic_search("What is QuantumLeap?", context="ctx"), "answer 1")
+            self.assertEqual(len(requests_seen), 2)
+            self.assertEqual(restarted.response_cache.stats()["hits"], 1)
+            restarted.close()
+
+            # The same request to another endpoint is not answered from the cache.
+            moved = OpenAIService(**dict(options, base_url=options["base_url"] + "/"))
+            moved.semantic_search("What is QuantumLeap?", context="ctx")
+            self.assertEqual(len(requests_seen), 3)
+            moved.close()
+
+            # Nor is a similar query from the same role, when the semantic cache is shared.
+            shared = SemanticAnswerCache(embedder_options={"dim": 256, "ngram_max": 1})
+            first = OpenAIService(**dict(options, cache_path=None, semantic_cache=shared))
+            second = OpenAIService(**dict(options, cache_path=None, base_url=options["base_url"] + "/", semantic_cache=shared))
+            answer = first.semantic_search("What is QuantumLeap?", context="ctx", role="engineer")
+            self.assertEqual(first.semantic_search("what is QuantumLeap", context="ctx", role="engineer"), answer)
+            self.assertEqual(len(requests_seen), 4)
+            self.assertNotEqual(second.semantic_search("what is QuantumLeap", context="ctx", role="engineer"), answer)
+            self.assertEqual(len(requests_seen), 5)
+            first.close()
+            second.close()
+        finally:
+            httpd.shutdown()
+            httpd.server_close()
+            shutil.rmtree(tmp_dir)
+
+    def test_semantic_answer_cache(self):
+        """Test near-match hits per role, context fingerprint checks, LRU eviction and hit rate."""
+        cache = SemanticAnswerCache(threshold=0.9, max_entries_per_role=2, embedder_options={"dim": 256, "ngram_max": 1})
+        context = context_fingerprint("QuantumLeap is on track.")
+        cache.put("engineer", cache.embed("What is the status of QuantumLeap?"), context, "On track.")
+
+        paraphrase = cache.embed("what is the QuantumLeap status?")
+        self.assertEqual(cache.get("engineer", paraphrase, context), "On track.")
+        self.assertIsNone(cache.get("guest", paraphrase, context))
+        self.assertIsNone(cache.get("engineer", paraphrase, context_fingerprint("QuantumLeap slipped.")))
+        self.assertIsNone(cache.get("engineer", cache.embed("Who owns the Phoenix roadmap?"), context))
+
+        cache.put("engineer", cache.embed("Who owns the Phoenix roadmap?"), context, "Dana.")
+        cache.get("engineer", paraphrase, context) # Keeps the status answer most recently used
+        cache.put("engineer", cache.embed("Which database does Phoenix use?"), context, "Postgres.")
+        self.assertIsNone(cache.get("engineer", cache.embed("Who owns the Phoenix roadmap?"), context))
+        self.assertEqual(cache.get("engineer", paraphrase, context), "On track.")
+
+        # A role with nothing cached is a miss without embedding the query.
+        with mock.patch.object(cache, "embed", wraps=cache.embed) as embed:
+            self.assertEqual(cache.lookup("guest", "what is the QuantumLeap status?", context), (None, None))
+            embed.assert_not_called()
+            answer, vector = cache.lookup("engineer", "what is the QuantumLeap status?", context)
+            embed.assert_called_once()
+        self.assertEqual(answer, "On track.")
+        self.assertTrue(np.array_equal(vector, paraphrase))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"], stats["size"]), (4, 5, 1, 2))
+        self.assertAlmostEqual(stats["hit_rate"], 4 / 9)
+
+    def test_benchmark_suite(self):
+        """Test the seeded corpus generator and a small benchmark run compared with itself and a faster baseline."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            paths = build_corpus(os.path.join(tmp_dir, "a"), 200, seed=7)
+            again = build_corpus(os.path.join(tmp_dir, "b"), 200, seed=7)
+            for kind in paths:
+                with open(paths[kind], encoding="utf-8") as f, open(again[kind], encoding="utf-8") as g:
+                    self.assertEqual(f.read(), g.read())
+
+            report = run_benchmarks([200], seed=7, num_queries=5, warmup=1, data_dir=os.path.join(tmp_dir, "a"), isolate=False)
+            result = report["results"][0]
+            self.assertEqual(result["records"], 200)
+            self.assertEqual(set(result["sources"]), {"tasks", "graphiti", "documents"})
+            self.assertLessEqual(result["stages"]["total"]["p50_ms"], result["stages"]["total"]["p99_ms"])
+            json.dumps(report)
+
+            self.assertEqual(compare(report, report), [])
+            faster = json.loads(json.dumps(report))
+            faster["results"][0]["stages"]["total"] = {name: value / 10 - 5 for name, value in result["stages"]["total"].items()}
+            self.assertTrue(any("total" in regression for regression in compare(report, faster, min_delta_ms=0)))
+        finally:
+            shutil.rmtree(tmp_dir)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
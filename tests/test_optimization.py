@@ -1,11 +1,22 @@
 ﻿import unittest
+import functools
+import json
 import os
+import shutil
 import sys
+import tempfile
+
+import numpy as np
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 from src.optimization.ranking import Ranker
 from src.optimization.deduplication import Deduplicator
 from src.optimization.token_budget import TokenBudgetManager
+from src.optimization.tfidf import TfidfIndex
+from src.data_sources.chunk import Chunk
+from src.data_sources.documents import DocumentContextSource
+from src.data_sources.graphiti import GraphitiContextSource
+from src.data_sources.tasks import TaskContextSource
 
 class TestOptimization(unittest.TestCase):
 
@@ -31,6 +42,54 @@ class TestOptimization(unittest.TestCase):
         self.assertEqual(ranked[3]['content'], 'This is a completely different sentence.')
         self.assertEqual(ranked[3]['metadata']['relevance_score'], 0)
 
+    def test_bm25_ranking(self):
+        """Test that BM25 prefers chunks matching rarer query terms."""
+        corpus_stats = {
+            "num_chunks": 100,
+            "total_length": 800,
+            "doc_freqs": {"brown": 50, "lazy": 2},
+        }
+        ranker = Ranker(method="bm25", corpus_stats=corpus_stats)
+        ranked = ranker.rank("lazy brown", self.sample_chunks)
+
+        contents = [c['content'] for c in ranked]
+        self.assertEqual(contents, [
+            'The quick brown fox jumps over the lazy dog.',
+            'A lazy dog is no match for a quick fox.',
+            'The fox is brown and very quick.',
+            'This is a completely different sentence.',
+        ])
+        self.assertEqual(ranked[-1]['metadata']['relevance_score'], 0.0)
+
+    def test_tfidf_ranking(self):
+        """Test cosine and dot ranking over a corpus-wide TF-IDF index."""
+        chunks = [dict(chunk, id=str(i)) for i, chunk in enumerate(self.sample_chunks)]
+        index = TfidfIndex(chunks)
+
+        for method in ("cosine", "dot"):
+            ranked = Ranker(method=method, tfidf_index=index).rank("completely different", [dict(c, metadata={}) for c in chunks])
+            self.assertEqual(ranked[0]['content'], 'This is a completely different sentence.')
+        self.assertAlmostEqual(ranked[-1]['metadata']['relevance_score'], 0.0)
+
+        # A batch of queries is one product and agrees with single-query scoring.
+        queries = ["quick brown fox", "lazy dog", "sentence"]
+        batch = index.score_batch(queries, chunks)
+        self.assertEqual(batch.shape, (3, 4))
+        for row, query in zip(batch, queries):
+            self.assertTrue(np.allclose(row, index.score(query, chunks)))
+
+        # Chunks missing from the index are vectorized on the fly.
+        unseen = {'id': 'new', 'content': 'quick brown fox', 'metadata': {}}
+        scores = index.score("quick brown fox", [unseen] + chunks)
+        self.assertAlmostEqual(float(scores[0]), 1.0, places=5)
+
+        # Missing or duplicate ids do not map to another chunk's row.
+        clashing = [dict(chunk, id=None if i % 2 else "dup") for i, chunk in enumerate(self.sample_chunks)]
+        index = TfidfIndex(clashing)
+        self.assertEqual(index.row_of, {})
+        scores = index.score("completely different", clashing)
+        self.assertEqual(int(np.argmax(scores)), 2)
+        self.assertEqual(np.count_nonzero(scores), 1)
 
     def test_deduplication(self):
         """Test the Jaccard similarity-based deduplicator."""
@@ -44,6 +103,19 @@ class TestOptimization(unittest.TestCase):
         self.assertIn('The quick brown fox jumps over the lazy dog.', contents)
         self.assertNotIn('A lazy dog is no match for a quick fox.', contents)
 
+    def test_lsh_deduplication(self):
+        """Test the MinHash/LSH deduplicator keeps the first of each near-duplicate group."""
+        deduplicator = Deduplicator(threshold=0.8, method="lsh")
+        chunks = [
+            {'source': 'docs', 'content': 'alpha beta gamma delta epsilon zeta eta theta iota kappa', 'metadata': {}},
+            {'source': 'tasks', 'content': 'alpha beta gamma delta epsilon zeta eta theta iota kappa', 'metadata': {}},
+            {'source': 'graph', 'content': 'Alpha beta gamma delta epsilon zeta eta theta iota kappa lambda', 'metadata': {}},
+            {'source': 'docs', 'content': 'This is a completely different sentence.', 'metadata': {}},
+        ]
+        deduplicated = deduplicator.deduplicate(chunks)
+        self.assertEqual([c['source'] for c in deduplicated], ['docs', 'docs'])
+        self.assertIs(deduplicated[0], chunks[0])
+
     def test_token_budget(self):
         """Test the token budget manager."""
         # Use a very small budget to test truncation
@@ -59,5 +131,117 @@ class TestOptimization(unittest.TestCase):
         final_token_count = budget_manager.tokenizer.count_tokens(final_context)
         self.assertLessEqual(final_token_count, 15)
 
+    def test_token_budget_packing(self):
+        """Test that packing modes skip an oversized early chunk to fit more relevance."""
+        chunks = [
+            {'source': 'docs', 'content': ' '.join(['filler'] * 80), 'metadata': {'relevance_score': 3}},
+            {'source': 'tasks', 'content': 'quick fox', 'metadata': {'relevance_score': 2}},
+            {'source': 'graph', 'content': 'lazy dog', 'metadata': {'relevance_score': 2}},
+        ]
+        # Room for both short entries plus a truncated filler, but not the whole filler.
+        budget_manager = TokenBudgetManager(max_tokens=0, tokenizer_model="cl100k_base")
+        count = budget_manager.tokenizer.count_tokens
+        short = sum(count(budget_manager._format_entry(c)) for c in chunks[1:])
+        overhead = count(budget_manager._format_entry(chunks[0], content=""))
+        max_tokens = short + overhead + budget_manager.min_truncate_tokens + 4
+        self.assertLess(max_tokens, count(budget_manager._format_entry(chunks[0])))
+
+        for packing in ("greedy", "dp"):
+            budget_manager = TokenBudgetManager(max_tokens=max_tokens, tokenizer_model="cl100k_base", packing=packing)
+            final_context = budget_manager.construct_context(chunks)
+            self.assertNotIn("filler", final_context)
+            self.assertLess(final_context.index("quick fox"), final_context.index("lazy dog"))
+
+        # A coarse dp table still packs within the real budget.
+        budget_manager = TokenBudgetManager(max_tokens=max_tokens, tokenizer_model="cl100k_base", packing="dp")
+        budget_manager.DP_MAX_CELLS = 8
+        final_context = budget_manager.construct_context(chunks)
+        self.assertLessEqual(count(final_context), max_tokens)
+
+        budget_manager = TokenBudgetManager(max_tokens=max_tokens, tokenizer_model="cl100k_base", truncate_last=True)
+        final_context = budget_manager.construct_context(chunks)
+        self.assertIn("filler", final_context)
+        self.assertLessEqual(count(final_context), max_tokens)
+
+    def test_token_count_cache_and_batch(self):
+        """Test that token counts are cached and batch counting matches single counting."""
+        budget_manager = TokenBudgetManager(max_tokens=15, tokenizer_model="cl100k_base")
+        tokenizer = budget_manager.tokenizer
+        texts = [c['content'] for c in self.sample_chunks]
+
+        single = [tokenizer.count_tokens(t) for t in texts]
+        self.assertEqual(tokenizer.cache_info()['misses'], 4)
+
+        tokenizer.clear_cache()
+        self.assertEqual(tokenizer.count_tokens_batch(texts + texts[:1]), single + single[:1])
+        self.assertEqual(tokenizer.count_tokens(texts[0]), single[0])
+        info = tokenizer.cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['size']), (1, 4, 4))
+
+    def test_lazy_content_and_entry_costs(self):
+        """Test that chunk content is rendered on demand and known entry costs skip rendering."""
+        rendered = []
+
+        def make_chunks():
+            def render(text):
+                rendered.append(text)
+                return text
+            return [
+                Chunk("docs", f"docs_{i}", metadata={}, render=functools.partial(render, c['content']), cost_key=("v1", i))
+                for i, c in enumerate(self.sample_chunks)
+            ]
+
+        chunks = make_chunks()
+        self.assertFalse(chunks[0].is_rendered)
+        self.assertEqual(chunks[0]['content'], self.sample_chunks[0]['content'])
+        self.assertTrue(chunks[0].is_rendered)
+
+        budget_manager = TokenBudgetManager(max_tokens=0, tokenizer_model="cl100k_base")
+        # Room for the first entry only
+        budget_manager.max_tokens = budget_manager.tokenizer.count_tokens(budget_manager._format_entry(chunks[0])) + 1
+        expected = budget_manager.construct_context([dict(c.to_dict(), metadata={}) for c in chunks])
+        self.assertIn(self.sample_chunks[0]['content'], expected)
+        rendered.clear()
+        self.assertEqual(budget_manager.construct_context(chunks), expected)
+        # Fresh chunks with known costs: only the admitted one is rendered.
+        rendered.clear()
+        self.assertEqual(budget_manager.construct_context(make_chunks()), expected)
+        self.assertEqual(rendered, [self.sample_chunks[0]['content']])
+
+        chunks[0]['content'] = "Replaced content."
+        self.assertIsNone(chunks[0].cost_key)
+
+    def test_entry_costs_with_missing_and_duplicate_ids(self):
+        """Test that cached entry costs stay per record when ids are missing or repeated."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            records = {
+                "tasks": [{"title": "Short"}, {"title": "A much longer task title " * 5},
+                          {"id": "T-1", "title": "One"}, {"id": "T-1", "title": "Two words " * 7}],
+                "documents": [{"title": "Doc", "chunks": ["Tiny.", "A far longer chunk of text " * 6]},
+                              {"title": "Doc", "chunks": ["Other " * 9]}],
+                "graphiti": [{"source": {"name": "a"}, "target": {"name": "b"}, "relationship": "uses"},
+                             {"source": {"name": "a much longer name " * 4}, "target": {"name": "b"}, "relationship": "uses"}],
+            }
+            sources = []
+            for name, source_class in (("tasks", TaskContextSource), ("documents", DocumentContextSource),
+                                       ("graphiti", GraphitiContextSource)):
+                path = os.path.join(tmp_dir, f"{name}.json")
+                with open(path, "w", encoding="utf-8") as f:
+                    json.dump(records[name], f)
+                sources.append(source_class({"path": path}))
+
+            budget_manager = TokenBudgetManager(max_tokens=0, tokenizer_model="cl100k_base")
+            count = budget_manager.tokenizer.count_tokens
+            for source in sources:
+                chunks = source.get_all_chunks()
+                expected = [count(budget_manager._format_entry(chunk)) for chunk in chunks]
+                self.assertEqual(len(set(chunk.cost_key for chunk in chunks)), len(chunks))
+                self.assertEqual(budget_manager._entry_costs(chunks)[0], expected)
+                # Served from the cost cache on the second pass.
+                self.assertEqual(budget_manager._entry_costs(source.get_all_chunks()), (expected, {}))
+        finally:
+            shutil.rmtree(tmp_dir)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -1,10 +1,18 @@
 ﻿import unittest
+import asyncio
+import json
 import os
+import shutil
 import sys
+import tempfile
+import threading
+import time
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
+from src.data_sources.base import BaseContextSource
 from src.retrieval.context_retriever import ContextRetriever
-from src.utils.config_loader import load_config
+from src.utils.config_loader import load_config, load_user_roles
+from src.personalization.role_handler import RoleHandler
 
 class TestContextRetriever(unittest.TestCase):
 
@@ -39,6 +47,136 @@ class TestContextRetriever(unittest.TestCase):
         sources_found = {r['source'] for r in results}
         self.assertEqual(sources_found, {"tasks", "documents"})
 
+    def test_parallel_retrieval_with_deadline(self):
+        """Test that a slow or failing source does not block the others in parallel mode."""
+        config = dict(self.config, retrieval={"mode": "parallel", "source_timeout": 0.2})
+        retriever = ContextRetriever(config)
+
+        class SlowSource:
+            def retrieve(self, query, **kwargs):
+                time.sleep(1.0)
+                return [{"source": "slow", "id": "slow_1", "content": query, "metadata": {}}]
+
+        class BrokenSource:
+            def retrieve(self, query, **kwargs):
+                raise RuntimeError("backend unavailable")
+
+        retriever.sources["slow"] = SlowSource()
+        retriever.sources["broken"] = BrokenSource()
+        result = retriever.retrieve_with_status("QuantumLeap")
+        retriever.close()
+
+        statuses = result["sources"]
+        self.assertEqual(statuses["slow"]["status"], "timeout")
+        self.assertEqual(statuses["broken"]["status"], "error")
+        self.assertEqual(statuses["tasks"]["status"], "ok")
+        self.assertIn("elapsed_ms", statuses["documents"])
+        self.assertEqual({r['source'] for r in result["chunks"]}, {"tasks", "documents"})
+
+    def test_parallel_retrieval_with_hung_source(self):
+        """Test that a source stuck in a timed-out call is not queried again until it returns."""
+        config = dict(self.config, retrieval={"mode": "parallel", "source_timeout": 0.2})
+        retriever = ContextRetriever(config)
+        release = threading.Event()
+        calls = []
+
+        class HungSource:
+            def retrieve(self, query, **kwargs):
+                calls.append(query)
+                release.wait(5.0)
+                return []
+
+        retriever.sources["hung"] = HungSource()
+        try:
+            first = retriever.retrieve_with_status("QuantumLeap")
+            start = time.perf_counter()
+            second = retriever.retrieve_with_status("QuantumLeap")
+            self.assertLess(time.perf_counter() - start, 0.2)
+        finally:
+            release.set()
+            retriever.close()
+
+        self.assertEqual(first["sources"]["hung"]["status"], "timeout")
+        self.assertEqual(second["sources"]["hung"]["status"], "timeout")
+        self.assertIn("still running", second["sources"]["hung"]["error"])
+        self.assertEqual(calls, ["QuantumLeap"])
+        self.assertEqual(list(second["sources"]), list(retriever.sources))
+        self.assertEqual(second["sources"]["tasks"]["status"], "ok")
+        self.assertEqual({r['source'] for r in second["chunks"]}, {"tasks", "documents"})
+
+    def test_async_retrieval_with_hung_source(self):
+        """Test that async queries also skip a source whose timed-out call is still running."""
+        config = dict(self.config, retrieval={"source_timeout": 0.2})
+        retriever = ContextRetriever(config)
+        release = threading.Event()
+        calls = []
+
+        class HungSource(BaseContextSource):
+            def retrieve(self, query, **kwargs):
+                calls.append(query)
+                release.wait(5.0)
+                return []
+
+        retriever.sources["hung"] = HungSource({})
+        try:
+            first = asyncio.run(retriever.aretrieve_with_status("QuantumLeap"))
+            start = time.perf_counter()
+            second = asyncio.run(retriever.aretrieve_with_status("QuantumLeap"))
+            self.assertLess(time.perf_counter() - start, 0.2)
+        finally:
+            release.set()
+            retriever.close()
+
+        self.assertEqual(first["sources"]["hung"]["status"], "timeout")
+        self.assertIn("still running", second["sources"]["hung"]["error"])
+        self.assertEqual(calls, ["QuantumLeap"])
+        self.assertEqual(second["sources"]["tasks"]["status"], "ok")
+
+    def test_tag_mask_for_sources_without_pushdown(self):
+        """Test that the retriever applies the tag filter itself for sources that ignore it."""
+        retriever = ContextRetriever(self.config)
+
+        class PlainSource:
+            def retrieve(self, query, **kwargs):
+                return [
+                    {"source": "plain", "id": "plain_1", "content": query, "metadata": {"tags": ["public"]}},
+                    {"source": "plain", "id": "plain_2", "content": query, "metadata": {"tags": ["internal"]}},
+                    {"source": "plain", "id": "plain_3", "content": query, "metadata": {}},
+                ]
+
+        retriever.sources = {"plain": PlainSource()}
+        guest_mask = RoleHandler(load_user_roles("config/user_roles.yaml")).get_tag_mask("guest")
+        self.assertEqual([c['id'] for c in retriever.retrieve("QuantumLeap", tag_mask=guest_mask)], ["plain_1", "plain_3"])
+        self.assertEqual(len(retriever.retrieve("QuantumLeap")), 3)
+
+    def test_hot_reload(self):
+        """Test that the reload thread swaps in a source updated from its changed file."""
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            tasks_path = os.path.join(tmp_dir, "tasks.json")
+            shutil.copy(self.config["data_sources"]["tasks"]["path"], tasks_path)
+            config = dict(self.config, retrieval={"reload_interval": 0.05},
+                          data_sources={"tasks": {"path": tasks_path, "enabled": True}})
+            retriever = ContextRetriever(config)
+            reloaded = threading.Event()
+            retriever.add_reload_listener(lambda names: reloaded.set())
+            original = retriever.sources["tasks"]
+
+            with open(tasks_path, encoding="utf-8-sig") as f:
+                tasks = json.load(f)
+            tasks.append({"id": "TASK-900", "title": "Hot reload", "status": "To Do", "description": "Pick up exported changes."})
+            with open(tasks_path, "w", encoding="utf-8") as f:
+                json.dump(tasks, f)
+            os.utime(tasks_path, ns=(1, 1))
+
+            self.assertTrue(reloaded.wait(5.0))
+            retriever.close()
+            self.assertIsNot(retriever.sources["tasks"], original)
+            self.assertEqual([c['id'] for c in retriever.retrieve("exported")], ["tasks_TASK-900"])
+            self.assertEqual(original.retrieve("exported"), [])
+            self.assertEqual(retriever.get_corpus_stats()["num_chunks"], len(tasks))
+        finally:
+            shutil.rmtree(tmp_dir)
 
 if __name__ == '__main__':
     unittest.main()